@@ -0,0 +1,75 @@
+"""Compare the throughput of archives compressed by one or more threads.
+
+    $ PYTHONPATH=. python benchmarks/archive.py --size 256 --workers 1 2 4 8
+
+Archives are written to a null sink, so that only reading and compressing the
+tree are measured; the tree is half random bytes and half text.
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from src.services.archive import write_archive
+
+
+class Sink(io.RawIOBase):
+    def __init__(self):
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.size += len(b)
+        return len(b)
+
+
+def make_tree(root, size):
+    tree = os.path.join(root, "tree")
+    os.mkdir(tree)
+    text = "".join(f"line {i} of some log file\n" for i in range(40_000)).encode()
+    for i in range(size):
+        with open(os.path.join(tree, f"file{i:04}.bin"), "wb") as f:
+            f.write(os.urandom(512 * 1024) if i % 2 else text[: 1024 * 1024])
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="MiB of files")
+    parser.add_argument("--formats", nargs="+", default=["tar.gz", "tar.zst"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        tree = make_tree(root, args.size)
+        for format in args.formats:
+            for workers in args.workers:
+                timings = []
+                for _ in range(args.repeat):
+                    sink = Sink()
+                    start = time.perf_counter()
+                    try:
+                        write_archive(sink, [tree], format=format, workers=workers)
+                    except ValueError as ex:  # e.g. zstandard not installed
+                        print(f"{format:<8} skipped: {ex}")
+                        break
+                    timings.append(time.perf_counter() - start)
+                if not timings:
+                    break
+                best = min(timings)
+                print(
+                    f"{format:<8} x{workers:<3} {best * 1000:10.1f} ms"
+                    f" {args.size / best:8.1f} MiB/s  {sink.size / 2**20:8.1f} MiB"
+                )
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
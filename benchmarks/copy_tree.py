@@ -0,0 +1,74 @@
+"""Compare the parallel copy engine with shutil on small and large file trees.
+
+    $ PYTHONPATH=. python benchmarks/copy_tree.py --files 20000 --large 4 --size 256
+
+Copies are made within given directory, which defaults to a temporary one; the
+page cache is not dropped between runs, pass a directory on the storage to
+measure to get figures close to cold copies.
+"""
+import argparse
+import functools
+import os
+import shutil
+import tempfile
+import time
+
+from src.services.copy import copy_tree
+
+
+def make_trees(root, files, large, size):
+    small = os.path.join(root, "small")
+    for i in range(files):
+        subdir = os.path.join(small, f"dir{i // 1000:03}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"file{i:06}.txt"), "wb") as f:
+            f.write(os.urandom(4096))
+    big = os.path.join(root, "large")
+    os.mkdir(big)
+    chunk = os.urandom(1024 * 1024)
+    for i in range(large):
+        with open(os.path.join(big, f"file{i}.bin"), "wb") as f:
+            for _ in range(size):
+                f.write(chunk)
+    return {"small files": small, "large files": big}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--large", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256, help="MiB per large file")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(dir=args.dir)
+    try:
+        trees = make_trees(root, args.files, args.large, args.size)
+        copies = {"shutil": shutil.copytree}
+        for workers in args.workers:
+            copy = functools.partial(copy_tree, workers=workers)
+            copies[f"copy_tree x{workers}"] = copy
+
+        for tree, src in trees.items():
+            for name, fn in copies.items():
+                timings = []
+                for _ in range(args.repeat):
+                    dst = os.path.join(root, "dst")
+                    start = time.perf_counter()
+                    stats = fn(src, dst)
+                    timings.append(time.perf_counter() - start)
+                    shutil.rmtree(dst)
+                # files copied by strategy, e.g. reflinks or copy_file_range
+                strategies = getattr(stats, "strategies", "")
+                print(
+                    f"{tree:<12} {name:<16} {min(timings) * 1000:10.1f} ms"
+                    f"  {strategies}"
+                )
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
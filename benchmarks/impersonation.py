@@ -0,0 +1,75 @@
+"""Compare impersonation scopes on File Manager actions.
+
+Requests impersonate given user, so the script must run as root:
+
+    $ PYTHONPATH=. python benchmarks/impersonation.py --user nobody
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from flask import g
+
+from src.app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", default="nobody")
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--names", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    os.chmod(root, 0o777)
+    src, dst = os.path.join(root, "src"), os.path.join(root, "dst")
+    os.mkdir(src)
+    names = [f"file{i:05}.txt" for i in range(args.entries)]
+    for name in names:
+        with open(os.path.join(src, name), "w") as f:
+            f.write(name)
+    shutil.chown(src, user=args.user)
+
+    app = create_app("testing", configs={"LISTING_CACHE_SIZE": 0})
+
+    @app.before_request
+    def load_user():
+        g.username = args.user
+
+    client = app.test_client()
+    actions = {
+        "read": {"action": "read", "path": src, "showHiddenItems": False},
+        "details": {"action": "details", "path": src, "names": names[: args.names]},
+        "copy": {
+            "action": "copy",
+            "path": src,
+            "targetPath": dst,
+            "names": names[: args.names],
+        },
+    }
+
+    try:
+        for scope in ("call", "request", "user"):
+            app.config["IMPERSONATION_SCOPE"] = scope
+            for action, payload in actions.items():
+                timings = []
+                for _ in range(args.repeat):
+                    os.mkdir(dst)
+                    shutil.chown(dst, user=args.user)
+                    start = time.perf_counter()
+                    response = client.post("/file-manager/actions", json=payload)
+                    timings.append(time.perf_counter() - start)
+                    shutil.rmtree(dst)
+                    assert not response.json.get("error"), response.json
+                median = statistics.median(timings) * 1000
+                print(f"{scope:<8} {action:<8} {median:10.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare the compiled dump of stats responses with marshmallow's.
+
+    $ PYTHONPATH=. python benchmarks/serialization.py --entries 20000
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import timeit
+
+from src.schemas.serializers import filemgr as sl
+from src.services.filemgr import FileManagerSvc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        for i in range(args.entries):
+            with open(os.path.join(root, f"file{i:05}.txt"), "w"):
+                pass
+        entries = FileManagerSvc.scan(root)  # warm up directory caches
+        cwd = FileManagerSvc.stats(root)
+
+        def timed(fn):
+            return min(timeit.repeat(fn, number=1, repeat=args.repeat)) * 1000
+
+        schema = sl.StatsResponseSchema()
+        marshmallow = schema.dump({"cwd": cwd, "files": entries})
+        compiled = sl.dump_stats(cwd=cwd, files=entries)
+        assert json.dumps(marshmallow) == json.dumps(compiled)
+
+        print(f"{'scan':<24} {timed(lambda: FileManagerSvc.scan(root)):10.1f} ms")
+        dumps = {
+            "marshmallow dump": lambda: schema.dump({"cwd": cwd, "files": entries}),
+            "compiled dump": lambda: sl.dump_stats(cwd=cwd, files=entries),
+            "json encoding": lambda: json.dumps(compiled),
+        }
+        for name, fn in dumps.items():
+            print(f"{name:<24} {timed(fn):10.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
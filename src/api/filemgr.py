@@ -1,13 +1,28 @@
+import io
+import logging
 import os
+import shutil
 
-from flask import Blueprint, request, send_file
+from flask import Blueprint, current_app, request, send_file
 from flask_restful import Api, Resource
 from marshmallow import EXCLUDE, ValidationError
 
 from src import utils
+from src.api.auth import current_username
+from src.schemas import instance
 from src.schemas.deserializers import filemgr as dsl
 from src.schemas.serializers import filemgr as sl
+from src.services.archive import FORMATS
 from src.services.filemgr import FileManagerSvc
+from src.services.filesystem import (
+    stream_attachment,
+    stream_chunk,
+    stream_file,
+    stream_upload,
+)
+from src.services.thumbnails import thumbnail_key, thumbnail_size
+
+logger = logging.getLogger(__name__)
 
 blueprint = Blueprint("file_manager", __name__, url_prefix="/file-manager")
 api = Api(blueprint)
@@ -44,34 +59,51 @@ class FileManagerActions(Resource):
                             oneOf:
                                 - StatsResponseSchema
                                 - DetailsResponseSchema
+                                - JobResponseSchema
                                 - ErrorResponseSchema
         """
         payload = request.json
         svc = FileManagerSvc
         try:
             # throw error when invalid action
-            dsl.ReadActionSchema(only=("action",), unknown=EXCLUDE).load(payload)
+            instance(dsl.ReadActionSchema, only=("action",), unknown=EXCLUDE).load(
+                payload
+            )
             if payload["action"] == "read":
-                req = dsl.ReadActionSchema().load(payload)
-                files = svc.list(
+                req = instance(dsl.ReadActionSchema).load(payload)
+                files, cursor = svc.scan_page(
                     path=req["path"],
                     show_hidden=req["showHiddenItems"],
+                    sort_by=req.get("sortBy"),
+                    reverse=req.get("sortOrder") == "Descending",
+                    limit=req.get("limit"),
+                    cursor=req.get("cursor"),
+                    cache=current_app.extensions.get("listing_cache"),
+                    lazy=current_app.config["LAZY_HAS_CHILD"],
                 )
+                page = {"cursor": cursor} if cursor else {}
                 return sl.dump_stats(
-                    cwd=svc.stats(path=req["path"]),
-                    files=[svc.stats(file.as_posix()) for file in files],
+                    cwd=svc.stats(path=req["path"]), files=files, **page
                 )
             elif payload["action"] == "create":
-                req = dsl.CreateActionSchema().load(payload)
+                req = instance(dsl.CreateActionSchema).load(payload)
                 svc.mkdir(path=os.path.join(req["path"], req["name"]))
                 return sl.dump_stats(
                     files=[svc.stats(os.path.join(req["path"], req["name"]))],
                 )
             elif payload["action"] == "delete":
-                req = dsl.DeleteActionSchema().load(payload)
+                req = instance(dsl.DeleteActionSchema).load(payload)
+                volumes = current_app.config["TRASH_VOLUMES"]
+                if req.get("async_"):
+                    return submit_job(
+                        "delete",
+                        path=req["path"],
+                        names=req["names"],
+                        volumes=volumes,
+                    )
                 for name in req["names"]:
                     path = os.path.join(req["path"], name)
-                    svc.delete(path=path)
+                    svc.delete(path=path, volumes=volumes)
                 return sl.dump_stats(
                     files=[
                         {"path": os.path.join(payload["path"], name)}
@@ -79,7 +111,7 @@ class FileManagerActions(Resource):
                     ],
                 )
             elif payload["action"] == "rename":
-                req = dsl.RenameActionSchema().load(payload)
+                req = instance(dsl.RenameActionSchema).load(payload)
                 src = os.path.join(req["path"], req["name"])
                 dst = os.path.join(req["path"], req["newName"])
                 if svc.exists(dst):
@@ -94,22 +126,32 @@ class FileManagerActions(Resource):
                         files=[svc.stats(os.path.join(req["path"], req["newName"]))]
                     )
             elif payload["action"] == "search":
-                req = dsl.SearchActionSchema().load(payload)
-                files = svc.list(
+                req = instance(dsl.SearchActionSchema).load(payload)
+                limit = current_app.config["SEARCH_LIMIT"]
+                files = svc.search(
                     path=req["path"],
-                    substr=req["searchString"],
+                    pattern=req["searchString"],
+                    case_sensitive=req.get("caseSensitive", False),
                     show_hidden=req["showHiddenItems"],
+                    max_depth=req.get("maxDepth"),
+                    limit=min(req.get("limit", limit), limit),
+                    workers=current_app.config["SEARCH_WORKERS"],
+                    index=current_app.extensions.get("search_index"),
                 )
-                return sl.dump_stats(
-                    cwd=svc.stats(path=req["path"]),
-                    files=[svc.stats(file.as_posix()) for file in files],
-                )
+                return sl.dump_stats(cwd=svc.stats(path=req["path"]), files=files)
             elif payload["action"] == "details":
-                req = dsl.DetailsActionSchema().load(payload)
+                req = instance(dsl.DetailsActionSchema).load(payload)
+                outcomes = svc.batch(
+                    [
+                        {"op": "stat", "path": os.path.join(req["path"], name)}
+                        for name in req["names"]
+                    ],
+                    workers=current_app.config["BATCH_WORKERS"],
+                )
                 stats = []
-                for name in req["names"]:
-                    path = os.path.join(req["path"], name)
-                    file_stats = svc.stats(path=path)
+                for file_stats, error in outcomes:
+                    if error is not None:
+                        raise error
                     stats.append(file_stats)
 
                 if not stats:
@@ -135,17 +177,64 @@ class FileManagerActions(Resource):
                         multipleFiles=True,
                     )
             elif payload["action"] == "copy":
-                req = dsl.CopyActionSchema().load(payload)
+                req = instance(dsl.CopyActionSchema).load(payload)
+                if req.get("async_"):
+                    return submit_job(
+                        "copy",
+                        path=req["path"],
+                        names=req["names"],
+                        targetPath=req["targetPath"],
+                        workers=current_app.config["COPY_WORKERS"],
+                    )
                 files = []
+                failures = []
                 for name in req["names"]:
                     src = req["path"]
                     dst = req["targetPath"]
-                    path = svc.copy(src=os.path.join(src, name), dst=dst)
+                    try:
+                        path, strategies = svc.copy(
+                            src=os.path.join(src, name),
+                            dst=dst,
+                            workers=current_app.config["COPY_WORKERS"],
+                        )
+                    except shutil.Error as ex:  # other files were copied
+                        failures.extend(
+                            {"src": failed, "dst": target, "reason": reason}
+                            for failed, target, reason in ex.args[0]
+                        )
+                        continue
+                    logger.debug("copied %s to %s with %s", name, path, strategies)
                     stats = svc.stats(path)
                     files.append(stats)
+                if failures:
+                    return sl.dump_error(
+                        code=400,
+                        description="Copy Incomplete",
+                        failures=failures,
+                        files=files,
+                    )
                 return sl.dump_stats(files=files)
             elif payload["action"] == "move":
-                req = dsl.MoveActionSchema().load(payload)
+                req = instance(dsl.MoveActionSchema).load(payload)
+                if req.get("async_"):
+                    conflicts = [
+                        name
+                        for name in req["names"]
+                        if svc.exists(os.path.join(req["targetPath"], name))
+                        and name not in req["renameFiles"]
+                    ]
+                    if conflicts:  # nothing is moved until they are resolved
+                        return sl.dump_error(
+                            code=400,
+                            description="File Already Exists",
+                            fileExists=conflicts,
+                        )
+                    return submit_job(
+                        "move",
+                        path=req["path"],
+                        names=req["names"],
+                        targetPath=req["targetPath"],
+                    )
                 files = []
                 conflicts = []
                 for name in req["names"]:
@@ -174,7 +263,7 @@ class FileManagerActions(Resource):
             return sl.dump_error(code=403, description="Permission Denied")
         except FileNotFoundError:
             return sl.dump_error(code=404, description="File Not Found")
-        except (OSError, ValidationError):
+        except (OSError, ValueError, ValidationError):
             return sl.dump_error(code=400, description="Bad request")
 
 
@@ -182,7 +271,8 @@ class FileManagerActions(Resource):
 class FileManagerDownload(Resource):
     def post(self):
         """
-        Download files. Multiple files are merged into a zipped file.
+        Download files. Multiple files and directories are merged into an
+        archive, in the format and compression level requested.
         ---
         tags:
             - file manager
@@ -206,35 +296,239 @@ class FileManagerDownload(Resource):
         payload = request.form
         svc = FileManagerSvc
         try:
-            req = dsl.DownloadSchema().load(payload)
+            req = instance(dsl.DownloadSchema).load(payload)
             names = req["downloadInput"]["names"]
             paths = [os.path.join(req["downloadInput"]["path"], name) for name in names]
             if len(paths) == 1:
                 path = paths[0]
                 if svc.is_file(path):
-                    return send_file(path, as_attachment=True)
-
-            tarfile = svc.create_attachment(paths=paths)
-            filename = f"{'files' if len(names) > 1 else names[0]}.tar.gz"
-            return send_file(
-                tarfile,
-                as_attachment=True,
-                mimetype="application/gzip",
-                download_name=filename,
+                    return utils.send_stream(
+                        stream_file(path),
+                        stats=svc.file_stats(path),
+                        download_name=os.path.basename(path),
+                        path=path,
+                    )
+
+            archive = FORMATS[req["format"]]
+            filename = f"{'files' if len(names) > 1 else names[0]}{archive.extension}"
+            if req.get("async_"):
+                return submit_job(
+                    "archive",
+                    path=req["downloadInput"]["path"],
+                    names=names,
+                    downloadName=filename,
+                    format=req["format"],
+                    level=req.get("level"),
+                    workers=current_app.config["ARCHIVE_WORKERS"],
+                )
+            cache, key = current_app.extensions.get("archive_cache"), None
+            if cache is not None:
+                fingerprint = svc.fingerprint(paths=paths)  # None if changing
+                if fingerprint is not None:
+                    key = cache.key(fingerprint, req["format"], req.get("level"))
+                    cached = cache.lookup(key)
+                    if cached is not None:
+                        return utils.send_path(
+                            cached, download_name=filename, mimetype=archive.mimetype
+                        )
+            chunks = stream_attachment(
+                paths=paths,
+                format=req["format"],
+                level=req.get("level"),
+                workers=current_app.config["ARCHIVE_WORKERS"],
+            )
+            if key is not None:
+                chunks = cache.store(key, chunks)
+            return utils.stream_response(
+                chunks, mimetype=archive.mimetype, download_name=filename
             )
         except PermissionError:
             utils.abort_with(403)
         except FileNotFoundError:
             utils.abort_with(404)
-        except (OSError, ValidationError):
+        except (OSError, ValueError, ValidationError):
             utils.abort_with(400)
 
 
+@api.resource("/jobs/<job_id>", endpoint="fm_job")
+class FileManagerJob(Resource):
+    def get(self, job_id):
+        """
+        Get the status, progress and results of a background job.
+        ---
+        tags:
+            - file manager
+        parameters:
+            - in: path
+              name: job_id
+              schema:
+                type: string
+              description: the job identifier
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: JobResponseSchema
+            404:
+        """
+        try:
+            return sl.dump_job(**jobs().get(job_id, username=job_user()))
+        except (KeyError, ValueError):
+            utils.abort_with(404)
+
+    def delete(self, job_id):
+        """
+        Cancel a background job, leaving the items completed so far.
+        ---
+        tags:
+            - file manager
+        parameters:
+            - in: path
+              name: job_id
+              schema:
+                type: string
+              description: the job identifier
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: JobResponseSchema
+            404:
+        """
+        try:
+            return sl.dump_job(**jobs().cancel(job_id, username=job_user()))
+        except (KeyError, ValueError):
+            utils.abort_with(404)
+
+
+@api.resource("/jobs/<job_id>/download", endpoint="fm_job_download")
+class FileManagerJobDownload(Resource):
+    def get(self, job_id):
+        """
+        Download the archive made by a background job.
+        ---
+        tags:
+            - file manager
+        parameters:
+            - in: path
+              name: job_id
+              schema:
+                type: string
+              description: the job identifier
+        responses:
+            200:
+                content:
+                    application/*:
+                        schema:
+                            type: string
+                            format: binary
+            404:
+            409:
+        """
+        try:
+            job = jobs().get(job_id, username=job_user())
+        except (KeyError, ValueError):
+            utils.abort_with(404)
+        if job["action"] != "archive":
+            utils.abort_with(404)
+        if job["status"] != "done":
+            utils.abort_with(409, description=f"job is {job['status']}")
+        return utils.send_path(
+            jobs().store.output(job_id),
+            download_name=job["params"]["downloadName"],
+            mimetype=FORMATS[job["params"].get("format", "tar.gz")].mimetype,
+        )
+
+
+def jobs():
+    """Manager of background jobs, failing if they are disabled."""
+    manager = current_app.extensions.get("jobs")
+    if manager is None:
+        raise ValueError("background jobs are disabled")
+    return manager
+
+
+def job_user():
+    return str(current_username) if current_username else None
+
+
+def submit_job(action, **params):
+    job = jobs().submit(action, username=job_user(), **params)
+    return sl.dump_job(**job)
+
+
+# status codes of the errors of batch operations, 400 for others
+BATCH_ERRORS = {
+    PermissionError: 403,
+    FileNotFoundError: 404,
+    NotADirectoryError: 404,
+    FileExistsError: 409,
+}
+
+
+@api.resource("/batch", endpoint="fm_batch")
+class FileManagerBatch(Resource):
+    def post(self):
+        """
+        Run many operations over paths at once, e.g. to stat scattered files in
+        a single request.
+
+        Operations run concurrently, in no particular order, and may then not
+        change a path another one touches, or an ancestor of it. Given
+        ``ordered``, they run one after the other, in the order given.
+        ---
+        tags:
+            - file manager
+        requestBody:
+            description: the operations, run concurrently unless ordered
+            required: true
+            content:
+                application/json:
+                    schema: BatchSchema
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: BatchResponseSchema
+            400:
+        """
+        try:
+            req = instance(dsl.BatchSchema).load(request.json)
+            operations = req["operations"]
+            if len(operations) > current_app.config["BATCH_MAX_SIZE"]:
+                raise ValueError("too many operations")
+            for operation in operations:
+                operation["path"] = os.path.join(os.path.sep, operation["path"])
+            outcomes = FileManagerSvc.batch(
+                operations,
+                workers=current_app.config["BATCH_WORKERS"],
+                volumes=current_app.config["TRASH_VOLUMES"],
+                ordered=req["ordered"],
+            )
+        except (ValueError, ValidationError) as ex:
+            utils.abort_with(400, description=str(ex))
+        results = []
+        for operation, (result, error) in zip(operations, outcomes):
+            op, path = operation["op"], operation["path"]
+            if error is not None:
+                code = BATCH_ERRORS.get(type(error), 400)
+                response = utils.http_response(code, description=str(error))
+            elif op == "exists":
+                response = {**utils.http_response(200), "exists": result}
+            elif op == "delete":
+                response = utils.http_response(204)
+            else:
+                code = 201 if op == "mkdir" else 200
+                response = {**utils.http_response(code), "stats": result}
+            results.append({"op": op, "path": path, **response})
+        return sl.dump_batch(results=results)
+
+
 @api.resource("/upload", endpoint="fm_upload")
 class FileManagerUpload(Resource):
     def post(self):
         """
-        Upload files.
+        Upload files, either whole or in chunks that can be resumed.
         ---
         tags:
             - file manager
@@ -251,6 +545,7 @@ class FileManagerUpload(Resource):
                         schema:
                             oneOf:
                                 - $ref: "#/components/schemas/HttpResponse"
+                                - UploadResponseSchema
                                 - ErrorResponseSchema
             400:
             401:
@@ -258,23 +553,46 @@ class FileManagerUpload(Resource):
         """
         payload = request.form
         svc = FileManagerSvc
+        max_age = current_app.config["UPLOAD_MAX_AGE"]
         try:
-            req = dsl.UploadSchema().load(payload)
+            req = instance(dsl.UploadSchema).load(payload)
             if req["action"] == "save":
                 file = request.files["uploadFiles"]
                 file_path = os.path.join(req["path"], file.filename)
-                content = file.stream.read()
-                svc.create(file_path, content=content)
+                if "chunk_index" in req:
+                    index = req["chunk_index"]
+                    if index == 0:  # on new uploads, drop those abandoned
+                        svc.expire_uploads(req["path"], max_age=max_age)
+                    chunks = stream_chunk(
+                        file_path,
+                        stream=file.stream,
+                        index=index,
+                        offset=index * req["chunk_size"],
+                        total=req["total_chunk"],
+                        upload_id=req.get("upload_id", ""),
+                    )
+                    return sl.dump_upload(**utils.http_response(200), chunks=chunks)
+                stream_upload(file_path, stream=file.stream)
             elif req["action"] == "remove":
-                path = os.path.join(req["path"], req["cancel-uploading"])
+                path = os.path.join(req["path"], req["cancel_uploading"])
+                svc.discard_chunks(path, upload_id=req.get("upload_id"))
                 if svc.exists(path):
                     svc.delete(path)
+            elif req["action"] == "status":
+                svc.expire_uploads(req["path"], max_age=max_age)
+                path = os.path.join(req["path"], req["name"])
+                chunks = svc.uploaded_chunks(
+                    path,
+                    total=req.get("total_chunk"),
+                    upload_id=req.get("upload_id", ""),
+                )
+                return sl.dump_upload(**utils.http_response(200), chunks=chunks)
             return utils.http_response(200), 200
         except PermissionError:
             utils.abort_with(403)
         except FileNotFoundError:
             utils.abort_with(404)
-        except (OSError, ValidationError):
+        except (OSError, ValueError, ValidationError):
             utils.abort_with(400)
 
 
@@ -282,7 +600,7 @@ class FileManagerUpload(Resource):
 class FileManagerImages(Resource):
     def get(self):
         """
-        Get images.
+        Get images, downscaled to thumbnails unless the original is asked for.
         ---
         tags:
             - file manager
@@ -292,6 +610,21 @@ class FileManagerImages(Resource):
               schema:
                 type: string
               description: the filesystem path
+            - in: query
+              name: width
+              schema:
+                type: integer
+              description: the width the image is displayed at
+            - in: query
+              name: height
+              schema:
+                type: integer
+              description: the height the image is displayed at
+            - in: query
+              name: original
+              schema:
+                type: boolean
+              description: whether to send the original image
         responses:
             200:
                 content:
@@ -303,13 +636,50 @@ class FileManagerImages(Resource):
             403:
             404:
         """
-        path = os.path.join(os.path.sep, request.args.get("path", ""))
         svc = FileManagerSvc
         try:
-            if not svc.exists(path):
-                raise FileNotFoundError
-            return send_file(path)
+            req = instance(dsl.ImageSchema, unknown=EXCLUDE).load(request.args)
+            path = os.path.join(os.path.sep, req["path"])
+            stats = svc.file_stats(path)  # the user must be able to read it
+            thumbnailer = current_app.extensions.get("thumbnailer")
+            if thumbnailer is not None and not req["original"]:
+                size = thumbnail_size(
+                    req.get("width"),
+                    req.get("height"),
+                    default=current_app.config["THUMBNAIL_SIZE"],
+                )
+                try:
+                    thumbnail = thumbnailer.get(
+                        thumbnail_key(stats, size),
+                        lambda: svc.thumbnail(path, size),
+                        username=job_user(),
+                    )
+                except ValueError:
+                    pass  # not an image, sent as it is
+                else:
+                    return send_thumbnail(thumbnail, stats=stats, size=size)
+            return utils.send_stream(
+                stream_file(path),
+                stats=stats,
+                download_name=os.path.basename(path),
+                as_attachment=False,
+                path=path,
+            )
         except PermissionError:
             utils.abort_with(403)
         except FileNotFoundError:
             utils.abort_with(404)
+        except (OSError, ValidationError):
+            utils.abort_with(400)
+
+
+def send_thumbnail(thumbnail, stats, size):
+    """Send a thumbnail, validated against the stats of its original image."""
+    response = send_file(
+        thumbnail.path or io.BytesIO(thumbnail.data),
+        mimetype=thumbnail.mimetype,
+        etag=f"{utils.file_etag(stats)}-{size}",
+        last_modified=stats.st_mtime,
+    )
+    response.cache_control.no_cache = True
+    return response
@@ -1,12 +1,22 @@
 import os
+from urllib.parse import urlencode
 
-from flask import Blueprint, request, send_file
+from flask import Blueprint, current_app, request
 from flask_restful import Api, Resource
 from http.client import HTTPException
+from marshmallow import EXCLUDE, ValidationError
 
 from src import utils
 from src.api.auth import requires_auth
-from src.services.filesystem import FilesystemSvc
+from src.schemas import instance
+from src.schemas.deserializers.filesystem import PageSchema
+from src.services.filesystem import (
+    FilesystemSvc,
+    SORT_KEYS,
+    stream_attachment,
+    stream_file,
+    upload_writer,
+)
 
 blueprint = Blueprint("filesystem", __name__)
 api = Api(blueprint)
@@ -30,9 +40,38 @@ class Filesystem(Resource):
                 type: string
               required: true
               description: the path to list content from
+            - in: query
+              name: limit
+              schema:
+                type: integer
+                minimum: 1
+              description: the maximum number of entries to list
+            - in: query
+              name: cursor
+              schema:
+                type: string
+              description: the cursor to the page to list, as given by a previous
+                page in its Link header
+            - in: query
+              name: sortBy
+              schema:
+                type: string
+                enum: [name, size, dateModified]
+              description: the key to sort entries by
+            - in: query
+              name: sortOrder
+              schema:
+                type: string
+                enum: [Ascending, Descending, None]
+              description: the order to sort entries in
         responses:
             200:
                 description: Ok
+                headers:
+                    Link:
+                        schema:
+                            type: string
+                        description: the link to the next page, if any
                 content:
                     application/json:
                         schema:
@@ -57,15 +96,36 @@ class Filesystem(Resource):
         try:
             accept = request.headers.get("accept", "application/json")
             if accept == "application/json":
-                return [file.name for file in svc.list(path=path)]
+                args = instance(PageSchema, unknown=EXCLUDE).load(request.args)
+                if not args:
+                    return [file.name for file in svc.list(path=path)]
+
+                entries, cursor = utils.paginate(
+                    svc.scan(path=path, children=False),
+                    key=SORT_KEYS[args.get("sortBy", "name")],
+                    limit=args.get("limit"),
+                    cursor=args.get("cursor"),
+                    reverse=args.get("sortOrder") == "Descending",
+                )
+                headers = {}
+                if cursor:
+                    query = urlencode({**request.args, "cursor": cursor})
+                    headers["Link"] = f'<{request.base_url}?{query}>; rel="next"'
+                return [os.path.basename(entry) for entry, *_ in entries], 200, headers
             elif accept == "application/octet-stream":
                 if svc.is_file(path):  # check for regular file
-                    return send_file(path, as_attachment=True)
+                    return utils.send_stream(
+                        stream_file(path),
+                        stats=svc.file_stats(path),
+                        download_name=path.name,
+                        path=path,
+                    )
                 else:
-                    tarfile = svc.create_attachment(paths=(path,))
-                    return send_file(
-                        tarfile,
-                        as_attachment=True,
+                    return utils.stream_response(
+                        stream_attachment(
+                            paths=(path,),
+                            workers=current_app.config["ARCHIVE_WORKERS"],
+                        ),
                         mimetype="application/gzip",
                         download_name=f"{path.name}.tar.gz",
                     )
@@ -75,7 +135,7 @@ class Filesystem(Resource):
             utils.abort_with(code=403, description=str(ex))
         except FileNotFoundError as ex:
             utils.abort_with(code=404, description=str(ex))
-        except HTTPException as ex:
+        except (HTTPException, ValueError, ValidationError) as ex:
             utils.abort_with(code=400, description=str(ex))
 
     @requires_auth(schemes=["basic"])
@@ -121,17 +181,8 @@ class Filesystem(Resource):
                 $ref: "#/components/responses/Forbidden"
         """
         path = utils.normpath(path)
-        svc = FilesystemSvc
-        files = request.files.to_dict(flat=False).get("files", [])
-        if not files:
-            utils.abort_with(code=400, description="missing files")
         try:
-            if any(svc.exists(os.path.join(path, file.filename)) for file in files):
-                raise FileExistsError("a file already exists in given path")
-            for file in files:
-                file_path = os.path.join(path, file.filename)
-                content = file.stream.read()
-                svc.create(file_path, content=content)
+            _upload(path, replace=False)
             return utils.http_response(201), 201
         except PermissionError as ex:
             utils.abort_with(code=403, description=str(ex))
@@ -177,18 +228,8 @@ class Filesystem(Resource):
                 $ref: "#/components/responses/Forbidden"
         """
         path = utils.normpath(path)
-        svc = FilesystemSvc
-        files = request.files.to_dict(flat=False).get("files", [])
-
-        if not files:
-            utils.abort_with(code=400, description="missing files")
         try:
-            if not all(svc.exists(os.path.join(path, file.filename)) for file in files):
-                raise FileNotFoundError("a file does not exist in given path")
-            for file in files:
-                file_path = os.path.join(path, file.filename)
-                content = file.stream.read()
-                svc.create(file_path, content=content)
+            _upload(path, replace=True)
             return None, 204
         except PermissionError as ex:
             utils.abort_with(code=403, description=str(ex))
@@ -198,7 +239,8 @@ class Filesystem(Resource):
     @requires_auth(schemes=["basic"])
     def delete(self, path):
         """
-        Delete file in given path.
+        Delete file or directory in given path. Directory trees are deleted on
+        trash volumes only.
         ---
         tags:
             - filesystem
@@ -228,7 +270,7 @@ class Filesystem(Resource):
         path = utils.normpath(path)
         svc = FilesystemSvc
         try:
-            svc.delete(path=path)
+            svc.delete(path=path, volumes=current_app.config["TRASH_VOLUMES"])
             return utils.http_response(204), 204
         except PermissionError as ex:
             utils.abort_with(code=403, description=str(ex))
@@ -236,3 +278,41 @@ class Filesystem(Resource):
             utils.abort_with(code=400, description=str(ex))
         except OSError as ex:
             utils.abort_with(code=400, description=str(ex))
+
+
+def _upload(path, replace):
+    """Write the files uploaded into given directory, all new ones or, if
+    replacing, all existing ones.
+
+    Files are written to temporary files next to their destination while the
+    form is parsed, rather than spooled first, and swapped in once they are
+    all received.
+    """
+    svc = FilesystemSvc
+    writers = []
+
+    def stream_factory(total_content_length, content_type, filename=None, **_):
+        writers.append(upload_writer(os.path.join(path, filename or "")))
+        return writers[-1]
+
+    request._get_file_stream = stream_factory
+    temps = {}
+    try:
+        files = request.files.getlist("files")
+        if not files:
+            utils.abort_with(code=400, description="missing files")
+        exists = [svc.exists(os.path.join(path, file.filename)) for file in files]
+        if not replace and any(exists):
+            raise FileExistsError("a file already exists in given path")
+        if replace and not all(exists):
+            raise FileNotFoundError("a file does not exist in given path")
+        for file in files:
+            temps[file.stream.result()] = os.path.join(path, file.filename)
+        for tmp, target in list(temps.items()):
+            svc.commit(tmp, target, replace=replace)
+            del temps[tmp]
+    finally:
+        for writer in writers:
+            writer.close()  # aborts the files not received entirely
+        for tmp in temps:
+            svc.discard(tmp)
@@ -1,3 +1,5 @@
+import functools
+
 from apispec import APISpec
 from apispec.ext.marshmallow import MarshmallowPlugin
 from apispec_plugins.types import AuthSchemes, Server, Tag
@@ -10,9 +12,16 @@ from flask_cors import CORS
 from src import __meta__, __version__
 from src.api.filemgr import blueprint as fm
 from src.api.filesystem import blueprint as fs
+from src.services.cache import ArchiveCache, DiskCache, ListingCache
+from src.services.index import SearchIndex
+from src.services.filesystem import FilesystemSvc
+from src.services.jobs import JobManager
+from src.services.thumbnails import Thumbnailer
+from src.services.trash import TrashPurger
 from src.settings import oas
 from src.settings.ctx import ctx_settings
 from src.settings.env import config_class
+from src.utils import impersonation
 
 
 def create_app(environ="development", configs=None):
@@ -81,3 +90,67 @@ def setup_app(app):
 
     # settings within app ctx
     ctx_settings(app)
+
+    # impersonation sessions bound to requests
+    impersonation.init_app(app)
+
+    # filename index for searches
+    if app.config["SEARCH_INDEX_PATH"]:
+        index = SearchIndex(
+            db_path=app.config["SEARCH_INDEX_PATH"],
+            roots=app.config["SEARCH_INDEX_ROOTS"],
+        )
+        app.extensions["search_index"] = index.start(
+            interval=app.config["SEARCH_INDEX_INTERVAL"]
+        )
+
+    # in-memory cache of directory listings
+    if app.config["LISTING_CACHE_SIZE"]:
+        app.extensions["listing_cache"] = ListingCache(
+            maxsize=app.config["LISTING_CACHE_SIZE"],
+            max_age=app.config["LISTING_CACHE_MAX_AGE"],
+        )
+
+    # on-disk cache of the archives downloaded
+    if app.config["ARCHIVE_CACHE_PATH"]:
+        app.extensions["archive_cache"] = ArchiveCache(
+            path=app.config["ARCHIVE_CACHE_PATH"],
+            maxsize=app.config["ARCHIVE_CACHE_SIZE"],
+        )
+
+    # thumbnails of images, generated by a pool of threads
+    if app.config["THUMBNAIL_WORKERS"] and Thumbnailer.available():
+        cache = None
+        if app.config["THUMBNAIL_CACHE_PATH"]:
+            cache = DiskCache(
+                path=app.config["THUMBNAIL_CACHE_PATH"],
+                maxsize=app.config["THUMBNAIL_CACHE_SIZE"],
+            )
+        app.extensions["thumbnailer"] = Thumbnailer(
+            cache=cache, workers=app.config["THUMBNAIL_WORKERS"]
+        )
+
+    # background purge of the trees deleted
+    if app.config["TRASH_VOLUMES"]:
+        purge = functools.partial(
+            FilesystemSvc.purge,
+            workers=app.config["TRASH_PURGE_WORKERS"],
+            rate=app.config["TRASH_PURGE_RATE"],
+        )
+        app.extensions["trash_purger"] = TrashPurger(
+            app,
+            volumes=app.config["TRASH_VOLUMES"],
+            purge=purge,
+            interval=app.config["TRASH_PURGE_INTERVAL"],
+        ).start()
+
+    # background jobs, resuming those of workers which died
+    if app.config["JOBS_PATH"]:
+        jobs = JobManager(
+            app,
+            path=app.config["JOBS_PATH"],
+            workers=app.config["JOBS_WORKERS"],
+            max_age=app.config["JOBS_MAX_AGE"],
+        )
+        jobs.recover()
+        app.extensions["jobs"] = jobs
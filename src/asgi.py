@@ -0,0 +1,163 @@
+"""ASGI entry point, serving the app with an ASGI server such as ``uvicorn``:
+
+    $ uvicorn --factory "src.asgi:create_app"
+
+Requests are handled by the same views as the WSGI app, but within a bounded
+pool of threads, while response bodies are sent asynchronously: a slow client
+does not hold a thread, which is only taken to produce each chunk.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from src import app as wsgi
+
+__all__ = ("AsgiApp", "create_app")
+
+_END = object()
+
+
+def create_app(environ="production", configs=None):
+    """Create a new ASGI app."""
+    app = wsgi.create_app(environ=environ, configs=configs)
+    return AsgiApp(app, max_workers=app.config["ASGI_WORKERS"])
+
+
+class AsgiApp:
+    """Adapter serving a WSGI app over ASGI, running it in a thread pool."""
+
+    def __init__(self, wsgi_app, max_workers=64):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("lifespan", "http"):
+            raise NotImplementedError(f"unsupported scope type {scope['type']!r}")
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = _RequestBody(receive, loop)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        environ = _environ(scope, io.BufferedReader(body))
+        iterable = await self._run(self.wsgi_app, environ, start_response)
+        try:
+            chunks = iter(iterable)
+            chunk = await self._run(next, chunks, _END)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response["status"],
+                    "headers": response["headers"],
+                }
+            )
+            disconnected = asyncio.ensure_future(body.disconnected())
+            try:
+                while chunk is not _END and not disconnected.done():
+                    if chunk:
+                        await send(
+                            {
+                                "type": "http.response.body",
+                                "body": chunk,
+                                "more_body": True,
+                            }
+                        )
+                    chunk = await self._run(next, chunks, _END)
+            finally:
+                disconnected.cancel()
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                await self._run(iterable.close)
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+
+class _RequestBody(io.RawIOBase):
+    """Blocking reader of the request body, for use outside of the event loop."""
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self._pending = b""
+        self._more = True
+        self._disconnected = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending and self._more:
+            receive = asyncio.run_coroutine_threadsafe(self._receive(), self.loop)
+            receive.result()
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    async def _receive(self):
+        message = await self.receive()
+        if message["type"] == "http.disconnect":
+            self._more, self._disconnected = False, True
+            raise ConnectionAbortedError("client disconnected")
+        self._pending += message.get("body", b"")
+        self._more = message.get("more_body", False)
+
+    async def disconnected(self):
+        """Wait for the client to disconnect, discarding unread body."""
+        while not self._disconnected:
+            message = await self.receive()
+            self._disconnected = message["type"] == "http.disconnect"
+
+
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", ()):
+        name, value = name.decode("latin-1").upper(), value.decode("latin-1")
+        if name in ("CONTENT-TYPE", "CONTENT-LENGTH"):
+            key = name.replace("-", "_")
+        else:
+            key = f"HTTP_{name.replace('-', '_')}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
@@ -0,0 +1,9 @@
+import functools
+
+__all__ = ("instance",)
+
+
+@functools.lru_cache(maxsize=None)
+def instance(schema_cls, **kwargs):
+    """Shared instance of a schema, as schemas hold no state between loads."""
+    return schema_cls(**kwargs)
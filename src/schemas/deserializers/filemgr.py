@@ -1,9 +1,19 @@
 import json
 
-from marshmallow import EXCLUDE, fields, pre_load, Schema
-from marshmallow.validate import OneOf
-
+from marshmallow import (
+    EXCLUDE,
+    fields,
+    pre_load,
+    Schema,
+    validates_schema,
+    ValidationError,
+)
+from marshmallow.validate import Length, OneOf, Range, Regexp
+
+from src.schemas.deserializers.filesystem import PageSchema
 from src.schemas.serializers.filemgr import StatsSchema
+from src.services.archive import FORMATS, check_options
+from src.services.filemgr import BATCH_OPERATIONS
 
 
 class BaseActionSchema(Schema):
@@ -18,7 +28,12 @@ class BaseActionSchema(Schema):
     data = fields.List(fields.Nested(StatsSchema(unknown=EXCLUDE)))
 
 
-class ReadActionSchema(BaseActionSchema):
+class AsyncSchema(Schema):
+    # run the action as a background job
+    async_ = fields.Boolean(data_key="async")
+
+
+class ReadActionSchema(BaseActionSchema, PageSchema):
     showHiddenItems = fields.Boolean()
 
 
@@ -26,7 +41,7 @@ class CreateActionSchema(BaseActionSchema):
     name = fields.String()
 
 
-class DeleteActionSchema(BaseActionSchema):
+class DeleteActionSchema(BaseActionSchema, AsyncSchema):
     names = fields.List(fields.String())
 
 
@@ -39,20 +54,22 @@ class SearchActionSchema(BaseActionSchema):
     showHiddenItems = fields.Boolean()
     caseSensitive = fields.Boolean()
     searchString = fields.String()
+    maxDepth = fields.Integer(validate=Range(min=0))
+    limit = fields.Integer(validate=Range(min=1))
 
 
 class DetailsActionSchema(BaseActionSchema):
     names = fields.List(fields.String())
 
 
-class CopyActionSchema(BaseActionSchema):
+class CopyActionSchema(BaseActionSchema, AsyncSchema):
     names = fields.List(fields.String())
     renameFiles = fields.List(fields.String())
     targetPath = fields.String()
     targetData = fields.Nested(StatsSchema(unknown=EXCLUDE), allow_none=True)
 
 
-class MoveActionSchema(BaseActionSchema):
+class MoveActionSchema(BaseActionSchema, AsyncSchema):
     names = fields.List(fields.String())
     renameFiles = fields.List(fields.String())
     targetPath = fields.String()
@@ -61,15 +78,30 @@ class MoveActionSchema(BaseActionSchema):
 
 class UploadSchema(Schema):
     action = fields.String(
-        validate=OneOf(("save", "remove")),
+        validate=OneOf(("save", "remove", "status")),
         allow_none=False,
         required=True,
     )
     path = fields.String()
+    name = fields.String()
     cancel_uploading = fields.String(data_key="cancel-uploading")
-
-
-class DownloadSchema(Schema):
+    chunk_index = fields.Integer(data_key="chunk-index", validate=Range(min=0))
+    chunk_size = fields.Integer(data_key="chunk-size", validate=Range(min=1))
+    total_chunk = fields.Integer(data_key="total-chunk", validate=Range(min=1))
+    upload_id = fields.String(data_key="upload-id", validate=Regexp(r"[\w-]{1,64}\Z"))
+
+    @validates_schema
+    def validate_chunk(self, data, **_):
+        if data["action"] != "save":
+            return
+        chunk = ("chunk_index", "chunk_size", "total_chunk")
+        if any(k in data for k in chunk) and not all(k in data for k in chunk):
+            raise ValidationError("incomplete chunk properties")
+        if "chunk_index" in data and data["chunk_index"] >= data["total_chunk"]:
+            raise ValidationError("chunk index out of range")
+
+
+class DownloadSchema(AsyncSchema):
     class DownloadInputSchema(BaseActionSchema):
         action = fields.String(
             validate=OneOf(("download",)),
@@ -81,9 +113,42 @@ class DownloadSchema(Schema):
         names = fields.List(fields.String())
 
     downloadInput = fields.Nested(DownloadInputSchema())
+    format = fields.String(validate=OneOf(tuple(FORMATS)), load_default="tar.gz")
+    level = fields.Integer(validate=Range(min=0, max=22))
+
+    @validates_schema
+    def validate_options(self, data, **_):
+        try:
+            check_options(data["format"], data.get("level"))
+        except ValueError as ex:
+            raise ValidationError(str(ex), "level" if "level" in data else "format")
 
     @pre_load
     def parser(self, data, **_):
         parsed = data.to_dict()
         parsed["downloadInput"] = json.loads(parsed["downloadInput"])
         return parsed
+
+
+class ImageSchema(Schema):
+    path = fields.String(load_default="")
+    width = fields.Integer(validate=Range(min=1))
+    height = fields.Integer(validate=Range(min=1))
+    original = fields.Boolean(load_default=False)
+
+
+class BatchSchema(Schema):
+    class OperationSchema(Schema):
+        op = fields.String(validate=OneOf(BATCH_OPERATIONS), load_default="stat")
+        path = fields.String(required=True)
+        target = fields.String()
+
+        @validates_schema
+        def validate_target(self, data, **_):
+            if data["op"] == "rename" and not data.get("target"):
+                raise ValidationError("missing target", "target")
+
+    operations = fields.List(
+        fields.Nested(OperationSchema()), required=True, validate=Length(min=1)
+    )
+    ordered = fields.Boolean(load_default=False)
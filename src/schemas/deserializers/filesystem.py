@@ -0,0 +1,9 @@
+from marshmallow import fields, Schema
+from marshmallow.validate import OneOf, Range
+
+
+class PageSchema(Schema):
+    limit = fields.Integer(validate=Range(min=1))
+    cursor = fields.String()
+    sortBy = fields.String(validate=OneOf(("name", "size", "dateModified")))
+    sortOrder = fields.String(validate=OneOf(("Ascending", "Descending", "None")))
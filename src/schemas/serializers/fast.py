@@ -0,0 +1,81 @@
+from marshmallow import fields, missing, Schema
+
+__all__ = ("compile_dump", "fast_dump")
+
+
+def _boolean(field):
+    truthy, falsy = field.truthy, field.falsy
+
+    def convert(value):
+        try:
+            if value in truthy:
+                return True
+            if value in falsy:
+                return False
+        except TypeError:
+            pass
+        return bool(value)
+
+    return convert
+
+
+def _datetime(field):
+    if (field.format or field.DEFAULT_FORMAT) != "iso":
+        raise TypeError(f"unsupported datetime format {field.format!r}")
+    return lambda value: value.isoformat()
+
+
+def _converter(field):
+    """Function serializing a non-null value the way given field does."""
+    if isinstance(field, fields.Nested):
+        if field.many or field.only or field.exclude:
+            raise TypeError("unsupported nested options")
+        return compile_dump(field.schema)
+    if isinstance(field, fields.List):
+        inner = _converter(field.inner)
+        return lambda values: [None if v is None else inner(v) for v in values]
+    if field.__class__ in (fields.String, fields.Str):
+        return str
+    if field.__class__ in (fields.Boolean, fields.Bool):
+        return _boolean(field)
+    if field.__class__ in (fields.Integer, fields.Int) and not field.as_string:
+        return int
+    if field.__class__ in (fields.Number, fields.Float) and not field.as_string:
+        return float
+    if field.__class__ is fields.DateTime:
+        return _datetime(field)
+    raise TypeError(f"unsupported field {field.__class__.__name__}")
+
+
+def compile_dump(schema: Schema):
+    """Compile the ``dump`` of a schema over dicts into a plain function, giving
+    the same output for the subset of fields and options it supports.
+
+    Raises ``TypeError`` for schemas it does not support.
+    """
+    if schema.many or any(schema._hooks.values()):
+        raise TypeError("unsupported schema options or hooks")
+    spec = []
+    for name, field in schema.dump_fields.items():
+        if field.dump_default is not missing or field.attribute:
+            raise TypeError(f"unsupported options of field {name}")
+        spec.append((name, field.data_key or name, _converter(field)))
+
+    def dump(obj: dict) -> dict:
+        data = {}
+        for name, key, convert in spec:
+            value = obj.get(name, missing)
+            if value is missing:
+                continue
+            data[key] = None if value is None else convert(value)
+        return data
+
+    return dump
+
+
+def fast_dump(schema: Schema):
+    """Compiled ``dump`` of a schema if supported, else the ``dump`` itself."""
+    try:
+        return compile_dump(schema)
+    except TypeError:
+        return schema.dump
@@ -1,5 +1,8 @@
+from datetime import datetime
+
 from marshmallow import fields, Schema
 
+from src.schemas.serializers.fast import fast_dump
 from src.schemas.serializers.http import HttpResponseSchema
 
 
@@ -32,12 +35,18 @@ class BaseResponseSchema(Schema):
 
 
 class StatsResponseSchema(BaseResponseSchema):
-    pass
+    cursor = fields.String()
 
 
 class ErrorResponseSchema(BaseResponseSchema):
     class ErrorSchema(HttpResponseSchema):
+        class FailureSchema(Schema):
+            src = fields.String()
+            dst = fields.String()
+            reason = fields.String()
+
         fileExists = fields.List(fields.String())
+        failures = fields.List(fields.Nested(FailureSchema()))
 
     error = fields.Nested(ErrorSchema())
 
@@ -46,13 +55,74 @@ class DetailsResponseSchema(BaseResponseSchema):
     details = fields.Nested(DetailsSchema())
 
 
+class UploadResponseSchema(HttpResponseSchema):
+    chunks = fields.List(fields.Integer())
+
+
+class JobResponseSchema(Schema):
+    class ProgressSchema(Schema):
+        items = fields.Integer()
+        totalItems = fields.Integer()
+        files = fields.Integer()
+        bytes = fields.Integer()
+
+    class ResultSchema(Schema):
+        name = fields.String()
+        path = fields.String()
+        status = fields.String()
+        error = fields.String()
+        strategies = fields.Dict(keys=fields.String(), values=fields.Integer())
+
+    id = fields.String()
+    action = fields.String()
+    status = fields.String()
+    createdAt = fields.DateTime()
+    updatedAt = fields.DateTime()
+    progress = fields.Nested(ProgressSchema())
+    results = fields.List(fields.Nested(ResultSchema()))
+    error = fields.String()
+
+
+class BatchResponseSchema(Schema):
+    class OperationResultSchema(HttpResponseSchema):
+        op = fields.String()
+        path = fields.String()
+        exists = fields.Boolean()
+        stats = fields.Nested(StatsSchema())
+
+    results = fields.List(fields.Nested(OperationResultSchema()))
+
+
+# responses may list thousands of entries, so are dumped by compiled functions
+_dump_stats = fast_dump(StatsResponseSchema())
+_dump_error = fast_dump(ErrorResponseSchema())
+_dump_details = fast_dump(DetailsResponseSchema())
+_dump_upload = fast_dump(UploadResponseSchema())
+_dump_job = fast_dump(JobResponseSchema())
+_dump_batch = fast_dump(BatchResponseSchema())
+
+
 def dump_stats(**kwargs):
-    return StatsResponseSchema().dump(kwargs)
+    return _dump_stats(kwargs)
 
 
 def dump_error(**kwargs):
-    return ErrorResponseSchema().dump({**{"error": kwargs}, **kwargs})
+    return _dump_error({**{"error": kwargs}, **kwargs})
 
 
 def dump_details(**kwargs):
-    return DetailsResponseSchema().dump({**{"details": kwargs}, **kwargs})
+    return _dump_details({**{"details": kwargs}, **kwargs})
+
+
+def dump_upload(**kwargs):
+    return _dump_upload(kwargs)
+
+
+def dump_job(**kwargs):
+    for key in ("createdAt", "updatedAt"):  # kept as timestamps
+        kwargs[key] = datetime.fromtimestamp(kwargs[key])
+    return _dump_job(kwargs)
+
+
+def dump_batch(**kwargs):
+    return _dump_batch(kwargs)
@@ -0,0 +1,264 @@
+import collections
+import contextlib
+import errno
+import gzip
+import hashlib
+import io
+import os
+import stat
+import tarfile
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # optional, enables tar.zst archives
+    zstandard = None
+
+__all__ = (
+    "FORMATS",
+    "ParallelGzipWriter",
+    "check_options",
+    "compressible",
+    "tree_fingerprint",
+    "write_archive",
+)
+
+_Format = namedtuple("_Format", ("extension", "mimetype", "levels", "default"))
+
+# archive formats, along with the compression levels they accept
+FORMATS = {
+    "tar": _Format(".tar", "application/x-tar", range(0, 1), 0),
+    "tar.gz": _Format(".tar.gz", "application/gzip", range(0, 10), 6),
+    "tar.zst": _Format(".tar.zst", "application/zstd", range(1, 23), 3),
+    "zip": _Format(".zip", "application/zip", range(0, 10), 6),
+}
+
+# extensions of files whose content is compressed already
+COMPRESSED = frozenset(
+    (
+        ".7z .aac .avif .br .bz2 .docx .flac .gif .gz .heic .jar .jpeg .jpg .lz4"
+        " .mkv .mov .mp3 .mp4 .odt .ogg .parquet .png .pptx .rar .tgz .webm .webp"
+        " .whl .xlsx .xz .zip .zst"
+    ).split()
+)
+
+# bytes sampled to tell whether a file is worth compressing, and the ratio its
+# fast compression must reach
+SNIFF_SIZE = 64 * 1024
+SNIFF_RATIO = 0.9
+
+# files too small for compression to pay off
+MIN_SIZE = 512
+
+# size of the blocks of tar streams compressed in parallel
+BLOCK_SIZE = 1024 * 1024
+
+
+def compressible(path, size):
+    """Whether compressing given file is worth it, from its extension and the
+    compression of its first bytes."""
+    if size < MIN_SIZE or os.path.splitext(path)[1].lower() in COMPRESSED:
+        return False
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_SIZE)
+    return len(zlib.compress(sample, 1)) < len(sample) * SNIFF_RATIO
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Writable file object compressing its data into gzip members of up to
+    ``block_size`` bytes each, compressed by ``workers`` threads at once and
+    written to ``fileobj`` in order.
+
+    As with ``pigz``, the concatenation of the members is a valid gzip file,
+    read by standard tools. Compressing blocks independently costs a little
+    compression ratio.
+    """
+
+    def __init__(self, fileobj, level=6, workers=4, block_size=BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._max_pending = workers * 2  # bounds the memory held by blocks
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="gzip")
+        self._members = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer += b
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[: self.block_size])
+            del self._buffer[: self.block_size]
+            self._submit(block)
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._members:  # empty input is a member too
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            super().close()
+
+    def _submit(self, block):
+        # zlib releases the GIL, so that threads compress in parallel
+        future = self._pool.submit(gzip.compress, block, self.level, mtime=0)
+        self._pending.append(future)
+        self._members += 1
+        while self._pending and (
+            len(self._pending) > self._max_pending or self._pending[0].done()
+        ):
+            self.fileobj.write(self._pending.popleft().result())
+
+
+def check_options(format, level=None):
+    """Raise ``ValueError`` unless archives can be written in given format and
+    compression level, returning the level, which defaults to the format's."""
+    try:
+        spec = FORMATS[format]
+    except KeyError:
+        raise ValueError(f"unsupported archive format {format!r}") from None
+    if format == "tar.zst" and zstandard is None:
+        raise ValueError("zstandard is not installed")
+    level = spec.default if level is None else level
+    if level not in spec.levels:
+        raise ValueError(f"unsupported compression level {level} for {format}")
+    return level
+
+
+def write_archive(
+    fileobj,
+    paths,
+    format="tar.gz",
+    level=None,
+    workers=1,
+    bufsize=None,
+    abort=None,
+):
+    """Write an archive of given files and trees to a file object, each under
+    its base name, in given format and compression level.
+
+    Entries of zip archives are compressed only if ``compressible``, others are
+    stored as they are. Tar archives are compressed by ``workers`` threads. On
+    errors, ``abort()`` is called ahead of flushing the archive, e.g. to drop
+    what would look like a complete archive.
+    """
+    level = check_options(format, level)
+    bufsize = bufsize or tarfile.RECORDSIZE
+
+    if format == "zip":
+        _write_zip(fileobj, paths, level, abort)
+    elif format == "tar.zst":
+        threads = workers if workers > 1 else 0
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        with compressor.stream_writer(fileobj, closefd=False) as writer:
+            _write_tar(writer, paths, bufsize, abort)
+    elif format == "tar.gz" and workers > 1:
+        with ParallelGzipWriter(fileobj, level=level, workers=workers) as gz:
+            _write_tar(gz, paths, bufsize, abort)
+    elif format == "tar.gz":
+        with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level) as gz:
+            _write_tar(gz, paths, bufsize, abort)
+    else:
+        _write_tar(fileobj, paths, bufsize, abort)
+
+
+@contextlib.contextmanager
+def _aborting(abort):
+    try:
+        yield
+    except BaseException:
+        if abort is not None:
+            abort()
+        raise
+
+
+def _write_tar(fileobj, paths, bufsize, abort):
+    tar = tarfile.open(fileobj=fileobj, mode="w|", bufsize=bufsize)
+    with tar, _aborting(abort):
+        for path in paths:
+            tar.add(path, arcname=os.path.basename(path))  # keep path relative
+
+
+def _write_zip(fileobj, paths, level, abort):
+    zf = zipfile.ZipFile(
+        fileobj, mode="w", compresslevel=level or None, strict_timestamps=False
+    )
+    with zf, _aborting(abort):
+        for root in paths:
+            prefix = os.path.dirname(os.path.normpath(root))
+            for path in _walk(root):
+                arcname = os.path.relpath(path, prefix)
+                try:
+                    stats = os.stat(path)
+                except FileNotFoundError:
+                    if path == root:
+                        raise
+                    continue  # dangling symlink, which zip cannot hold
+                if stat.S_ISDIR(stats.st_mode):
+                    zf.write(path, arcname)
+                elif not stat.S_ISREG(stats.st_mode):
+                    continue  # e.g. FIFOs, which zip cannot hold and would block
+                elif level and compressible(path, stats.st_size):
+                    zf.write(path, arcname, compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+
+
+def tree_fingerprint(paths, settle=1.0):
+    """Digest of the names, identities, sizes, modes and times of the entries of
+    given trees, which changes along with their archive. Status change times
+    are part of it, as rewriting a file may restore its modification time.
+
+    Raises ``PermissionError`` if the current user cannot read every entry, as
+    archiving the trees would. Returns None if an entry changed within the last
+    ``settle`` seconds, as it may still be being written.
+    """
+    digest = hashlib.sha256()
+    recent = time.time_ns() - int(settle * 1e9)
+    for root in paths:
+        prefix = os.path.dirname(os.path.normpath(root))
+        for path in _walk(root, strict=True):
+            stats = [os.lstat(path)]
+            if stat.S_ISLNK(stats[0].st_mode):
+                with contextlib.suppress(FileNotFoundError):  # dangling
+                    stats.append(os.stat(path))  # zip archives follow links
+            mode = stats[-1].st_mode
+            wanted = os.R_OK | os.X_OK if stat.S_ISDIR(mode) else os.R_OK
+            if not stat.S_ISLNK(mode) and not os.access(path, wanted):
+                raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), path)
+            fields = [os.path.relpath(path, prefix)]
+            for s in stats:
+                if max(s.st_mtime_ns, s.st_ctime_ns) > recent:
+                    return None
+                fields += (s.st_dev, s.st_ino, s.st_size, s.st_mtime_ns)
+                fields += (s.st_ctime_ns, s.st_mode, s.st_uid, s.st_gid)
+            digest.update("\0".join(map(str, fields)).encode(errors="surrogateescape"))
+            digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _raise(ex):
+    raise ex
+
+
+def _walk(root, strict=False):
+    yield root
+    if os.path.isdir(root):
+        onerror = _raise if strict else None
+        for dirpath, dirnames, filenames in os.walk(root, onerror=onerror):
+            dirnames.sort()
+            for name in sorted(dirnames + filenames):
+                yield os.path.join(dirpath, name)
@@ -0,0 +1,239 @@
+import contextlib
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from src.services.archive import FORMATS
+from src.utils.cache import LRUCache
+from src.utils.inotify import Inotify
+
+__all__ = ("ArchiveCache", "DiskCache", "ListingCache")
+
+logger = logging.getLogger(__name__)
+
+_Listing = namedtuple("_Listing", ("validator", "expires", "value"))
+
+
+def _validator(path):
+    """Identity of a directory which changes along with its entries."""
+    try:
+        stats = os.stat(path)
+    except OSError:
+        return None
+    return stats.st_ino, stats.st_mtime_ns, stats.st_ctime_ns
+
+
+def _size(listings):
+    return sum(len(listing.value) + 1 for listing in listings.values())
+
+
+class ListingCache:
+    """Directory listings kept in memory, bounded by their number of entries.
+
+    Listings of a directory are dropped as soon as inotify reports a change to
+    it, if available. The mtime and ctime of the directory are also checked on
+    every hit, which catches added, removed and renamed entries and permission
+    changes on their own. Changes to the entries themselves, e.g. their size,
+    go unnoticed without inotify until listings expire after ``max_age``.
+    """
+
+    def __init__(self, maxsize, max_age=60, watch=True):
+        self.max_age = max_age
+        self._cache = LRUCache(maxsize, getsizeof=_size, on_evict=self._forget)
+        self._tokens = {}  # path -> token, replaced whenever path changes
+        self._lock = threading.Lock()
+        self._inotify = None
+        if watch:
+            try:
+                self._inotify = Inotify(self.invalidate)
+            except OSError as ex:
+                logger.warning("inotify unavailable, relying on mtimes: %s", ex)
+
+    def fetch(self, path, key, fn):
+        """Get the listing of given directory cached under key, or cache the
+        result of ``fn()`` as such."""
+        path = os.path.normpath(path)
+        validator = _validator(path)
+        if validator is None:
+            return fn()
+        with self._lock:
+            listing = self._cache.get(path, {}).get(key)
+            if (
+                listing is not None
+                and listing.validator == validator
+                and listing.expires > time.monotonic()
+            ):
+                return listing.value
+            token = self._watch(path)  # ahead of listing, not to miss changes
+
+        try:
+            value = fn()
+        finally:
+            with self._lock:
+                stored = False
+                if self._tokens.get(path) is token:  # unchanged meanwhile
+                    expires = time.monotonic() + self.max_age
+                    listings = dict(self._cache.get(path, {}))
+                    listings[key] = _Listing(validator, expires, value)
+                    self._cache[path] = listings
+                    stored = path in self._cache
+                if not stored and path not in self._cache:
+                    self._forget(path)
+        return value
+
+    def invalidate(self, path=None):
+        """Drop cached listings of given directory, or of all of them."""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+                for path in list(self._tokens):
+                    self._forget(path)
+            else:
+                self._cache.pop(path)
+                self._forget(path)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def _watch(self, path):
+        token = self._tokens.get(path)
+        if token is None:
+            token = self._tokens[path] = object()
+            if self._inotify is not None:
+                self._inotify.watch(path)
+        return token
+
+    def _forget(self, path, *_):
+        if self._tokens.pop(path, None) is not None and self._inotify is not None:
+            self._inotify.unwatch(path)
+
+
+class DiskCache:
+    """Files kept in a directory shared by all workers, bounded by their total
+    size in bytes, evicting the least recently used first."""
+
+    # seconds after which partial files are deemed left behind by a worker
+    # which died
+    TMP_MAX_AGE = 3600
+
+    # seconds after which the directory is scanned again for files to evict,
+    # accounting for the files cached by other workers meanwhile
+    EVICT_INTERVAL = 60
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        self._size = 0  # as of the last scan, plus the files cached since
+        self._scanned = None
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """Path of the file cached under given key, or None."""
+        path = os.path.join(self.path, key)
+        try:
+            os.utime(path)  # most recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        for _ in self.store(key, (data,)):
+            pass
+
+    def store(self, key, chunks):
+        """Yield given chunks of a file, caching it under given key once they
+        were all consumed. Files are not cached on errors, e.g. if the client
+        disconnected, whereas failing to cache them is only logged."""
+        tmp = os.path.join(self.path, f".{key}.{uuid.uuid4().hex}.tmp")
+        f, size = self._open(tmp), 0
+        try:
+            for chunk in chunks:
+                if f is not None:
+                    try:
+                        f.write(chunk)
+                    except OSError as ex:
+                        logger.warning("cannot cache %s: %s", key, ex)
+                        f = self._discard(f, tmp)
+                    size += len(chunk)
+                yield chunk
+            if f is not None:
+                f.close()
+                os.replace(tmp, os.path.join(self.path, key))
+                f = None
+                self._added(size)
+        finally:
+            if f is not None:
+                self._discard(f, tmp)
+
+    def evict(self):
+        """Remove the least recently used files in excess of the maximum size,
+        and the partial files left behind."""
+        entries, deadline = [], time.time() - self.TMP_MAX_AGE
+        with os.scandir(self.path) as it:
+            for entry in it:
+                try:
+                    stats = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if not entry.name.startswith("."):
+                    entries.append((stats.st_mtime, stats.st_size, entry.path))
+                elif entry.name.endswith(".tmp") and stats.st_mtime < deadline:
+                    _unlink(entry.path)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxsize:
+                break
+            _unlink(path)
+            total -= size
+        with self._lock:
+            self._size, self._scanned = total, time.monotonic()
+
+    def _added(self, size):
+        with self._lock:
+            self._size += size
+            due = (
+                self._size > self.maxsize
+                or self._scanned is None
+                or time.monotonic() - self._scanned > self.EVICT_INTERVAL
+            )
+        if due:
+            self.evict()
+
+    def _open(self, path):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except OSError as ex:
+            logger.warning("cannot cache %s: %s", path, ex)
+            return None
+        return os.fdopen(fd, "wb")  # closed by the caller, whatever the outcome
+
+    @staticmethod
+    def _discard(f, path):
+        f.close()
+        _unlink(path)
+        return None
+
+
+class ArchiveCache(DiskCache):
+    """Archives kept on disk, keyed by the fingerprint of the trees they hold,
+    e.g. given by ``tree_fingerprint``.
+
+    Archives are shared by all users: users are only given an archive once the
+    fingerprint was computed with their permissions.
+    """
+
+    @staticmethod
+    def key(fingerprint, format, level=None):
+        level = FORMATS[format].default if level is None else level
+        return hashlib.sha256(f"{fingerprint}:{format}:{level}".encode()).hexdigest()
+
+
+def _unlink(path):
+    with contextlib.suppress(FileNotFoundError):  # removed by another worker
+        os.unlink(path)
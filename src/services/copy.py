@@ -0,0 +1,303 @@
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import stat
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+__all__ = ("CopyStats", "copy_tree")
+
+logger = logging.getLogger(__name__)
+
+# files larger than this are split into ranges of this size copied concurrently
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# size of the buffer ranges are copied through
+BUFFER_SIZE = 1024 * 1024
+
+# ioctl sharing the extents of a file with another, on XFS, Btrfs, etc.
+FICLONE = 0x40049409
+
+# errors of strategies the filesystems or kernel do not support
+UNSUPPORTED = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSOCK,  # sendfile to files on macOS
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+}
+
+# number of files copied by each strategy, from reflinks to user space copies
+CopyStats = namedtuple("CopyStats", ("files", "dirs", "bytes", "strategies"))
+
+
+class _File:
+    """File being copied as several ranges, finished by the last one."""
+
+    __slots__ = ("src", "dst", "pending", "failed", "strategy", "lock")
+
+    def __init__(self, src, dst, pending):
+        self.src = src
+        self.dst = dst
+        self.pending = pending
+        self.failed = False
+        self.strategy = None
+        self.lock = threading.Lock()
+
+
+class _TreeCopy:
+    def __init__(self, workers, chunk_size, progress=None, cancelled=None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.cancelled = cancelled
+        self._cancel = False
+        self.files = self.dirs = self.bytes = 0
+        self.strategies = Counter()
+        self.errors = []
+        self.exceptions = []
+        # strategies found unsupported, by device of the source files
+        self._unsupported = {}
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="copy")
+        # bounds the tasks queued ahead of the workers while walking large trees
+        self._slots = threading.BoundedSemaphore(workers * 4)
+        self._lock = threading.Lock()
+
+    def run(self, src, dst):
+        try:
+            if os.path.isdir(src):
+                self._copy_dir(src, dst)
+            else:
+                self._copy_file(src, dst, os.stat(src))
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def _copy_dir(self, src, dst):
+        """Walk the tree, creating directories ahead of copying their files and
+        setting their metadata last, as copying files changes their mtimes."""
+        with os.scandir(src) as it:  # raises as copytree does if not listable
+            entries = list(it)
+        os.mkdir(dst)
+        dirs = [(src, dst)]
+        stack = []
+        dst_dir = dst
+        while True:
+            for entry in entries:
+                src_path = entry.path
+                dst_path = os.path.join(dst_dir, entry.name)
+                try:
+                    stats = entry.stat()  # follows symlinks, as copytree does
+                    if stat.S_ISDIR(stats.st_mode):
+                        os.mkdir(dst_path)
+                        dirs.append((src_path, dst_path))
+                        stack.append((src_path, dst_path))
+                    else:
+                        self._copy_file(src_path, dst_path, stats)
+                except OSError as ex:
+                    self._error(src_path, dst_path, ex)
+            if not stack:
+                break
+            src_dir, dst_dir = stack.pop()
+            try:
+                with os.scandir(src_dir) as it:
+                    entries = list(it)
+            except OSError as ex:
+                self._error(src_dir, dst_dir, ex)
+                entries = ()
+        self._pool.shutdown(wait=True)
+        for src_dir, dst_dir in reversed(dirs):  # children ahead of parents
+            try:
+                shutil.copystat(src_dir, dst_dir)
+            except OSError as ex:
+                self._error(src_dir, dst_dir, ex)
+        self.dirs += len(dirs)
+
+    def _copy_file(self, src, dst, stats):
+        if not stat.S_ISREG(stats.st_mode):  # e.g. FIFOs, which would block
+            raise shutil.SpecialFileError(f"`{src}` is not a regular file")
+        size = stats.st_size
+        unsupported = self._unsupported.setdefault(stats.st_dev, set())
+        if size <= self.chunk_size:
+            self._submit(self._copy_small, src, dst, size, unsupported)
+            return
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            if _clone(fsrc.fileno(), fdst.fileno(), unsupported):
+                shutil.copystat(src, dst)
+                self._done(src, dst, size, "reflink")
+                return
+            fdst.truncate(size)  # ranges are written in any order
+        offsets = range(0, size, self.chunk_size)
+        file = _File(src, dst, len(offsets))
+        for offset in offsets:
+            length = min(self.chunk_size, size - offset)
+            self._submit(self._copy_chunk, file, offset, length, unsupported)
+
+    def _submit(self, fn, *args):
+        self._slots.acquire()
+        if self.cancelled is not None and self.cancelled():
+            self._cancel = True  # skips the files queued so far
+            self._slots.release()
+            raise CancelledError()
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _copy_small(self, src, dst, size, unsupported):
+        if self._cancel:
+            return
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+                if _clone(src_fd, dst_fd, unsupported):
+                    strategy = "reflink"
+                else:
+                    strategy = _copy_range(src_fd, dst_fd, 0, size, unsupported)
+            shutil.copystat(src, dst)
+        except OSError as ex:
+            self._error(src, dst, ex)
+        else:
+            self._done(src, dst, size, strategy)
+
+    def _copy_chunk(self, file, offset, length, unsupported):
+        try:
+            if not file.failed and not self._cancel:
+                with open(file.src, "rb") as fsrc, open(file.dst, "r+b") as fdst:
+                    src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+                    strategy = _copy_range(src_fd, dst_fd, offset, length, unsupported)
+                file.strategy = strategy
+        except OSError as ex:
+            with file.lock:
+                failed, file.failed = file.failed, True
+            if not failed:  # report each file once
+                self._error(file.src, file.dst, ex)
+        with file.lock:
+            file.pending -= 1
+            last = not file.pending and not file.failed
+        if last and not self._cancel:
+            try:
+                shutil.copystat(file.src, file.dst)
+                size = os.path.getsize(file.dst)
+            except OSError as ex:
+                self._error(file.src, file.dst, ex)
+            else:
+                self._done(file.src, file.dst, size, file.strategy)
+
+    def _done(self, src, dst, size, strategy):
+        logger.debug("copied %s to %s with %s", src, dst, strategy)
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.strategies[strategy] += 1
+        if self.progress is not None:
+            self.progress(1, size)
+
+    def _error(self, src, dst, ex):
+        with self._lock:
+            self.errors.append((src, dst, str(ex)))
+            self.exceptions.append(ex)
+
+
+def _clone(src_fd, dst_fd, unsupported):
+    """Share the extents of the source file with the destination, if the
+    filesystem supports it. Returns whether it did."""
+    if "reflink" in unsupported:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as ex:
+        if ex.errno not in UNSUPPORTED:
+            raise
+        unsupported.add("reflink")
+        return False
+    return True
+
+
+def _copy_range(src_fd, dst_fd, offset, length, unsupported):
+    """Copy a range of a file within the kernel if supported, else through user
+    space. Returns the strategy used."""
+    for strategy, copy in _STRATEGIES:
+        if strategy in unsupported:
+            continue
+        try:
+            copy(src_fd, dst_fd, offset, length)
+        except OSError as ex:
+            if ex.errno not in UNSUPPORTED:
+                raise
+            unsupported.add(strategy)  # and copy the whole range again
+        else:
+            return strategy
+    raise AssertionError("user space copies are always supported")
+
+
+def _copy_file_range(src_fd, dst_fd, offset, length):
+    start, end = offset, offset + length
+    while offset < end:
+        copied = os.copy_file_range(src_fd, dst_fd, end - offset, offset, offset)
+        if not copied:
+            if offset == start:  # e.g. on procfs, whose sizes are bogus
+                raise OSError(errno.EINVAL, "nothing copied")
+            raise OSError(f"file shrunk while being copied at offset {offset}")
+        offset += copied
+
+
+def _sendfile(src_fd, dst_fd, offset, length):
+    start, end = offset, offset + length
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while offset < end:
+        sent = os.sendfile(dst_fd, src_fd, offset, end - offset)
+        if not sent:
+            if offset == start:
+                raise OSError(errno.EINVAL, "nothing sent")
+            raise OSError(f"file shrunk while being copied at offset {offset}")
+        offset += sent
+
+
+def _read_write(src_fd, dst_fd, offset, length):
+    buffer = bytearray(min(BUFFER_SIZE, length))
+    view = memoryview(buffer)
+    end = offset + length
+    while offset < end:
+        read = os.preadv(src_fd, [view[: end - offset]], offset)
+        if not read:
+            raise OSError(f"file shrunk while being copied at offset {offset}")
+        written = 0
+        while written < read:
+            written += os.pwrite(dst_fd, view[written:read], offset + written)
+        offset += read
+
+
+_STRATEGIES = (("sendfile", _sendfile), ("read_write", _read_write))
+if hasattr(os, "copy_file_range"):  # Linux only
+    _STRATEGIES = (("copy_file_range", _copy_file_range),) + _STRATEGIES
+
+
+def copy_tree(
+    src, dst, workers=8, chunk_size=CHUNK_SIZE, progress=None, cancelled=None
+):
+    """Copy a file or a directory tree along with their metadata, the way
+    ``shutil.copy2`` and ``shutil.copytree`` do, with a pool of threads.
+
+    Files are cloned if the filesystem supports reflinks, else copied within the
+    kernel with ``copy_file_range`` or ``sendfile`` if possible, else through
+    user space; the returned stats count the files copied by each strategy.
+    Files larger than ``chunk_size`` are split into ranges copied concurrently.
+    Errors do not stop the copy of other files: they are all raised at the end
+    as a ``shutil.Error`` listing ``(src, dst, reason)`` tuples, unless copying
+    a single file. Special files, e.g. FIFOs, are reported as errors rather
+    than opened.
+
+    ``progress(files, size)`` is called as files are copied, from any thread.
+    The copy stops with ``CancelledError`` once ``cancelled()`` returns true,
+    which is checked ahead of every file, leaving the files copied so far.
+    """
+    copy = _TreeCopy(workers, chunk_size, progress=progress, cancelled=cancelled)
+    copy.run(os.fspath(src), os.fspath(dst))
+    if copy.errors and not copy.dirs:
+        raise copy.exceptions[0]
+    if copy.errors:
+        raise shutil.Error(copy.errors)
+    return CopyStats(copy.files, copy.dirs, copy.bytes, dict(copy.strategies))
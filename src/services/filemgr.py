@@ -1,38 +1,241 @@
+import contextvars
+import functools
+import itertools
 import os
-import re
+import stat
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-from src.services.filesystem import FilesystemSvc
+from src import utils
+from src.api.auth import current_username
+from src.services.filesystem import FilesystemSvc, SORT_KEYS
 
-__all__ = ("FileManagerSvc",)
+__all__ = ("BATCH_OPERATIONS", "FileManagerSvc")
+
+# operations run by batches, over a path and a target path for renames
+BATCH_OPERATIONS = ("stat", "exists", "mkdir", "delete", "rename")
 
 
 class FileManagerSvc(FilesystemSvc):
     @staticmethod
     def list(path, show_hidden=False, substr=None):
         """Override"""
-        regex = rf".*{(substr or '').strip('*')}.*"
+        match = utils.name_matcher(substr)
         files = FilesystemSvc.list(path, show_hidden=show_hidden)
-        return [file for file in files if re.match(regex, file.name)]
+        return [file for file in files if match(file.name)]
+
+    @classmethod
+    def scan(cls, path, show_hidden=False):
+        """List entries of given directory along with their stats."""
+        entries = FilesystemSvc.scan(path, show_hidden=show_hidden)
+        return [
+            cls.stats_mapper(entry, stats=stats, has_child=has_child)
+            for entry, stats, has_child in entries
+        ]
+
+    @classmethod
+    def search(cls, path, pattern, index=None, limit=None, **kwargs):
+        """Search the tree under given directory for names matching pattern.
+        The search index is used instead of walking the tree if it covers it."""
+        if index is not None and index.covers(path):
+            entries = cls.search_index(index, path, pattern, limit=limit, **kwargs)
+        else:
+            entries = FilesystemSvc.search(path, pattern, limit=limit, **kwargs)
+        return [
+            cls.stats_mapper(entry, stats=stats, has_child=has_child)
+            for entry, stats, has_child in entries
+        ]
+
+    @staticmethod
+    def search_index(
+        index,
+        path,
+        pattern,
+        case_sensitive=False,
+        show_hidden=False,
+        max_depth=None,
+        limit=None,
+        batch_size=500,
+        **_,
+    ):
+        FilesystemSvc.check_dir(path)
+        candidates = index.lookup(
+            path,
+            pattern,
+            case_sensitive=case_sensitive,
+            show_hidden=show_hidden,
+            max_depth=max_depth,
+        )
+        entries = []
+        while limit is None or len(entries) < limit:
+            batch = list(itertools.islice(candidates, batch_size))
+            if not batch:
+                break
+            entries.extend(FilesystemSvc.visible(batch))  # as the user
+        return sorted(entries[:limit])
+
+    @classmethod
+    def scan_page(
+        cls,
+        path,
+        show_hidden=False,
+        sort_by=None,
+        reverse=False,
+        limit=None,
+        cursor=None,
+        cache=None,
+        lazy=False,
+    ):
+        """List a page of entries of given directory along with their stats.
+        Returns the page and the cursor to the next one, if any. Whether
+        directories have entries is looked up lazily if requested."""
+        if limit is not None or cursor is not None:
+            sort_by = sort_by or "name"  # pages require an order
+        children = limit is None  # otherwise only looked up for the page
+        scan = functools.partial(
+            FilesystemSvc.scan,
+            path,
+            show_hidden=show_hidden,
+            children=children,
+            lazy=lazy,
+        )
+        if cache is not None:
+            user = str(current_username) if current_username else None
+            entries = cache.fetch(path, (user, show_hidden, children, lazy), scan)
+        else:
+            entries = scan()
+        entries, cursor = utils.paginate(
+            entries,
+            key=SORT_KEYS.get(sort_by),
+            limit=limit,
+            cursor=cursor,
+            reverse=reverse,
+        )
+        if not children:
+            dirs = [e[0] for e in entries if stat.S_ISDIR(e[1].st_mode)]
+            found = FilesystemSvc.has_children(dirs, lazy=lazy) if dirs else ()
+            found = dict(zip(dirs, found))
+            entries = [(e[0], e[1], found.get(e[0], False)) for e in entries]
+        files = [
+            cls.stats_mapper(entry, stats=stats, has_child=has_child)
+            for entry, stats, has_child in entries
+        ]
+        return files, cursor
 
     @classmethod
     def stats(cls, path) -> dict:
         """Override"""
-        return cls.stats_mapper(path, stats=FilesystemSvc.stats(path))
+        stats = FilesystemSvc.stats(path)
+        has_child = stat.S_ISDIR(stats.st_mode) and FilesystemSvc.has_child(path)
+        return cls.stats_mapper(path, stats=stats, has_child=has_child)
+
+    @classmethod
+    def batch(cls, operations, workers=8, volumes=(), ordered=False):
+        """Run given operations concurrently, by a pool of threads running in
+        the context of the caller. Returns the outcome of each operation in
+        order, as a tuple of its result and of the exception it raised.
+
+        Operations run in no particular order, so they may not change a path
+        another operation touches, or an ancestor of it, which raises
+        ``ValueError``. Given ``ordered``, they run one after the other instead.
+
+        Renames take a target path, relative to the directory of the path, and
+        never replace an existing target.
+        """
+        if ordered:
+            workers = 1
+        elif _overlapping(operations):
+            raise ValueError("operations changing paths touched by others")
+
+        def run(operation):
+            try:
+                return cls._run_operation(volumes=volumes, **operation), None
+            except (OSError, ValueError) as ex:
+                return None, ex
+
+        workers = max(1, min(workers, len(operations)))
+        with ThreadPoolExecutor(workers, thread_name_prefix="batch") as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, run, operation)
+                for operation in operations
+            ]
+            return [future.result() for future in futures]
+
+    @classmethod
+    def _run_operation(cls, op, path, target=None, volumes=()):
+        if op == "stat":
+            return cls.stats(path)
+        elif op == "exists":
+            return cls.exists(path)
+        elif op == "mkdir":
+            cls.mkdir(path)
+            return cls.stats(path)
+        elif op == "delete":
+            cls.delete(path, volumes=volumes)
+            return None
+        elif op == "rename":
+            target = os.path.join(os.path.dirname(path), target)
+            cls.rename(path, target, replace=False)
+            return cls.stats(target)
+        raise ValueError(f"unsupported operation {op!r}")
 
     @staticmethod
-    def stats_mapper(path: str, stats: os.stat_result) -> dict:
-        path = Path(path)
+    def stats_mapper(path: str, stats: os.stat_result, has_child=False) -> dict:
+        parent, name = os.path.split(path)
+        if os.path.isabs(parent) and name not in ("", "."):
+            parent = _posix_dir(parent)  # as pathlib does, only once per directory
+            filter_path = parent if parent.endswith("/") else f"{parent}/"
+            path = f"{filter_path}{name}"
+        else:
+            path = Path(path)
+            name, path, filter_path = (
+                path.name,
+                path.as_posix(),
+                os.path.join(path.parent, ""),
+            )
+        dot = name.rfind(".")
         return {
-            "name": path.name,
-            "path": path.as_posix(),
-            "filterPath": os.path.join(path.parent, ""),
+            "name": name,
+            "path": path,
+            "filterPath": filter_path,
             "size": stats.st_size,
-            "isFile": not path.is_dir(),
+            "isFile": not stat.S_ISDIR(stats.st_mode),
             "dateModified": datetime.fromtimestamp(stats.st_mtime),
             "dateCreated": datetime.fromtimestamp(stats.st_ctime),
-            "type": path.suffix,
-            "hasChild": bool(next(path.iterdir(), False)) if path.is_dir() else False,
+            "type": name[dot:] if 0 < dot < len(name) - 1 else "",
+            "hasChild": has_child,
             "mode": stats.st_mode,
         }
+
+
+@functools.lru_cache(maxsize=1024)
+def _posix_dir(path):
+    return Path(path).as_posix()
+
+
+def _overlapping(operations):
+    """Whether an operation changes a path another operation touches, or an
+    ancestor of such a path."""
+    touched = {}
+    for operation in operations:
+        path = operation["path"]
+        paths = [path]
+        if operation.get("target") is not None:
+            paths.append(os.path.join(os.path.dirname(path), operation["target"]))
+        changes = operation.get("op", "stat") not in ("stat", "exists")
+        for p in paths:
+            key = tuple(os.path.normpath(p).split(os.sep))
+            count, changed = touched.get(key, (0, False))
+            if count and (changed or changes):
+                return True
+            touched[key] = (count + 1, changed or changes)
+    ancestors = []  # of the current path, none changing but the last one
+    for key in sorted(touched):
+        changes = touched[key][1]
+        while ancestors and key[: len(ancestors[-1][0])] != ancestors[-1][0]:
+            ancestors.pop()
+        if ancestors and (changes or ancestors[-1][1]):
+            return True
+        ancestors.append((key, changes))
+    return False
@@ -1,15 +1,61 @@
+import contextlib
+import ctypes
+import errno
+import fcntl
 import io
-import tarfile
 import os
 import re
 import shutil
+import stat
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from impersonation import impersonate
-
 from src.api.auth import current_username
+from src.services.archive import tree_fingerprint, write_archive
+from src.services.copy import copy_tree
+from src.services.thumbnails import make_thumbnail
+from src.services.trash import move_to_trash, purge_tree
+from src.utils import name_matcher, streams
+from src.utils.cache import LRUCache
+from src.utils.impersonation import impersonate
+
+# keys to sort scanned entries by, ties being broken by name
+SORT_KEYS = {
+    "name": lambda entry: (os.path.basename(entry[0]),),
+    "size": lambda entry: (entry[1].st_size, os.path.basename(entry[0])),
+    "dateModified": lambda entry: (entry[1].st_mtime, os.path.basename(entry[0])),
+}
+
+# renameat2 flag failing renames to existing paths, rather than replacing them
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+try:
+    _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+except (AttributeError, OSError):  # not Linux, or glibc older than 2.28
+    _renameat2 = None
+else:
+    _renameat2.argtypes = (ctypes.c_int, ctypes.c_char_p) * 2 + (ctypes.c_uint,)
+
+# staged uploads: their content, the record of chunks received and their lock,
+# named after the file, the upload id and the total of chunks
+_STAGING_SUFFIXES = (".upload", ".chunks", ".lock")
+_STAGED = re.compile(r"(\..+\.[\w-]*-\d+)\.(?:upload|chunks|lock)")
+
+# whether directories have entries, by their identity and status change time,
+# which changes along with their entries and permissions
+_children = LRUCache(100_000)
 
-__all__ = ("FilesystemSvc",)
+__all__ = (
+    "FilesystemSvc",
+    "SORT_KEYS",
+    "stream_attachment",
+    "stream_chunk",
+    "stream_file",
+    "stream_upload",
+    "upload_writer",
+)
 
 
 @impersonate(username=current_username)
@@ -21,15 +67,237 @@ class FilesystemSvc:
             regex = "".join((r"^(?!\.)", regex))
         return [p for p in Path(path).iterdir() if re.match(regex, p.name)]
 
+    @staticmethod
+    def scan(path, show_hidden=False, children=True, lazy=False):
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if not show_hidden and entry.name.startswith("."):
+                    continue
+                try:
+                    stats = entry.stat()
+                except FileNotFoundError:  # dangling symlink
+                    stats = entry.stat(follow_symlinks=False)
+                is_dir = stat.S_ISDIR(stats.st_mode)
+                has_child = (
+                    children and is_dir and _has_child(entry.path, stats, lazy=lazy)
+                )
+                entries.append((entry.path, stats, has_child))
+        return entries
+
+    @staticmethod
+    def search(
+        path,
+        pattern,
+        case_sensitive=False,
+        show_hidden=False,
+        max_depth=None,
+        limit=None,
+        workers=8,
+    ):
+        """Search the tree under given directory for names matching pattern,
+        one level of the tree at a time, whose directories are scanned by a
+        pool of threads.
+
+        Given a limit, the matches closest to the root are kept, ties being
+        broken by path, so that a search always returns the same matches.
+        """
+        match = name_matcher(pattern, case_sensitive=case_sensitive)
+        args = (match, show_hidden, max_depth)
+        matches, level, depth = _search_dir(path, 0, *args, root=True)
+        found = sorted(matches)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while level and (limit is None or len(found) < limit):
+                depth += 1
+                futures = [pool.submit(_search_dir, d, depth, *args) for d in level]
+                matches, level = [], []
+                for future in futures:
+                    dir_matches, subdirs, _ = future.result()
+                    matches.extend(dir_matches)
+                    level.extend(subdirs)
+                found.extend(sorted(matches))
+        return sorted(found[:limit])
+
+    @staticmethod
+    def visible(paths):
+        """Keep the paths whose parent directory the user can list."""
+        entries = []
+        listable = {}
+        for path in paths:
+            parent = os.path.dirname(path)
+            if parent not in listable:
+                listable[parent] = os.access(parent, os.R_OK | os.X_OK)
+            if not listable[parent]:
+                continue
+            try:
+                stats = os.stat(path)
+            except FileNotFoundError:
+                try:
+                    stats = os.lstat(path)  # dangling symlink
+                except FileNotFoundError:
+                    continue  # gone since indexed
+            has_child = stat.S_ISDIR(stats.st_mode) and _has_child(path, stats)
+            entries.append((path, stats, has_child))
+        return entries
+
     @staticmethod
     def stats(path) -> os.stat_result:
         return Path(path).stat()
 
+    @staticmethod
+    def has_child(path):
+        try:
+            stats = os.stat(path)
+        except OSError:
+            return False
+        return stat.S_ISDIR(stats.st_mode) and _has_child(path, stats)
+
+    @staticmethod
+    def has_children(paths, lazy=False):
+        found = []
+        for path in paths:
+            try:
+                stats = os.stat(path)
+            except OSError:
+                found.append(False)
+                continue
+            is_dir = stat.S_ISDIR(stats.st_mode)
+            found.append(is_dir and _has_child(path, stats, lazy=lazy))
+        return found
+
+    @staticmethod
+    def file_stats(path) -> os.stat_result:
+        with open(path, "rb") as f:  # ensure the file can be read
+            return os.fstat(f.fileno())
+
+    @staticmethod
+    def read(path, offset=0, channel=None):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            writer = streams.ConnectionWriter(channel)
+            shutil.copyfileobj(f, writer, streams.CHUNK_SIZE)
+
     @staticmethod
     def create(path, content=b""):
         f = Path(path)
         f.write_bytes(content)
 
+    @classmethod
+    def write(cls, path, channel=None):
+        cls.commit(cls.write_temp(path, channel=channel), path)
+
+    @staticmethod
+    def write_temp(path, channel=None):
+        """Write the content received through channel to a temporary file next
+        to path, whose name is returned for it to be committed."""
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with open(fd, "wb") as f:
+                reader = streams.ConnectionReader(channel)
+                shutil.copyfileobj(reader, f, streams.CHUNK_SIZE)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return str(tmp)
+
+    @staticmethod
+    def commit(tmp, path, replace=True):
+        """Swap in the temporary file written for path, which gets replaced if
+        it exists, unless told not to. The temporary file is removed if that
+        fails."""
+        path = Path(path)
+        try:
+            if not replace:
+                _rename_noreplace(tmp, path)
+                return
+            if path.exists():  # keep permissions of the file being replaced
+                os.chmod(tmp, stat.S_IMODE(path.stat().st_mode))
+            os.replace(tmp, path)  # atomically swap in the new content
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def discard(tmp):
+        """Remove a temporary file which is not to be committed."""
+        Path(tmp).unlink(missing_ok=True)
+
+    @classmethod
+    def write_chunk(cls, path, index, offset, total, upload_id="", channel=None):
+        """Write a chunk of an upload at given offset, and assemble the file once
+        all ``total`` chunks are in place.
+
+        Chunks are staged by upload id and total, apart from other uploads of
+        the same name. They are written concurrently, while recording them and
+        assembling the file is done by one request at a time.
+        """
+        staging, received, lock = _staging_paths(path, total, upload_id)
+        with _locked(lock, fcntl.LOCK_SH):
+            try:
+                fd = os.open(staging, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            except FileExistsError:  # never truncated, as chunks are in there
+                fd = os.open(staging, os.O_WRONLY)
+            with open(fd, "wb") as f:
+                f.seek(offset)
+                reader = streams.ConnectionReader(channel)
+                shutil.copyfileobj(reader, f, streams.CHUNK_SIZE)
+                size = f.tell() - offset
+        with _locked(lock, fcntl.LOCK_EX):
+            with open(received, "a") as f:
+                f.write(f"{index} {offset} {size}\n")
+            chunks = _read_chunks(received)
+            if sorted(chunks) == list(range(total)):  # all chunks are in place
+                try:
+                    _check_chunks(staging, chunks)
+                    os.replace(staging, path)
+                finally:
+                    staging.unlink(missing_ok=True)
+                    received.unlink()
+                    lock.unlink()
+        return sorted(chunks)
+
+    @classmethod
+    def uploaded_chunks(cls, path, total=None, upload_id=""):
+        """Indexes of the chunks received of the latest upload of given file
+        under given id, and of given total if any."""
+        latest = (0, [])
+        for _, received, _ in _staged_uploads(path, upload_id, total):
+            try:
+                mtime = os.stat(received).st_mtime_ns
+                chunks = sorted(_read_chunks(received))
+            except FileNotFoundError:  # completed meanwhile
+                continue
+            latest = max(latest, (mtime, chunks))
+        return latest[1]
+
+    @classmethod
+    def discard_chunks(cls, path, upload_id=None):
+        """Remove the chunks of all uploads of given file, or only of those
+        under given id."""
+        for paths in _staged_uploads(path, upload_id):
+            for p in paths:
+                p.unlink(missing_ok=True)
+
+    @staticmethod
+    def expire_uploads(path, max_age):
+        """Remove the chunks of the uploads into given directory which were not
+        written to for ``max_age`` seconds, e.g. abandoned ones."""
+        deadline = time.time() - max_age
+        with os.scandir(path) as it:
+            prefixes = {m[1] for entry in it if (m := _STAGED.fullmatch(entry.name))}
+        for prefix in prefixes:
+            staging, received, lock = (
+                Path(path, f"{prefix}{suffix}") for suffix in _STAGING_SUFFIXES
+            )
+            # uploads in progress hold their lock
+            operation = fcntl.LOCK_EX | fcntl.LOCK_NB
+            with contextlib.suppress(BlockingIOError), _locked(lock, operation):
+                if max(_mtime(staging), _mtime(received)) < deadline:
+                    for p in (staging, received, lock):
+                        p.unlink(missing_ok=True)
+
     @staticmethod
     def mkdir(path):
         Path(path).mkdir()
@@ -39,33 +307,68 @@ class FilesystemSvc:
         return Path(path).exists()
 
     @staticmethod
-    def delete(path):
+    def delete(path, volumes=(), recursive=False):
+        """Delete a file or a directory. Non-empty directories are moved to the
+        trash of their volume if among given ones, to be purged in the
+        background, else only removed along with their tree if recursive."""
         p = Path(path)
-        if p.is_dir():
-            p.rmdir()
-        else:
+        if not p.is_dir() or p.is_symlink():
             p.unlink()
+            return
+        try:
+            p.rmdir()
+        except OSError as ex:
+            if ex.errno != errno.ENOTEMPTY:
+                raise
+            if move_to_trash(path, volumes):
+                return
+            if not recursive:
+                raise
+            shutil.rmtree(path)
+
+    @staticmethod
+    def purge(path, workers=4, rate=0):
+        """Remove the entries of given trash directory."""
+        for name in os.listdir(path):
+            purge_tree(os.path.join(path, name), workers=workers, rate=rate)
 
     @classmethod
-    def move(cls, src, dst):
+    def move(cls, src, dst, target=None):
+        """Move src within directory dst, under a name made unique if taken,
+        or to the exact target path if given."""
         src = Path(src)
-        dst = cls.rename_duplicates(dst=dst, filename=src.name)
+        dst = target or cls.rename_duplicates(dst=dst, filename=src.name)
         shutil.move(src, dst)
         return dst
 
     @staticmethod
-    def rename(src, dst):
-        Path(src).rename(dst)
+    def rename(src, dst, replace=True):
+        """Rename src to dst, which gets replaced if it exists, unless told not
+        to, failing then with ``FileExistsError``."""
+        if replace:
+            Path(src).rename(dst)
+        else:
+            _rename_noreplace(src, dst)
 
     @classmethod
-    def copy(cls, src, dst):
+    def copy(cls, src, dst, workers=8, target=None, channel=None):
+        """Copy src within directory dst, under a name made unique if taken, or
+        to the exact target path if given. Progress is reported through the
+        channel if any, which is also listened to for cancellation.
+
+        Returns the path copied to, along with the number of files copied by
+        each strategy, e.g. reflinks or ``copy_file_range``.
+        """
         src = Path(src)
-        dst = cls.rename_duplicates(dst=dst, filename=src.name)
-        if src.is_dir():
-            shutil.copytree(src, dst)
-        else:
-            shutil.copy2(src, dst)
-        return dst
+        dst = target or cls.rename_duplicates(dst=dst, filename=src.name)
+        progress = cancelled = None
+        if channel is not None:
+            progress = streams.Progress(channel)
+            cancelled = progress.cancelled
+        stats = copy_tree(
+            src, dst, workers=workers, progress=progress, cancelled=cancelled
+        )
+        return dst, stats.strategies
 
     @classmethod
     def rename_duplicates(cls, dst, filename, count=0):
@@ -81,15 +384,222 @@ class FilesystemSvc:
             return path
 
     @staticmethod
-    def create_attachment(paths=()):
-        obj = io.BytesIO()
-        with tarfile.open(fileobj=obj, mode="w|gz") as tar:
-            for path in paths:
-                arch_name = os.path.basename(path)  # keep path relative
-                tar.add(path, arcname=arch_name)
-        obj.seek(0)
-        return obj
+    def create_attachment(
+        paths=(), channel=None, format="tar.gz", level=None, workers=1
+    ):
+        writer = streams.ConnectionWriter(channel)
+        # buffered, so that errors on the first files are raised ahead of data
+        with io.BufferedWriter(writer, streams.CHUNK_SIZE) as fileobj:
+            write_archive(
+                fileobj,
+                paths,
+                format=format,
+                level=level,
+                workers=workers,
+                abort=writer.discard,  # do not flush a truncated archive
+            )
+
+    @staticmethod
+    def fingerprint(paths=()):
+        """Fingerprint of given trees as the current user, see
+        ``tree_fingerprint``."""
+        return tree_fingerprint(paths)
+
+    @staticmethod
+    def thumbnail(path, size):
+        """Thumbnail of given image as the current user, see
+        ``make_thumbnail``."""
+        return make_thumbnail(path, size)
+
+    @staticmethod
+    def check_dir(path):
+        with os.scandir(path):  # raises as listing the directory would
+            pass
 
     @staticmethod
     def is_file(path):
         return Path(path).is_file()
+
+
+def _has_child(path, stats=None, lazy=False):
+    """Whether given directory has any entry. Directories are only opened when
+    the answer is not known from their stats; a lazy lookup never opens them,
+    optimistically assuming unknown ones do have entries."""
+    if stats is not None:
+        # subdirectories link back to their parent on most filesystems
+        if stats.st_nlink > 2 and os.access(path, os.R_OK):
+            return True
+        key = (stats.st_dev, stats.st_ino, stats.st_ctime_ns)
+        found = _children.get(key)
+        if found is not None:
+            return found
+        if lazy:
+            return True
+    try:
+        with os.scandir(path) as it:
+            found = next(it, None) is not None
+    except PermissionError:
+        found = False
+    # changes in the same clock tick as the lookup may share its ctime
+    if stats is not None and time.time() - stats.st_ctime > 1:
+        _children[key] = found
+    return found
+
+
+def _search_dir(path, depth, match, show_hidden, max_depth, root=False):
+    matches, subdirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if not show_hidden and entry.name.startswith("."):
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if match(entry.name):
+                    try:
+                        stats = entry.stat()
+                    except FileNotFoundError:  # dangling symlink
+                        stats = entry.stat(follow_symlinks=False)
+                    has_child = is_dir and _has_child(entry.path)
+                    matches.append((entry.path, stats, has_child))
+                if is_dir and (max_depth is None or depth < max_depth):
+                    subdirs.append(entry.path)
+    except (FileNotFoundError, PermissionError):
+        if root:
+            raise  # only the subtree the user cannot access is skipped
+    return matches, subdirs, depth
+
+
+def _rename_noreplace(src, dst):
+    if _renameat2 is not None:
+        src, dst = os.fsencode(src), os.fsencode(dst)
+        if not _renameat2(AT_FDCWD, src, AT_FDCWD, dst, RENAME_NOREPLACE):
+            return
+        err = ctypes.get_errno()
+        if err not in (errno.EINVAL, errno.ENOSYS):  # else unsupported here
+            raise OSError(err, os.strerror(err), src, None, dst)
+    if not os.path.isdir(src) or os.path.islink(src):
+        os.link(src, dst, follow_symlinks=False)  # fails if dst exists
+        os.unlink(src)
+        return
+    if os.path.lexists(dst):  # directories cannot be linked
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.rename(src, dst)
+
+
+def _staging_paths(path, total, upload_id=""):
+    """Paths of the content, of the record of received chunks and of the lock
+    of an upload."""
+    path = Path(path)
+    prefix = f".{path.name}.{upload_id}-{total}"
+    return tuple(path.with_name(f"{prefix}{suffix}") for suffix in _STAGING_SUFFIXES)
+
+
+def _staged_uploads(path, upload_id=None, total=None):
+    """Staging paths of the uploads of given file, or of those under given id
+    and of given total."""
+    path = Path(path)
+    pattern = re.compile(
+        re.escape(f".{path.name}.")
+        + (re.escape(upload_id) if upload_id is not None else r"[\w-]*")
+        + "-"
+        + (str(total) if total is not None else r"\d+")
+        + r"\.chunks"
+    )
+    with os.scandir(path.parent) as it:
+        names = [entry.name for entry in it]
+    for name in names:
+        if pattern.fullmatch(name):
+            staged_id, _, staged_total = name[len(path.name) + 2 : -7].rpartition("-")
+            yield _staging_paths(path, int(staged_total), staged_id)
+
+
+def _read_chunks(received):
+    """Offsets and sizes of the chunks received, by their index."""
+    chunks = {}
+    with open(received) as f:
+        for line in f:
+            index, offset, size = map(int, line.split())
+            chunks[index] = (offset, size)
+    return chunks
+
+
+def _check_chunks(staging, chunks):
+    """Raise ``ValueError`` unless given chunks fill the staged file."""
+    end = 0
+    for offset, size in sorted(chunks.values()):
+        if offset != end:
+            break
+        end += size
+    else:
+        if os.stat(staging).st_size == end:
+            return
+    raise ValueError(f"chunks of {staging} do not add up")
+
+
+def _mtime(path):
+    """Modification time of given file, 0 if it does not exist."""
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+@contextlib.contextmanager
+def _locked(path, operation):
+    """Hold a lock of given file, which its holders unlink once done with it."""
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, operation)
+            with contextlib.suppress(FileNotFoundError):
+                if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                    break
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)  # unlinked meanwhile, lock the new file
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+def stream_attachment(paths=(), format="tar.gz", level=None, workers=1):
+    """Stream an archive of given paths as it gets built."""
+    return streams.iter_call(
+        FilesystemSvc.create_attachment,
+        paths=paths,
+        format=format,
+        level=level,
+        workers=workers,
+    )
+
+
+def stream_file(path):
+    """Stream the content of given file, from any offset it is seeked to."""
+    return streams.LazyStream(FilesystemSvc.read, path=path)
+
+
+def stream_upload(path, stream):
+    """Write the content of given stream to path, one chunk at a time."""
+    streams.feed_call(FilesystemSvc.write, stream, path=path)
+
+
+def upload_writer(path):
+    """File object writing to a temporary file next to path, whose name is its
+    result, to be committed once complete."""
+    return streams.FeedWriter(FilesystemSvc.write_temp, path=path)
+
+
+def stream_chunk(path, stream, index, offset, total, upload_id=""):
+    """Write a chunk of an upload at given offset, returning the indexes of
+    the chunks received so far."""
+    return streams.feed_call(
+        FilesystemSvc.write_chunk,
+        stream,
+        path=path,
+        index=index,
+        offset=offset,
+        total=total,
+        upload_id=upload_id,
+    )
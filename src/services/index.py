@@ -0,0 +1,230 @@
+import contextlib
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from src.utils import name_matcher
+
+__all__ = ("SearchIndex",)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir);
+"""
+
+# trigram index over names, kept in sync with the entries table
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, name)
+    VALUES ('delete', old.id, old.name);
+END;
+"""
+
+# number of directories refreshed per transaction
+COMMIT_EVERY = 1000
+
+
+class SearchIndex:
+    """Filename index over the trees under given roots, stored in SQLite.
+
+    The index is refreshed incrementally: only directories whose mtime changed
+    since the previous scan are listed again. It is built with the identity of
+    the service, so lookups only yield candidates that still have to be checked
+    against the permissions of the user searching.
+    """
+
+    def __init__(self, db_path, roots=()):
+        self.db_path = db_path
+        self.roots = tuple(os.path.normpath(root) for root in roots)
+        self._lock = None
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:  # trigram tokenizer not available
+                logger.warning("SQLite FTS5 trigrams unavailable, using full scans")
+                self.fts = False
+
+    @contextlib.contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        with contextlib.closing(connection) as conn, conn:  # commit on success
+            yield conn
+
+    def covers(self, path):
+        path = os.path.normpath(path)
+        return any(
+            path == r or path.startswith(os.path.join(r, "")) for r in self.roots
+        )
+
+    def start(self, interval=300):
+        """Refresh the index periodically in the background. Only one process
+        sharing the database gets to refresh it at a time."""
+        thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        thread.start()
+        return self
+
+    def _run(self, interval):
+        while True:
+            if self._acquire():
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("failed to refresh search index")
+            time.sleep(interval)
+
+    def _acquire(self):
+        if self._lock is None:
+            fd = os.open(f"{self.db_path}.lock", os.O_WRONLY | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._lock = fd  # held for as long as the process lives
+        return True
+
+    def refresh(self):
+        with self.connect() as conn:
+            for root in self.roots:
+                self._refresh(conn, root)
+
+    def _refresh(self, conn, root):
+        prefix = os.path.join(root, "")
+        known = dict(
+            conn.execute(
+                "SELECT path, mtime_ns FROM dirs "
+                "WHERE path = ? OR substr(path, 1, ?) = ?",
+                (root, len(prefix), prefix),
+            )
+        )
+        seen = set()
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns  # taken ahead of listing
+            except OSError:
+                continue
+            seen.add(path)
+            if known.get(path) == mtime_ns:
+                rows = conn.execute(
+                    "SELECT name FROM entries WHERE dir = ? AND is_dir", (path,)
+                )
+                stack.extend(os.path.join(path, name) for name, in rows)
+                continue
+
+            try:
+                with os.scandir(path) as it:
+                    entries = [(e.name, e.is_dir(follow_symlinks=False)) for e in it]
+            except OSError:
+                continue
+            skipped = [name for name, _ in entries if not _encodable(name)]
+            if skipped:  # SQLite text is UTF-8
+                logger.warning(
+                    "not indexing %d names of %s which are not UTF-8: %s",
+                    len(skipped),
+                    path,
+                    ", ".join(ascii(name) for name in skipped),
+                )
+                entries = [entry for entry in entries if _encodable(entry[0])]
+            conn.execute("DELETE FROM entries WHERE dir = ?", (path,))
+            conn.executemany(
+                "INSERT INTO entries (dir, name, is_dir) VALUES (?, ?, ?)",
+                ((path, name, is_dir) for name, is_dir in entries),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)",
+                (path, mtime_ns),
+            )
+            stack.extend(os.path.join(path, name) for name, is_dir in entries if is_dir)
+            if len(seen) % COMMIT_EVERY == 0:
+                conn.commit()
+
+        for path in known.keys() - seen:  # directories that are gone
+            conn.execute("DELETE FROM entries WHERE dir = ?", (path,))
+            conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+        conn.commit()
+
+    def lookup(
+        self,
+        path,
+        pattern,
+        case_sensitive=False,
+        show_hidden=False,
+        max_depth=None,
+    ):
+        """Iterate over indexed paths under given directory whose names match
+        pattern."""
+        path = os.path.normpath(path)
+        prefix = os.path.join(path, "")
+        match = name_matcher(pattern, case_sensitive=case_sensitive)
+
+        query = "SELECT dir, name FROM entries WHERE (dir = ? OR substr(dir, 1, ?) = ?)"
+        params = [path, len(prefix), prefix]
+        like = _like(pattern)
+        if like is not None:
+            if self.fts:
+                query += (
+                    " AND id IN (SELECT rowid FROM entries_fts "
+                    "WHERE name LIKE ? ESCAPE '\\')"
+                )
+            else:
+                query += " AND name LIKE ? ESCAPE '\\'"
+            params.append(like)
+
+        with self.connect() as conn:
+            for dirname, name in conn.execute(query, params):
+                if not match(name):
+                    continue
+                parts = os.path.relpath(dirname, path).split(os.sep)
+                parts = [] if parts == ["."] else parts
+                if max_depth is not None and len(parts) > max_depth:
+                    continue
+                if not show_hidden and any(p.startswith(".") for p in (*parts, name)):
+                    continue
+                yield os.path.join(dirname, name)
+
+
+def _encodable(name):
+    """Whether given name, as decoded from the filesystem, is valid UTF-8."""
+    try:
+        name.encode()
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _like(pattern):
+    """Translate a glob pattern into a case insensitive LIKE pattern matching a
+    superset of the same names, if possible."""
+    pattern = pattern or "*"
+    if "[" in pattern:
+        return None
+    if not any(c in pattern for c in "*?"):
+        pattern = f"*{pattern}*"
+    for char in ("\\", "%", "_"):
+        pattern = pattern.replace(char, f"\\{char}")
+    return pattern.replace("*", "%").replace("?", "_")
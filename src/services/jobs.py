@@ -0,0 +1,377 @@
+import contextlib
+import errno
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from flask import g
+
+from src.services.filemgr import FileManagerSvc
+from src.utils import streams
+
+__all__ = ("JobManager", "JobStore")
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("copy", "move", "delete", "archive")
+
+# states of jobs and of their items, the former being final
+FINAL = ("done", "failed", "cancelled")
+PENDING = ("queued", "running")
+
+# seconds between saves of the progress of a job
+SAVE_INTERVAL = 1.0
+
+
+class JobStore:
+    """Jobs kept as JSON files within a directory shared by all workers.
+
+    A job is run by the worker holding the lock of the job, which the system
+    releases if the worker dies. Cancellation is requested by a marker file of
+    its own, so that requests never write to the state of running jobs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, mode=0o700, exist_ok=True)
+
+    def ids(self):
+        return [n[:-5] for n in os.listdir(self.path) if n.endswith(".json")]
+
+    def load(self, job_id):
+        """Get the state of given job, raising ``KeyError`` if unknown."""
+        try:
+            with open(self._file(job_id, ".json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):  # bogus id
+            raise KeyError(job_id) from None
+
+    def save(self, job):
+        path = self._file(job["id"], ".json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)  # readers never see partial states
+
+    def lock(self, job_id):
+        """Take the lock of given job, returning its file descriptor, or None if
+        held by another worker."""
+        fd = os.open(self._file(job_id, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def cancel(self, job_id):
+        with open(self._file(job_id, ".cancel"), "a"):
+            pass
+
+    def cancelled(self, job_id):
+        return os.path.exists(self._file(job_id, ".cancel"))
+
+    def output(self, job_id):
+        """Path of the file produced by given job, e.g. an archive."""
+        return self._file(job_id, ".out")
+
+    def delete(self, job_id):
+        for suffix in (".json", ".cancel", ".out", ".lock"):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._file(job_id, suffix))
+
+    def _file(self, job_id, suffix):
+        if os.path.basename(job_id) != job_id or job_id.startswith("."):
+            raise KeyError(job_id)
+        return os.path.join(self.path, f"{job_id}{suffix}")
+
+
+class JobManager:
+    """File Manager actions run in the background by a pool of threads.
+
+    Jobs are persisted along with the outcome of each of their items, so that
+    their state outlives the worker running them. Jobs left behind by a worker
+    which died are resumed by the next worker started: items which completed
+    are skipped, and the partial target of the item in progress is removed
+    before it is processed again. Items are copied to a partial target named
+    after the job, renamed into place once complete, so that only paths the
+    job created are ever removed.
+    """
+
+    def __init__(self, app, path, workers=4, max_age=86400):
+        self.app = app
+        self.store = JobStore(path)
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="jobs")
+
+    def submit(self, action, username=None, **params):
+        """Queue a job running action over the names of ``params``."""
+        if action not in ACTIONS:
+            raise ValueError(f"unsupported action {action!r}")
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "action": action,
+            "status": "queued",
+            "username": username,
+            "createdAt": now,
+            "updatedAt": now,
+            "params": params,
+            "progress": {
+                "items": 0,
+                "totalItems": len(params["names"]),
+                "files": 0,
+                "bytes": 0,
+            },
+            "results": [{"name": name, "status": "queued"} for name in params["names"]],
+        }
+        self.store.save(job)
+        self._executor.submit(self._run, job["id"])
+        self.purge()
+        return job
+
+    def get(self, job_id, username=None):
+        """Get the state of given job, which must belong to given user."""
+        job = self.store.load(job_id)
+        if job["username"] != username:
+            raise KeyError(job_id)
+        return job
+
+    def cancel(self, job_id, username=None):
+        job = self.get(job_id, username=username)
+        if job["status"] not in FINAL:
+            self.store.cancel(job_id)
+        return job
+
+    def recover(self):
+        """Resume the jobs of workers which died, in the background."""
+        for job_id in self.store.ids():
+            try:
+                job = self.store.load(job_id)
+            except KeyError:
+                continue
+            if job["status"] in PENDING:
+                self._executor.submit(self._run, job_id)
+
+    def purge(self):
+        """Drop the jobs completed more than ``max_age`` seconds ago."""
+        deadline = time.time() - self.max_age
+        for job_id in self.store.ids():
+            try:
+                job = self.store.load(job_id)
+            except KeyError:
+                continue
+            if job["status"] in FINAL and job["updatedAt"] < deadline:
+                self.store.delete(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id):
+        fd = self.store.lock(job_id)
+        if fd is None:
+            return  # run by another worker
+        try:
+            job = self.store.load(job_id)
+            if job["status"] in FINAL:
+                return
+            with self.app.app_context():
+                g.username = job["username"]  # services impersonate them
+                _Run(self.store, job).run()
+        except Exception:
+            logger.exception("job %s failed", job_id)
+        finally:
+            os.close(fd)
+
+
+class _Run:
+    """Run of a job, saving its progress as it goes."""
+
+    def __init__(self, store, job):
+        self.store = store
+        self.job = job
+        self.progress = job["progress"]
+        self._saved = 0
+        self._cancelled = False
+
+    def run(self):
+        job = self.job
+        job["status"] = "running"
+        self.save(force=True)
+        try:
+            if job["action"] == "archive":
+                self._archive()
+            else:
+                handler = getattr(self, f"_{job['action']}")
+                for item in job["results"]:
+                    if item["status"] in FINAL:
+                        continue
+                    if self.cancelled():
+                        item["status"] = "cancelled"
+                        continue
+                    self._item(handler, item)
+        except Exception as ex:
+            job["status"] = "failed"
+            job["error"] = getattr(ex, "strerror", None) or str(ex)
+        else:
+            statuses = {item["status"] for item in job["results"]}
+            job["status"] = "cancelled" if "cancelled" in statuses else "done"
+        self.save(force=True)
+
+    def cancelled(self):
+        if not self._cancelled:
+            self._cancelled = self.store.cancelled(self.job["id"])
+        return self._cancelled
+
+    def save(self, force=False):
+        now = time.time()
+        if force or now - self._saved >= SAVE_INTERVAL:
+            self.job["updatedAt"] = now
+            self.store.save(self.job)
+            self._saved = now
+
+    def report(self, files, size):
+        self.progress["files"] += files
+        self.progress["bytes"] += size
+        self.save()
+
+    def _item(self, handler, item):
+        resumed = item["status"] == "running"
+        item["status"] = "running"
+        try:
+            handler(item, resumed)
+        except CancelledError:
+            item["status"] = "cancelled"
+        except OSError as ex:
+            item["status"], item["error"] = "failed", ex.strerror or str(ex)
+        else:
+            item["status"] = "done"
+        self.progress["items"] += 1
+        self.save(force=True)
+
+    @property
+    def _volumes(self):
+        return self.job["params"].get("volumes", ())
+
+    def _source(self, item):
+        return os.path.join(self.job["params"]["path"], item["name"])
+
+    def _partial(self, item):
+        """Path the item is copied to until complete, which is named after the
+        job so that it is known to be the job's own on resume."""
+        name = f".{item['name']}.{self.job['id']}.part"
+        return os.path.join(self.job["params"]["targetPath"], name)
+
+    def _target(self, item):
+        """Path the item is copied or moved to, under a name made unique if
+        taken, recorded along with the item."""
+        dst = self.job["params"]["targetPath"]
+        target = FileManagerSvc.rename_duplicates(dst=dst, filename=item["name"])
+        item["path"] = target
+        self.save(force=True)
+        return target
+
+    def _place(self, item, path):
+        """Rename given path, e.g. the complete partial target of the item, to
+        the target of the item."""
+        while True:
+            try:
+                FileManagerSvc.rename(path, self._target(item), replace=False)
+                return
+            except FileExistsError:
+                continue  # taken meanwhile, under another name then
+
+    def _discard(self, partial):
+        if FileManagerSvc.exists(partial):
+            FileManagerSvc.delete(partial, volumes=self._volumes, recursive=True)
+
+    def _copy(self, item, resumed):
+        partial = self._partial(item)
+        if resumed:
+            self._discard(partial)
+        try:
+            _, item["strategies"] = streams.watch_call(
+                FileManagerSvc.copy,
+                src=self._source(item),
+                dst=self.job["params"]["targetPath"],
+                target=partial,
+                workers=self.job["params"].get("workers", 8),
+                progress=self.report,
+                cancelled=self.cancelled,
+            )
+        except shutil.Error:  # other files were copied, as copytree leaves them
+            self._place(item, partial)
+            raise
+        except BaseException:
+            self._discard(partial)  # e.g. cancelled, not to leave a partial copy
+            raise
+        self._place(item, partial)
+
+    def _move(self, item, resumed):
+        """Rename the item into place, or across devices, copy it to its partial
+        target, marked as copied once complete, then delete the source."""
+        src, partial = self._source(item), self._partial(item)
+        if not item.get("copied"):
+            moved = item.get("path") and not FileManagerSvc.exists(src)
+            if resumed and moved and FileManagerSvc.exists(item["path"]):
+                return  # moved before the worker died
+            try:
+                self._place(item, src)
+                self.report(1, 0)
+                return
+            except OSError as ex:
+                if ex.errno != errno.EXDEV:
+                    raise
+            if resumed:
+                self._discard(partial)
+            try:
+                FileManagerSvc.copy(src=src, dst=None, target=partial)
+            except BaseException:
+                self._discard(partial)  # the source is left whole
+                raise
+            item["copied"] = True
+            self.save(force=True)
+        if FileManagerSvc.exists(src):  # copied whole, as moves do across devices
+            FileManagerSvc.delete(src, volumes=self._volumes, recursive=True)
+        self._place(item, partial)
+        self.report(1, 0)
+
+    def _delete(self, item, resumed):
+        try:
+            FileManagerSvc.delete(self._source(item), volumes=self._volumes)
+        except FileNotFoundError:
+            if not resumed:
+                raise
+        self.report(1, 0)
+
+    def _archive(self):
+        """Write the archive of all items to the output of the job."""
+        paths = [self._source(item) for item in self.job["results"]]
+        self.progress["bytes"] = 0  # from scratch when resumed
+        chunks = streams.iter_call(
+            FileManagerSvc.create_attachment,
+            paths=paths,
+            format=self.job["params"].get("format", "tar.gz"),
+            level=self.job["params"].get("level"),
+            workers=self.job["params"].get("workers", 1),
+        )
+        try:
+            with open(self.store.output(self.job["id"]), "wb") as f:
+                for chunk in chunks:
+                    if self.cancelled():
+                        break
+                    f.write(chunk)
+                    self.report(0, len(chunk))
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        status = "cancelled" if self.cancelled() else "done"
+        for item in self.job["results"]:
+            item["status"] = status
+        self.progress["items"] = len(self.job["results"])
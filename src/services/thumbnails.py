@@ -0,0 +1,116 @@
+import contextvars
+import io
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional, enables thumbnails
+    Image = ImageOps = None
+
+__all__ = ("Thumbnailer", "make_thumbnail", "thumbnail_key", "thumbnail_size")
+
+# sizes of the boxes thumbnails fit in, size hints being rounded up to the next
+# one so that views of close sizes share thumbnails
+SIZES = (64, 128, 256, 512, 1024)
+
+# extensions of the thumbnails cached, by their mimetype
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png"}
+
+Thumbnail = namedtuple("Thumbnail", ("path", "data", "mimetype"))
+
+
+def thumbnail_size(width=None, height=None, default=256):
+    """Size of the box fitting given size hints."""
+    hint = max(width or 0, height or 0) or default
+    return next((size for size in SIZES if size >= hint), SIZES[-1])
+
+
+def thumbnail_key(stats, size):
+    """Key of the thumbnail of an image, changing whenever the image gets
+    modified or replaced, even if its modification time is restored."""
+    return (
+        f"{stats.st_dev:x}-{stats.st_ino:x}-{stats.st_mtime_ns:x}-{stats.st_size:x}"
+        f"-{stats.st_ctime_ns:x}-{size}"
+    )
+
+
+def make_thumbnail(path, size):
+    """Downscale given image to fit a box of given size, returning the content
+    and mimetype of the thumbnail. Raises ``ValueError`` if the image cannot be
+    decoded, or if Pillow is not installed."""
+    if Image is None:
+        raise ValueError("Pillow is not installed")
+    with open(path, "rb") as f:  # raises as reading the original would
+        try:
+            with Image.open(f) as img:
+                img.draft("RGB", (size, size))  # e.g. JPEGs decoded downscaled
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((size, size))
+                buffer = io.BytesIO()
+                if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+                    img.convert("RGBA").save(buffer, format="PNG", optimize=True)
+                    mimetype = "image/png"
+                else:
+                    img.convert("RGB").save(buffer, format="JPEG", quality=85)
+                    mimetype = "image/jpeg"
+        except (OSError, SyntaxError, Image.DecompressionBombError) as ex:
+            raise ValueError(f"cannot make a thumbnail of {path}: {ex}") from None
+    return buffer.getvalue(), mimetype
+
+
+class Thumbnailer:
+    """Thumbnails generated by a pool of threads, and kept in an optional disk
+    cache, e.g. a ``DiskCache``.
+
+    Concurrent requests of a user for the same thumbnail share its generation.
+    Cached thumbnails are shared by all users, who must be checked to be able to
+    read the original image beforehand.
+    """
+
+    def __init__(self, cache=None, workers=4):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="thumbnails")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    def get(self, key, generate, username=None):
+        """Get the thumbnail cached under given key, or generate it by calling
+        ``generate()``, which returns its content and mimetype. It is called in
+        the context of the caller, e.g. within its Flask request."""
+        if self.cache is not None:
+            for mimetype, extension in EXTENSIONS.items():
+                path = self.cache.lookup(f"{key}{extension}")
+                if path is not None:
+                    return Thumbnail(path, None, mimetype)
+        pending = (username, key)
+        with self._lock:
+            future = self._pending.get(pending)
+            if future is None:
+                context = contextvars.copy_context()
+                future = self._pool.submit(
+                    context.run, self._generate, key, generate, pending
+                )
+                self._pending[pending] = future
+        try:
+            return future.result()
+        finally:
+            del future  # no reference cycle through the traceback of its error
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _generate(self, key, generate, pending):
+        try:
+            data, mimetype = generate()
+            if self.cache is not None:
+                self.cache.put(f"{key}{EXTENSIONS[mimetype]}", data)
+            return Thumbnail(None, data, mimetype)
+        finally:
+            with self._lock:
+                del self._pending[pending]
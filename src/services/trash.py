@@ -0,0 +1,271 @@
+import contextlib
+import errno
+import fcntl
+import logging
+import os
+import stat
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g
+
+from src import utils
+
+__all__ = ("TrashPurger", "move_to_trash", "purge_tree")
+
+logger = logging.getLogger(__name__)
+
+# directory at the root of volumes holding the trees deleted on them, one
+# directory per user, which must be world-writable and sticky as /tmp is
+TRASH_DIRNAME = ".filesystem-api-trash"
+
+
+def trash_dir(path, volumes=()):
+    """Trash of the current user on the volume of given path, if any."""
+    path = os.path.abspath(path)
+    for volume in sorted(map(os.path.normpath, volumes), key=len, reverse=True):
+        if not path.startswith(os.path.join(volume, "")):
+            continue
+        trash = os.path.join(volume, TRASH_DIRNAME)
+        try:
+            if os.stat(trash).st_dev != os.lstat(path).st_dev:
+                return None  # e.g. path within a volume mounted below
+        except FileNotFoundError:
+            return None
+        user_trash = os.path.join(trash, str(os.getuid()))
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(user_trash, mode=0o700)
+        stats = os.lstat(user_trash)
+        if not stat.S_ISDIR(stats.st_mode) or stats.st_uid != os.getuid():
+            logger.warning("ignoring trash %s not owned by its user", user_trash)
+            return None
+        return user_trash
+    return None
+
+
+def move_to_trash(path, volumes=()):
+    """Move given tree to the trash of its volume, to be purged later on.
+    Returns whether it did, i.e. whether there is such a trash."""
+    trash = trash_dir(path, volumes)
+    if trash is None:
+        return False
+    name = f"{uuid.uuid4().hex}-{os.path.basename(os.path.normpath(path))}"
+    os.rename(path, os.path.join(trash, name))
+    return True
+
+
+class _RateLimiter:
+    """Spreads operations made from any thread to ``rate`` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            at = max(self._next, now)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def purge_tree(path, workers=4, rate=0):
+    """Remove given tree, with a pool of threads unlinking its files, making
+    up to ``rate`` unlinks per second if given. Entries which cannot be removed
+    are logged and left behind.
+
+    As ``shutil.rmtree`` does, directories are walked by file descriptor and
+    opened without following symlinks, so that a tree swapped for a link while
+    being purged never leads outside of it.
+    """
+    limiter = _RateLimiter(rate) if rate else None
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def remove(fn, name, dir_fd, path):
+        try:
+            if limiter is not None:
+                limiter.wait()
+            fn(name, dir_fd=dir_fd)
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            logger.warning("cannot purge %s: %s", path, ex)
+        finally:
+            slots.release()
+
+    def submit(fn, name, dir_fd, path):
+        slots.acquire()
+        return pool.submit(remove, fn, name, dir_fd, path)
+
+    def enter(dir_fd, name, path, futures):
+        """Open and list given directory, or remove it if not a directory."""
+        try:
+            fd = _open_dir(name, dir_fd)
+        except OSError as ex:
+            if ex.errno in (errno.ENOTDIR, errno.ELOOP):  # file or symlink
+                futures.append(submit(os.unlink, name, dir_fd, path))
+            elif ex.errno != errno.ENOENT:
+                logger.warning("cannot purge %s: %s", path, ex)
+            return
+        dirs, files = [], []
+        try:
+            with os.scandir(fd) as it:
+                for entry in it:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    (dirs if is_dir else files).append(entry.name)
+        except OSError as ex:
+            logger.warning("cannot purge %s: %s", path, ex)
+        children = [submit(os.unlink, n, fd, os.path.join(path, n)) for n in files]
+        stack.append((fd, dir_fd, name, path, dirs, children))
+
+    parent, name = os.path.split(os.path.normpath(path))
+    parent_fd = os.open(parent or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix="purge") as pool:
+            stack = []
+            enter(parent_fd, name, path, [])
+            while stack:
+                fd, dir_fd, name, path, dirs, children = stack[-1]
+                if dirs:
+                    child = dirs.pop()
+                    enter(fd, child, os.path.join(path, child), children)
+                    continue
+                stack.pop()
+                for future in children:  # children ahead of parents
+                    future.result()
+                os.close(fd)
+                futures = stack[-1][-1] if stack else []
+                futures.append(submit(os.rmdir, name, dir_fd, path))
+    finally:
+        os.close(parent_fd)
+
+
+def _open_dir(name, dir_fd):
+    """Open a directory without following symlinks, letting its owner remove its
+    entries as trees may contain read-only directories."""
+    flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+    try:
+        fd = os.open(name, flags, dir_fd=dir_fd)
+    except PermissionError:  # unreadable, checked to be a directory of ours
+        stats = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+        if not stat.S_ISDIR(stats.st_mode):
+            raise
+        os.chmod(name, stat.S_IMODE(stats.st_mode) | stat.S_IRWXU, dir_fd=dir_fd)
+        fd = os.open(name, flags, dir_fd=dir_fd)
+    mode = stat.S_IMODE(os.fstat(fd).st_mode)
+    if mode & stat.S_IRWXU != stat.S_IRWXU:
+        # e.g. not the owner, unlinking its entries is then logged
+        with contextlib.suppress(OSError):
+            os.fchmod(fd, mode | stat.S_IRWXU)
+    return fd
+
+
+class TrashPurger:
+    """Thread purging the trash of given volumes every ``interval`` seconds.
+
+    Trash is purged as the user it belongs to. A volume is purged by a single
+    worker at a time, the one holding the lock of its trash.
+    """
+
+    def __init__(self, app, volumes, purge, interval=10):
+        self.app = app
+        self.trashes = []
+        self.purge = purge
+        self.interval = interval
+        for volume in volumes:
+            trash = os.path.join(volume, TRASH_DIRNAME)
+            try:
+                os.makedirs(trash, exist_ok=True)
+                if stat.S_IMODE(os.stat(trash).st_mode) != 0o1777:
+                    os.chmod(trash, 0o1777)  # as /tmp, whatever the umask
+            except OSError as ex:
+                logger.warning("trash unavailable on %s: %s", volume, ex)
+            else:
+                self.trashes.append(trash)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def purge_all(self):
+        """Purge the trash of all volumes not being purged by another worker."""
+        for trash in self.trashes:
+            fd = os.open(os.path.join(trash, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            else:
+                self._purge_trash(trash)
+            finally:
+                os.close(fd)
+
+    def _purge_trash(self, trash):
+        with os.scandir(trash) as it:
+            entries = list(it)
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            try:
+                stats = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if not stat.S_ISDIR(stats.st_mode) or stats.st_uid != int(entry.name):
+                self._repair(entry.path, stats)  # made by another user
+                continue
+            with os.scandir(entry.path) as it:
+                if next(it, None) is None:
+                    continue
+            self._purge_as(stats.st_uid, entry.path)
+
+    def _purge_as(self, uid, path):
+        try:
+            username = utils.getpwuid(uid).pw_name
+        except KeyError:
+            logger.warning("not purging %s of unknown user", path)
+            return False
+        try:
+            with self.app.app_context():
+                g.username = username  # purged with their permissions
+                self.purge(path)
+        except Exception:
+            logger.exception("failed to purge %s", path)
+            return False
+        return True
+
+    def _repair(self, path, stats):
+        """Replace the trash of a user made by another user, which is purged
+        as the latter, by a directory of the former."""
+        logger.warning("replacing %s not owned by its user", path)
+        if os.geteuid() != 0:
+            return  # trashes are then all owned by the same user
+        uid = int(os.path.basename(path))
+        try:
+            gid = utils.getpwuid(uid).pw_gid
+            if stat.S_ISDIR(stats.st_mode):
+                if not self._purge_as(stats.st_uid, path):
+                    return
+                os.rmdir(path)
+            else:
+                os.unlink(path)
+            os.mkdir(path, mode=0o700)
+            os.chown(path, uid, gid, follow_symlinks=False)
+        except (KeyError, OSError) as ex:
+            logger.warning("cannot replace %s: %s", path, ex)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.purge_all()
+            except Exception:
+                logger.exception("failed to purge trash")
@@ -1,3 +1,4 @@
+import os
 from dataclasses import dataclass
 
 from src.settings.env import env
@@ -16,6 +17,85 @@ class BaseConfig:
     # OPENAPI supported version
     OPENAPI = env.str("OPENAPI", "3.0.3")
 
+    # scope of the processes impersonating users where service calls run: with
+    # "user" a process is kept per user across requests, with "request" one is
+    # shared by the calls of a request, and with "call" each call gets its own
+    IMPERSONATION_SCOPE = env.str("IMPERSONATION_SCOPE", "user")
+
+    # seconds after which idle user processes exit, and maximum number of them
+    IMPERSONATION_IDLE_TIMEOUT = env.int("IMPERSONATION_IDLE_TIMEOUT", 300)
+    IMPERSONATION_MAX_SESSIONS = env.int("IMPERSONATION_MAX_SESSIONS", 64)
+
+    # number of threads handling requests when served over ASGI
+    ASGI_WORKERS = env.int("ASGI_WORKERS", 64)
+
+    # number of threads walking a tree on search
+    SEARCH_WORKERS = env.int("SEARCH_WORKERS", 8)
+
+    # maximum number of search results
+    SEARCH_LIMIT = env.int("SEARCH_LIMIT", 1000)
+
+    # optional filename index for searches under given roots
+    SEARCH_INDEX_PATH = env.str("SEARCH_INDEX_PATH", None)
+    SEARCH_INDEX_ROOTS = env.list("SEARCH_INDEX_ROOTS", [])
+    SEARCH_INDEX_INTERVAL = env.int("SEARCH_INDEX_INTERVAL", 300)
+
+    # number of threads copying files on copies
+    COPY_WORKERS = env.int("COPY_WORKERS", 8)
+
+    # maximum number of operations of a batch, and number of threads running them
+    BATCH_MAX_SIZE = env.int("BATCH_MAX_SIZE", 1000)
+    BATCH_WORKERS = env.int("BATCH_WORKERS", 8)
+
+    # number of threads compressing each tar.gz or tar.zst archive
+    ARCHIVE_WORKERS = env.int("ARCHIVE_WORKERS", min(4, os.cpu_count() or 1))
+
+    # optional directory caching the archives downloaded, and the maximum size of
+    # the archives it holds, in bytes
+    ARCHIVE_CACHE_PATH = env.str("ARCHIVE_CACHE_PATH", None)
+    ARCHIVE_CACHE_SIZE = env.int("ARCHIVE_CACHE_SIZE", 10 * 1024**3)
+
+    # header letting the front proxy send files rather than the workers,
+    # "X-Accel-Redirect" for nginx or "X-Sendfile" e.g. for Apache, and the
+    # internal nginx location aliasing the root of the filesystem
+    SENDFILE_HEADER = env.str("SENDFILE_HEADER", None)
+    SENDFILE_LOCATION = env.str("SENDFILE_LOCATION", "/sendfile")
+
+    # number of threads generating thumbnails of images, once Pillow is
+    # installed, 0 to send the original images; size of the thumbnails when not
+    # hinted by the client; optional directory caching them and its maximum
+    # size, in bytes
+    THUMBNAIL_WORKERS = env.int("THUMBNAIL_WORKERS", 4)
+    THUMBNAIL_SIZE = env.int("THUMBNAIL_SIZE", 256)
+    THUMBNAIL_CACHE_PATH = env.str("THUMBNAIL_CACHE_PATH", None)
+    THUMBNAIL_CACHE_SIZE = env.int("THUMBNAIL_CACHE_SIZE", 1024**3)
+
+    # directory where background jobs are kept, enabling asynchronous copies,
+    # moves, deletions and archives; number of threads running them, and
+    # seconds completed jobs are kept for
+    JOBS_PATH = env.str("JOBS_PATH", None)
+    JOBS_WORKERS = env.int("JOBS_WORKERS", 4)
+    JOBS_MAX_AGE = env.int("JOBS_MAX_AGE", 86400)
+
+    # seconds after which the chunks of uploads not written to are removed
+    UPLOAD_MAX_AGE = env.int("UPLOAD_MAX_AGE", 86400)
+
+    # mount points of volumes where deleted trees are moved to a trash, purged
+    # in the background every interval seconds by a pool of threads unlinking
+    # at most a given number of files per second, 0 for no limit
+    TRASH_VOLUMES = env.list("TRASH_VOLUMES", [])
+    TRASH_PURGE_INTERVAL = env.int("TRASH_PURGE_INTERVAL", 10)
+    TRASH_PURGE_WORKERS = env.int("TRASH_PURGE_WORKERS", 4)
+    TRASH_PURGE_RATE = env.int("TRASH_PURGE_RATE", 2000)
+
+    # report directories whose content is not known from their stats as having
+    # entries, rather than opening each of them on listings
+    LAZY_HAS_CHILD = env.bool("LAZY_HAS_CHILD", False)
+
+    # maximum number of directory entries held by the listing cache, 0 disables it
+    LISTING_CACHE_SIZE = env.int("LISTING_CACHE_SIZE", 100_000)
+    LISTING_CACHE_MAX_AGE = env.int("LISTING_CACHE_MAX_AGE", 60)
+
 
 @dataclass
 class ProductionConfig(BaseConfig):
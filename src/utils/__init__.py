@@ -1,12 +1,26 @@
+import base64
+import fnmatch
+import functools
+import heapq
+import json
+import mimetypes
 import os
 import pwd
+import re
+import unicodedata
 from pathlib import Path
+from urllib.parse import quote
 
 from apispec_plugins.types import HTTPResponse
+from flask import current_app, request, Response, send_file
 from flask_restful import abort
 from werkzeug.http import HTTP_STATUS_CODES
 
 from src.schemas.serializers.http import HttpResponseSchema
+from src.utils.cache import TTLCache
+
+# users and groups may be resolved through slow directory services, e.g. LDAP
+identities = TTLCache(maxsize=4096, ttl=300, negative_ttl=30, stale_ttl=3600)
 
 
 def convert_bytes(num, suffix="B"):
@@ -17,6 +31,17 @@ def convert_bytes(num, suffix="B"):
     return f"{num:.0f} Y{suffix}"
 
 
+@functools.lru_cache(maxsize=128)
+def name_matcher(pattern, case_sensitive=False):
+    """Compile a glob pattern into a name matcher. Patterns without wildcards
+    match any name containing them."""
+    pattern = pattern or "*"
+    if not any(c in pattern for c in "*?["):
+        pattern = f"*{pattern}*"
+    flags = 0 if case_sensitive else re.IGNORECASE
+    return re.compile(fnmatch.translate(pattern), flags).match
+
+
 def normpath(path) -> Path:
     return Path(os.path.join(os.path.sep, path.strip(os.path.sep)))
 
@@ -32,13 +57,199 @@ def abort_with(code: int, description="", **kwargs):
     abort(code, **http_response(code, description=description, **kwargs))
 
 
+def stream_response(
+    chunks, download_name, mimetype="application/octet-stream", as_attachment=True
+):
+    """Send a file whose content is produced in chunks."""
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name)
+        simple = simple.encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="")
+        names = {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    else:
+        names = {"filename": download_name}
+
+    response = Response(chunks, mimetype=mimetype, direct_passthrough=True)
+    value = "attachment" if as_attachment else "inline"
+    response.headers.set("Content-Disposition", value, **names)
+    return response
+
+
+def file_etag(stats: os.stat_result):
+    """Strong validator for a file, changing whenever it gets replaced or
+    rewritten, even if its modification time is restored afterwards."""
+    return (
+        f"{stats.st_ino:x}-{stats.st_size:x}-{stats.st_mtime_ns:x}"
+        f"-{stats.st_ctime_ns:x}"
+    )
+
+
+def sendfile_response(
+    path, download_name, mimetype=None, as_attachment=True, stats=None
+):
+    """Response letting the front proxy send given file by itself, through the
+    ``SENDFILE_HEADER`` it handles, or None if there is no such header.
+
+    The proxy is given the real path of the file, free of symlinks, which must
+    still be the file of given stats if any, i.e. the one the user was checked
+    to be able to read; else None is returned as well.
+
+    Paths are URL-encoded, as nginx and Apache ``mod_xsendfile`` decode them.
+    Nginx is given them under ``SENDFILE_LOCATION``, an internal location which
+    must alias the root of the filesystem.
+    """
+    header = current_app.config["SENDFILE_HEADER"]
+    if not header:
+        return None
+    path = os.path.realpath(path)
+    if stats is not None:
+        try:
+            current = os.stat(path)
+        except OSError:
+            return None
+        if (current.st_dev, current.st_ino) != (stats.st_dev, stats.st_ino):
+            return None  # replaced since checked
+    value = quote(os.fsencode(path))
+    if header.lower() == "x-accel-redirect":
+        value = f"{current_app.config['SENDFILE_LOCATION'].rstrip('/')}{value}"
+    mimetype = mimetype or mimetypes.guess_type(download_name)[0]
+    response = stream_response(
+        (),
+        download_name=download_name,
+        mimetype=mimetype or "application/octet-stream",
+        as_attachment=as_attachment,
+    )
+    response.headers[header] = value
+    response.cache_control.no_cache = True
+    return response
+
+
+def send_path(path, download_name, mimetype=None, as_attachment=True, **kwargs):
+    """Send a file readable by the service itself, e.g. from a cache, through
+    the front proxy if possible."""
+    response = sendfile_response(
+        path, download_name, mimetype=mimetype, as_attachment=as_attachment
+    )
+    if response is not None:
+        return response
+    return send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        **kwargs,
+    )
+
+
+def send_stream(
+    body, stats: os.stat_result, download_name, as_attachment=True, path=None
+):
+    """Send a file streamed from given body, answering conditional and range
+    requests against the file stats. Given its path, the file is sent by the
+    front proxy instead if possible, once the user was checked to be able to
+    read it."""
+    mimetype = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+    if path is not None:
+        response = sendfile_response(
+            path,
+            download_name,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            stats=stats,
+        )
+        if response is not None:
+            if hasattr(body, "close"):
+                body.close()
+            return response
+    response = stream_response(
+        body,
+        download_name=download_name,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+    )
+    response.content_length = stats.st_size
+    response.last_modified = stats.st_mtime
+    response.set_etag(file_etag(stats))
+    response.cache_control.no_cache = True
+    return response.make_conditional(
+        request, accept_ranges=True, complete_length=stats.st_size
+    )
+
+
+def paginate(items, key=None, limit=None, cursor=None, reverse=False):
+    """Select a page of items ordered by given key.
+
+    Pages are delimited by a cursor holding the key of the last item sent, so
+    only ``limit`` items need to be ordered rather than the whole set.
+    Returns the page along with the cursor to the next one, if any.
+    """
+    if key is None:
+        return list(items)[:limit], None
+    if cursor is not None:
+        items = _after(items, key, decode_cursor(cursor), reverse)
+    if limit is None:
+        return sorted(items, key=key, reverse=reverse), None
+
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    page = select(limit + 1, items, key=key)
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(key(page[-1]))
+
+
+def _after(items, key, last, reverse=False):
+    """Items whose key comes after given one, which must be of the same shape
+    as theirs, e.g. not the key of a cursor of another sort order."""
+    shape = None
+    for item in items:
+        k = key(item)
+        if shape is None:
+            shape = tuple(map(_kind, k))
+            if shape != tuple(map(_kind, last)) or None in shape:
+                raise ValueError("invalid cursor")
+        if k < last if reverse else k > last:
+            yield item
+
+
+def _kind(value):
+    if isinstance(value, str):
+        return str
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float
+    return None
+
+
+def encode_cursor(key: tuple):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor")
+
+
+def getpwnam(username) -> pwd.struct_passwd:
+    """Cached ``pwd.getpwnam``."""
+    return identities.fetch(("pwnam", username), lambda: pwd.getpwnam(username))
+
+
+def getpwuid(uid) -> pwd.struct_passwd:
+    """Cached ``pwd.getpwuid``."""
+    return identities.fetch(("pwuid", uid), lambda: pwd.getpwuid(uid))
+
+
 def user_uid(username):
-    return pwd.getpwnam(username).pw_uid
+    return getpwnam(username).pw_uid
 
 
 def user_gid(username):
-    return pwd.getpwnam(username).pw_gid
+    return getpwnam(username).pw_gid
 
 
 def system_username():
-    return pwd.getpwuid(os.getuid()).pw_name
+    return getpwuid(os.getuid()).pw_name
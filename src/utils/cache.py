@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+__all__ = ("LRUCache", "TTLCache")
+
+logger = logging.getLogger(__name__)
+
+_Item = namedtuple("_Item", ("value", "error", "expires", "stale"))
+
+
+class LRUCache:
+    """Thread-safe mapping bounded by the total size of its values, evicting the
+    least recently used items first.
+
+    ``getsizeof`` gives the size of a value, 1 by default; ``on_evict`` is called
+    with the key and value of every item evicted to make room.
+    """
+
+    def __init__(self, maxsize, getsizeof=None, on_evict=None):
+        self.maxsize = maxsize
+        self.currsize = 0
+        self._getsizeof = getsizeof or (lambda value: 1)
+        self._on_evict = on_evict
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        size = self._getsizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.currsize -= self._items.pop(key)[1]
+            evicted = []
+            if size > self.maxsize:  # would not fit anyway
+                evicted.append((key, value))
+            else:
+                while self.currsize + size > self.maxsize:
+                    old_key, (old_value, old_size) = self._items.popitem(last=False)
+                    self.currsize -= old_size
+                    evicted.append((old_key, old_value))
+                self._items[key] = (value, size)
+                self.currsize += size
+            if self._on_evict:
+                for item in evicted:
+                    self._on_evict(*item)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._items.pop(key)
+            except KeyError:
+                return default
+            self.currsize -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.currsize = 0
+
+
+class TTLCache:
+    """Cache of values loaded on demand, which expire after ``ttl`` seconds.
+
+    Lookup errors of type ``negative`` are cached as well, for ``negative_ttl``
+    seconds. Once expired, values are still served for up to ``stale_ttl``
+    seconds while being reloaded in the background, and whenever reloading
+    fails with another error, e.g. when a directory service is unreachable.
+    """
+
+    def __init__(self, maxsize, ttl, negative_ttl=None, stale_ttl=0, negative=KeyError):
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.stale_ttl = stale_ttl
+        self.negative = negative
+        self._items = LRUCache(maxsize)
+        self._loading = set()
+        self._lock = threading.Lock()
+
+    def fetch(self, key, loader):
+        """Get the value cached under key, or load it with ``loader()``."""
+        item = self._items.get(key)
+        now = time.monotonic()
+        if item is None or item.stale <= now:
+            item = self._load(key, loader, stale=item)
+        elif item.expires <= now:
+            self._load_later(key, loader)
+        if item.error is not None:
+            raise item.error.with_traceback(None)
+        return item.value
+
+    def clear(self):
+        self._items.clear()
+
+    def _load(self, key, loader, stale=None):
+        try:
+            item = self._item(value=loader())
+        except self.negative as ex:
+            item = self._item(error=ex)
+        except Exception:
+            if stale is None or stale.error is not None:
+                raise
+            logger.warning("failed to reload %r, serving stale value", key)
+            retry = time.monotonic() + self.negative_ttl  # not to retry every time
+            item = stale._replace(expires=retry, stale=retry)
+        self._items[key] = item
+        return item
+
+    def _item(self, value=None, error=None):
+        if error is not None:  # never served stale
+            expires = time.monotonic() + self.negative_ttl
+            return _Item(None, error, expires, expires)
+        expires = time.monotonic() + self.ttl
+        return _Item(value, None, expires, expires + self.stale_ttl)
+
+    def _load_later(self, key, loader):
+        with self._lock:
+            if key in self._loading:
+                return
+            self._loading.add(key)
+
+        def reload():
+            try:
+                self._load(key, loader, stale=self._items.get(key))
+            except Exception:
+                logger.exception("failed to reload %r", key)
+            finally:
+                with self._lock:
+                    self._loading.discard(key)
+
+        threading.Thread(target=reload, daemon=True).start()
@@ -0,0 +1,365 @@
+import contextlib
+import contextvars
+import functools
+import importlib
+import itertools
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from multiprocessing import get_context, reduction
+from multiprocessing.connection import Connection
+
+from flask import current_app, has_app_context, has_request_context, request
+
+from src import utils
+
+__all__ = ("Session", "SessionPool", "impersonate", "init_app", "session")
+
+# key of the sessions of a request within its WSGI environ
+ENVIRON_KEY = "filesystem_api.impersonation"
+
+_ctx = get_context("spawn")
+_session = contextvars.ContextVar("impersonation_session", default=None)
+_lock = threading.Lock()
+
+# modules of impersonated classes, loaded ahead of switching user as their
+# code may not be readable by the user
+_modules = set()
+
+# placeholder of a connection passed as keyword argument, whose file descriptor
+# is sent separately
+_Channel = namedtuple("_Channel", ("readable", "writable"))
+
+
+class Session:
+    """Process running as given user, where impersonated calls are sent to.
+
+    Each call runs in a thread of its own, so that streams do not hold back
+    other calls. Calls in progress are completed before the process exits.
+    """
+
+    def __init__(self, username):
+        pw = utils.getpwnam(username)
+        self.username = username
+        self._conn, child = _ctx.Pipe()
+        self._process = _ctx.Process(
+            target=_serve,
+            args=(child, pw.pw_uid, pw.pw_gid, username, sorted(_modules)),
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+        try:
+            err = self._conn.recv()
+        except EOFError:
+            err = ChildProcessError("impersonation process exited")
+        if err is not None:
+            self._conn.close()
+            self._process.join()
+            raise err
+
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def call(self, cls, name, *args, **kwargs):
+        """Call the original method ``name`` of class ``cls``. Connections given
+        as keyword arguments are handed over to the process."""
+        channels = [v for v in kwargs.values() if isinstance(v, Connection)]
+        kwargs = {
+            k: _Channel(v.readable, v.writable) if isinstance(v, Connection) else v
+            for k, v in kwargs.items()
+        }
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("impersonation session is closed")
+            call_id = next(self._ids)
+            self._pending[call_id] = future
+            try:
+                self._conn.send((call_id, cls, name, args, kwargs))
+                for channel in channels:
+                    reduction.send_handle(
+                        self._conn, channel.fileno(), self._process.pid
+                    )
+            except BaseException:
+                del self._pending[call_id]
+                raise
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            with contextlib.suppress(OSError):  # already gone
+                self._conn.send(None)
+
+    def _receive(self):
+        try:
+            with contextlib.suppress(EOFError, OSError):  # process exited
+                while True:
+                    call_id, ret, err = self._conn.recv()
+                    future = self._pending.pop(call_id)
+                    if err is not None:
+                        future.set_exception(err)
+                    else:
+                        future.set_result(ret)
+        finally:
+            with self._lock:
+                self._closed = True
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ChildProcessError("impersonation process exited"))
+            self._conn.close()
+            self._process.join()
+
+
+class _Entry:
+    __slots__ = ("session", "active", "last_used")
+
+    def __init__(self, session):
+        self.session = session
+        self.active = 0
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    """Sessions kept across requests, one per user, closed once idle for
+    ``idle_timeout`` seconds or to keep up to ``max_size`` of them."""
+
+    def __init__(self, idle_timeout=300, max_size=64):
+        self.idle_timeout = idle_timeout
+        self.max_size = max_size
+        self._entries = {}
+        self._locks = {}  # so that a user does not wait on others' sessions
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def acquire(self, username):
+        """Get the session of given user, along with the function to release it
+        once the calls are done."""
+        with self._lock:
+            lock = self._locks.setdefault(username, threading.Lock())
+        with lock:
+            with self._lock:
+                entry = self._entries.get(username)
+                if entry is None or entry.session.closed:
+                    entry = None
+                else:
+                    entry.active += 1
+            if entry is None:
+                entry = _Entry(Session(username))
+                entry.active += 1
+                with self._lock:
+                    self._entries[username] = entry
+                    self._start_reaper()
+                self.evict()
+        return entry.session, functools.partial(self._release, entry)
+
+    def evict(self):
+        """Close sessions idle for too long, or the least recently used idle
+        ones as long as there are too many sessions."""
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = sorted(
+                (e for e in self._entries.values() if not e.active),
+                key=lambda e: e.last_used,
+            )
+            excess = len(self._entries) - self.max_size
+            evicted = [
+                e
+                for i, e in enumerate(idle)
+                if i < excess or e.last_used <= deadline or e.session.closed
+            ]
+            for entry in evicted:
+                del self._entries[entry.session.username]
+        for entry in evicted:
+            entry.session.close()
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for entry in entries.values():
+            entry.session.close()
+
+    def _release(self, entry):
+        with self._lock:
+            entry.active -= 1
+            entry.last_used = time.monotonic()
+
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():  # e.g. forked
+            self._reaper = threading.Thread(target=self._reap, daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 4, 1))
+            self.evict()
+
+
+def _serve(conn, uid, gid, username, modules):
+    try:
+        for module in modules:
+            importlib.import_module(module)
+        if uid != os.getuid():
+            os.setgid(gid)  # while privileges allow it
+            os.initgroups(username, gid)
+            os.setuid(uid)
+    except Exception as ex:
+        conn.send(ex)
+        conn.close()
+        return
+    conn.send(None)
+
+    lock = threading.Lock()
+    threads = []
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        *message, kwargs = message
+        kwargs = {
+            k: Connection(reduction.recv_handle(conn), *v)
+            if isinstance(v, _Channel)
+            else v
+            for k, v in kwargs.items()
+        }
+        thread = threading.Thread(target=_run, args=(conn, lock, *message, kwargs))
+        thread.start()
+        threads = [t for t in threads if t.is_alive()] + [thread]
+    for thread in threads:
+        thread.join()
+    conn.close()
+
+
+def _run(conn, lock, call_id, cls, name, args, kwargs):
+    fn = vars(cls)[name].__func__.__wrapped__
+    try:
+        ret, err = fn(*args, **kwargs), None
+    except Exception as ex:
+        ret, err = None, ex
+    finally:
+        for value in kwargs.values():
+            if isinstance(value, Connection):
+                value.close()  # notify the peer of the end of the stream
+    with lock:
+        try:
+            conn.send((call_id, ret, err))
+        except Exception as ex:  # unpicklable result
+            conn.send((call_id, None, TypeError(f"cannot send result: {ex}")))
+
+
+def impersonate(username):
+    """Class decorator running static and class methods as given user, which is
+    usually a proxy to the user of the current request.
+
+    Methods run within the session of the current batch of operations if any,
+    else depending on ``IMPERSONATION_SCOPE``, within the pooled session of the
+    user (``user``), within that of the current request (``request``) or within
+    a process of their own (``call``).
+    """
+
+    def decorator(cls):
+        _modules.add(cls.__module__)
+        for name, attr in list(vars(cls).items()):
+            if isinstance(attr, (staticmethod, classmethod)):
+                wrapper = _wrap(cls, name, attr.__func__, username)
+                setattr(cls, name, type(attr)(wrapper))
+        return cls
+
+    return decorator
+
+
+def _wrap(cls, name, fn, username):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        user = str(username) if username else None
+        if not user or user == utils.system_username():
+            return fn(*args, **kwargs)
+        current, release = _acquire(user)
+        try:
+            return current.call(cls, name, *args, **kwargs)
+        finally:
+            if release is not None:
+                release()
+
+    return wrapper
+
+
+def _acquire(username):
+    current = _session.get()
+    if current is not None and current.username == username:
+        return current, None
+    scope = current_app.config["IMPERSONATION_SCOPE"] if has_app_context() else None
+    if scope == "user":
+        return current_app.extensions["impersonation"].acquire(username)
+    if scope == "request" and has_request_context():
+        with _lock:
+            sessions = request.environ.setdefault(ENVIRON_KEY, {})
+            current = None if sessions is None else sessions.get(username)
+        if current is None and sessions is not None:  # request not torn down yet
+            created = Session(username)  # spawned without holding up other users
+            with _lock:
+                sessions = request.environ.get(ENVIRON_KEY)
+                if sessions is not None:
+                    current = sessions.setdefault(username, created)
+            if current is None:  # torn down meanwhile
+                return created, created.close
+            if current is not created:  # created meanwhile by another thread
+                created.close()
+        if current is not None:
+            return current, None
+    current = Session(username)
+    return current, current.close
+
+
+@contextlib.contextmanager
+def session(username):
+    """Run the impersonated calls made within the context as given user, in a
+    single process."""
+    if str(username) == utils.system_username():
+        yield None
+        return
+    with Session(str(username)) as current:
+        token = _session.set(current)
+        try:
+            yield current
+        finally:
+            _session.reset(token)
+
+
+def init_app(app):
+    """Set up the pool of sessions of users, and close the sessions of requests
+    once they are torn down."""
+    app.config.setdefault("IMPERSONATION_SCOPE", "user")
+    app.extensions["impersonation"] = SessionPool(
+        idle_timeout=app.config.get("IMPERSONATION_IDLE_TIMEOUT", 300),
+        max_size=app.config.get("IMPERSONATION_MAX_SESSIONS", 64),
+    )
+
+    @app.teardown_request
+    def close_sessions(_):
+        with _lock:
+            sessions = request.environ.get(ENVIRON_KEY) or {}
+            request.environ[ENVIRON_KEY] = None  # later calls get their own process
+        for current in sessions.values():
+            current.close()
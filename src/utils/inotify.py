@@ -0,0 +1,136 @@
+import ctypes
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+
+__all__ = ("Inotify",)
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = os.O_CLOEXEC
+
+# any change to the entries of a directory, or to the directory itself
+DIR_CHANGES = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _libc():
+    libc = ctypes.CDLL(None, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError(errno.ENOSYS, "inotify is not supported")
+    return libc
+
+
+class Inotify:
+    """Watch directories for changes with inotify.
+
+    ``callback`` is called from a background thread with the path of every
+    watched directory that changed, or with None when events were lost.
+    """
+
+    def __init__(self, callback):
+        self._libc = _libc()
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.callback = callback
+        self._paths = {}  # path -> wd
+        self._wds = {}  # wd -> paths, several paths may point to the same inode
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def watch(self, path):
+        """Watch given directory, returns whether it could be watched."""
+        with self._lock:
+            if path in self._paths:
+                return True
+            wd = self._libc.inotify_add_watch(
+                self.fd, os.fsencode(path), DIR_CHANGES | IN_ONLYDIR
+            )
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logger.warning("inotify watch limit reached")
+                return False
+            self._paths[path] = wd
+            self._wds.setdefault(wd, set()).add(path)
+            return True
+
+    def unwatch(self, path):
+        with self._lock:
+            wd = self._paths.pop(path, None)
+            if wd is None:
+                return
+            paths = self._wds[wd]
+            paths.discard(path)
+            if not paths:
+                del self._wds[wd]
+                self._libc.inotify_rm_watch(self.fd, wd)
+
+    def close(self):
+        os.write(self._wakeup_w, b"\0")
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                ready, _, _ = select.select([self.fd, self._wakeup_r], [], [])
+                if self._wakeup_r in ready:
+                    break
+                self._dispatch(os.read(self.fd, 64 * 1024))
+        finally:
+            for fd in (self.fd, self._wakeup_r, self._wakeup_w):
+                os.close(fd)
+
+    def _dispatch(self, data):
+        changed, overflow = set(), False
+        with self._lock:
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, size = EVENT.unpack_from(data, offset)
+                offset += EVENT.size + size
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                changed.update(self._wds.get(wd, ()))
+                if mask & IN_IGNORED:  # removed by the kernel, e.g. once deleted
+                    for path in self._wds.pop(wd, ()):
+                        self._paths.pop(path, None)
+        # outside of the lock, so that the callback may unwatch paths
+        for path in changed:
+            self._safe_callback(path)
+        if overflow:
+            self._safe_callback(None)
+
+    def _safe_callback(self, path):
+        try:
+            self.callback(path)
+        except Exception:
+            logger.exception("inotify callback failed")
@@ -0,0 +1,277 @@
+import contextlib
+import contextvars
+import io
+import threading
+from multiprocessing import Pipe
+
+__all__ = (
+    "CHUNK_SIZE",
+    "ConnectionReader",
+    "ConnectionWriter",
+    "FeedWriter",
+    "LazyStream",
+    "Progress",
+    "feed_call",
+    "iter_call",
+    "watch_call",
+)
+
+# size of the blocks exchanged through pipes
+CHUNK_SIZE = 64 * 1024
+
+
+class ConnectionWriter(io.RawIOBase):
+    """Write-only file object sending its data through a pipe connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._discard = False
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if b and not self._discard:  # empty messages flag the end of stream
+            self.conn.send_bytes(b)
+        return len(b)
+
+    def discard(self):
+        """Drop further writes, e.g. the final flush of an aborted stream."""
+        self._discard = True
+
+
+class ConnectionReader(io.RawIOBase):
+    """Read-only file object receiving its data from a pipe connection.
+
+    The stream is complete once an empty message is received; a connection
+    closed before that is reported as an aborted transfer.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._pending = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._pending and not self._eof:
+            try:
+                self._pending = self.conn.recv_bytes()
+            except EOFError:
+                raise ConnectionAbortedError("stream ended unexpectedly")
+            self._eof = not self._pending
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class Progress:
+    """Progress of a routine reported through a duplex pipe connection, whose
+    peer asks the routine to stop by sending any message."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def __call__(self, *counts):
+        with self._lock:
+            self.conn.send(counts)
+
+    def cancelled(self):
+        with self._lock:
+            return self.conn.poll()
+
+
+class _Call(threading.Thread):
+    """Run a routine in the background within the caller context.
+
+    Given connections are closed once the routine returns, so that the peer
+    end of the pipe is notified even when the routine ran in another process.
+    """
+
+    def __init__(self, fn, *args, closing=(), **kwargs):
+        super().__init__(daemon=True)
+        self.ctx = contextvars.copy_context()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.closing = closing
+        self.ret = None
+        self.err = None
+
+    def run(self):
+        try:
+            self.ret = self.ctx.run(self.fn, *self.args, **self.kwargs)
+        except BaseException as ex:
+            self.err = ex
+        finally:
+            for conn in self.closing:
+                conn.close()
+
+    def result(self):
+        self.join()
+        if self.err:
+            raise self.err
+        return self.ret
+
+
+class FeedWriter(ConnectionWriter):
+    """Write-only file object feeding ``fn(*args, channel=..., **kwargs)``,
+    called in the background, with the data written, as ``feed_call`` does.
+
+    The stream is complete once its result is asked for; closing it before
+    then aborts the transfer. Rewinding it is allowed but has no effect, as
+    Werkzeug rewinds the files of a form once parsed.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        reader, writer = Pipe(duplex=False)
+        super().__init__(writer)
+        self._call = _Call(fn, *args, channel=reader, closing=(reader,), **kwargs)
+        self._call.start()
+
+    def write(self, b):
+        try:
+            return super().write(b)
+        except BrokenPipeError:  # the routine gave up reading, see result()
+            self.discard()
+            return len(b)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("seek")
+        return 0
+
+    def result(self):
+        """Flag the end of the stream and get what the routine returns."""
+        if not self.conn.closed:
+            # a broken pipe means the routine gave up, its error is raised below
+            with self.conn, contextlib.suppress(BrokenPipeError):
+                self.conn.send_bytes(b"")  # flag the end of the stream
+        return self._call.result()
+
+    def close(self):
+        if not self.conn.closed:
+            self.conn.close()  # the routine sees the transfer as aborted
+        self._call.join()
+        super().close()
+
+
+class LazyStream:
+    """Seekable iterable deferring ``iter_call`` until the first chunk is needed.
+
+    The routine is given the ``offset`` to start from, so that seeking does not
+    require transferring the skipped bytes. It is called within the context the
+    stream was created in, e.g. that of the request, even if iterated later.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        self.ctx = contextvars.copy_context()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.offset = 0
+        self._chunks = None
+
+    def seekable(self):
+        return self._chunks is None
+
+    def seek(self, offset):
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._chunks is None:
+            self._chunks = self.ctx.run(
+                iter_call, self.fn, *self.args, offset=self.offset, **self.kwargs
+            )
+        chunk = next(self._chunks)
+        self.offset += len(chunk)
+        return chunk
+
+    def close(self):
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+
+
+def iter_call(fn, *args, **kwargs):
+    """Call ``fn(*args, channel=..., **kwargs)`` and iterate over the bytes it
+    sends through ``channel``.
+
+    The first chunk is awaited eagerly so errors raised before any data is
+    produced reach the caller, rather than the consumer of the iterator.
+    """
+    reader, writer = Pipe(duplex=False)
+    call = _Call(fn, *args, channel=writer, closing=(writer,), **kwargs)
+    call.start()
+    try:
+        first = reader.recv_bytes()
+    except EOFError:
+        reader.close()
+        call.result()
+        return iter(())
+    return _iter_chunks(first, reader, call)
+
+
+def _iter_chunks(first, reader, call):
+    chunk = first
+    try:
+        while True:
+            yield chunk
+            try:
+                chunk = reader.recv_bytes()
+            except EOFError:
+                break
+    finally:
+        reader.close()  # breaks the pipe if the consumer stopped early
+        call.join()
+    call.result()
+
+
+def feed_call(fn, stream, *args, chunk_size=CHUNK_SIZE, **kwargs):
+    """Call ``fn(*args, channel=..., **kwargs)`` while feeding it the content of
+    ``stream`` through ``channel``, one chunk at a time."""
+    reader, writer = Pipe(duplex=False)
+    call = _Call(fn, *args, channel=reader, closing=(reader,), **kwargs)
+    call.start()
+    try:
+        with writer:
+            while chunk := stream.read(chunk_size):
+                writer.send_bytes(chunk)
+            writer.send_bytes(b"")  # flag the end of the stream
+    except BrokenPipeError:
+        pass  # the routine gave up reading, its error is raised below
+    except BaseException:
+        call.join()  # the routine sees the transfer as aborted
+        raise
+    return call.result()
+
+
+def watch_call(fn, *args, progress, cancelled, interval=1.0, **kwargs):
+    """Call ``fn(*args, channel=..., **kwargs)``, passing the counts it reports
+    through ``channel`` with ``Progress`` to ``progress(*counts)``, and asking
+    it to stop once ``cancelled()``, which is checked every ``interval``."""
+    conn, channel = Pipe(duplex=True)
+    call = _Call(fn, *args, channel=channel, closing=(channel,), **kwargs)
+    call.start()
+    stopping = False
+    with conn:
+        while True:
+            try:
+                if conn.poll(interval):
+                    progress(*conn.recv())
+            except EOFError:
+                break
+            if not stopping and cancelled():
+                stopping = True
+                with contextlib.suppress(BrokenPipeError):  # about to end anyway
+                    conn.send(None)
+    return call.result()
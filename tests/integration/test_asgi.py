@@ -0,0 +1,111 @@
+import asyncio
+import io
+import json
+import os
+import tarfile
+from base64 import b64encode
+
+import pytest
+
+from src.asgi import AsgiApp
+
+
+@pytest.fixture(scope="class")
+def asgi_app(app):
+    return AsgiApp(app, max_workers=4)
+
+
+@pytest.fixture()
+def auth(app, mocker):
+    mocker.patch("src.api.auth.load_user", return_value=None)
+    mocker.patch("src.services.auth.AuthSvc.authenticate", return_value=True)
+    return [(b"authorization", f"Basic {b64encode(b'user:pass').decode()}".encode())]
+
+
+def request(app, method, path, headers=(), body=b"", chunk_size=None):
+    """Run a request through the ASGI app, returning status, headers and the
+    body chunks sent."""
+    chunk_size = chunk_size or len(body) or 1
+    messages = [
+        {
+            "type": "http.request",
+            "body": body[i : i + chunk_size],
+            "more_body": i + chunk_size < len(body),
+        }
+        for i in range(0, len(body) or 1, chunk_size)
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)  # client stays connected
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": list(headers),
+    }
+    asyncio.run(app(scope, receive, send))
+    start, *chunks = sent
+    assert chunks[-1] == {"type": "http.response.body", "body": b""}
+    return start["status"], dict(start["headers"]), [c["body"] for c in chunks[:-1]]
+
+
+class TestAsgiApp:
+    def test_listing(self, asgi_app, auth, file):
+        status, headers, chunks = request(asgi_app, "GET", file.parent.as_posix(), auth)
+        assert status == 200
+        assert headers[b"content-type"] == b"application/json"
+        assert json.loads(b"".join(chunks)) == ["file.txt"]
+
+    def test_unauthorized_request_returns_401(self, asgi_app, file):
+        status, _, _ = request(asgi_app, "GET", file.as_posix())
+        assert status == 401
+
+    def test_download_streamed(self, asgi_app, auth, filedir):
+        (filedir / "file.bin").write_bytes(os.urandom(200_000))
+        accept = [(b"accept", b"application/octet-stream")]
+        path = filedir.as_posix()
+        status, _, chunks = request(asgi_app, "GET", path, [*auth, *accept])
+        assert status == 200
+        assert len(chunks) > 1
+        with tarfile.open(fileobj=io.BytesIO(b"".join(chunks)), mode="r:gz") as tar:
+            assert tar.getnames() == ["dir", "dir/file.bin"]
+
+    def test_upload(self, asgi_app, auth, filedir):
+        boundary = "boundary"
+        body = (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="files"; filename="new.txt"\r\n'
+            "Content-Type: text/plain\r\n\r\n"
+            "uploaded content\r\n"
+            f"--{boundary}--\r\n"
+        ).encode()
+        headers = [
+            *auth,
+            (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        path = filedir.as_posix()
+        status, _, _ = request(asgi_app, "POST", path, headers, body, chunk_size=10)
+        assert status == 201
+        assert (filedir / "new.txt").read_text() == "uploaded content"
+
+    def test_lifespan(self, asgi_app):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(AsgiApp(asgi_app.wsgi_app)({"type": "lifespan"}, receive, send))
+        assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
@@ -1,7 +1,14 @@
+import os
 import io
 import json
+import tarfile
+import time
+import zipfile
+
+import pytest
 
 from src import utils
+from src.services.cache import ArchiveCache
 
 
 class TestFileManagerActions:
@@ -24,6 +31,27 @@ class TestFileManagerActions:
         assert data["cwd"]["path"] == tmp_path.as_posix()
         assert len(data["files"]) == 3
 
+    def test_paginated_read_action(self, client, tmp_path):
+        for name in ("file3.txt", "file1.txt", "file2.txt"):
+            (tmp_path / name).touch()
+        payload = {
+            "action": "read",
+            "path": tmp_path.as_posix(),
+            "showHiddenItems": False,
+            "sortBy": "name",
+            "limit": 2,
+            "data": [],
+        }
+        response = client.post("/file-manager/actions", json=payload)
+        data = response.json
+        assert response.status_code == 200
+        assert [f["name"] for f in data["files"]] == ["file1.txt", "file2.txt"]
+        payload["cursor"] = data["cursor"]
+        response = client.post("/file-manager/actions", json=payload)
+        data = response.json
+        assert [f["name"] for f in data["files"]] == ["file3.txt"]
+        assert "cursor" not in data
+
     def test_create_action(self, client, tmp_path):
         dirs = tmp_path / "dirs"
         dirs.mkdir()
@@ -217,6 +245,34 @@ class TestFileManagerActions:
         assert (dst / "file2.txt").exists() is True
         assert (dst / "file2 (1).txt").exists() is True
 
+    def test_copy_action_reports_failures(self, client, tmp_path):
+        src = tmp_path / "src"
+        dst = tmp_path / "dst"
+        (src / "dir").mkdir(parents=True)
+        dst.mkdir()
+        (src / "dir" / "file.txt").touch()
+        os.mkfifo(src / "dir" / "fifo")
+        response = client.post(
+            "/file-manager/actions",
+            json={
+                "action": "copy",
+                "path": src.as_posix(),
+                "names": ["dir"],
+                "renameFiles": [],
+                "targetPath": dst.as_posix(),
+                "targetData": None,
+                "data": [],
+            },
+        )
+        data = response.json
+        assert response.status_code == 200
+        assert data["error"]["code"] == 400
+        [failure] = data["error"]["failures"]
+        assert failure["src"] == (src / "dir" / "fifo").as_posix()
+        assert failure["dst"] == (dst / "dir" / "fifo").as_posix()
+        assert "not a regular file" in failure["reason"]
+        assert (dst / "dir" / "file.txt").exists() is True
+
     def test_move_action(self, client, tmp_path):
         src = tmp_path / "src"
         dst = tmp_path / "dst"
@@ -353,6 +409,67 @@ class TestFileManagerDownload:
         assert headers["Content-Disposition"] == "attachment; filename=files.tar.gz"
         assert headers["Content-Type"] == "application/gzip"
 
+    def test_zip_download_action(self, client, tmp_path):
+        (tmp_path / "file1.txt").write_text("content " * 100)
+        (tmp_path / "file2.txt").touch()
+        response = client.post(
+            "/file-manager/download",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data={
+                "downloadInput": json.dumps(
+                    {
+                        "action": "download",
+                        "path": tmp_path.as_posix(),
+                        "names": ["file1.txt", "file2.txt"],
+                        "data": [],
+                    }
+                ),
+                "format": "zip",
+                "level": 1,
+            },
+        )
+        headers = response.headers
+        assert response.status_code == 200
+        assert headers["Content-Disposition"] == "attachment; filename=files.zip"
+        assert headers["Content-Type"] == "application/zip"
+        zf = zipfile.ZipFile(io.BytesIO(response.data))
+        assert zf.read("file1.txt") == b"content " * 100
+
+    def test_cached_download_action(self, app, client, tmp_path, monkeypatch, mocker):
+        cache = ArchiveCache(tmp_path / "cache", maxsize=10**6)
+        monkeypatch.setitem(app.extensions, "archive_cache", cache)
+        mocker.patch("time.time_ns", return_value=time.time_ns() + 10**10)
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "file1.txt").write_text("content")
+        data = {
+            "downloadInput": json.dumps(
+                {
+                    "action": "download",
+                    "path": tmp_path.as_posix(),
+                    "names": ["dir"],
+                    "data": [],
+                }
+            )
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        built = client.post("/file-manager/download", headers=headers, data=data)
+        assert built.status_code == 200
+        assert built.data  # cached once sent
+        assert len(os.listdir(cache.path)) == 1
+
+        cached = client.post("/file-manager/download", headers=headers, data=data)
+        assert cached.status_code == 200
+        assert cached.data == built.data
+        assert cached.headers["Content-Length"] == str(len(built.data))
+        assert cached.headers["Content-Type"] == "application/gzip"
+        names = tarfile.open(fileobj=io.BytesIO(cached.data)).getnames()
+        assert names == ["dir", "dir/file1.txt"]
+
+        (tmp_path / "dir" / "file2.txt").touch()  # rebuilt on changes
+        rebuilt = client.post("/file-manager/download", headers=headers, data=data)
+        assert len(tarfile.open(fileobj=io.BytesIO(rebuilt.data)).getnames()) == 3
+        assert len(os.listdir(cache.path)) == 2
+
     def test_missing_path_raises_404(self, client, tmp_path):
         response = client.post(
             "/file-manager/download",
@@ -371,6 +488,71 @@ class TestFileManagerDownload:
         assert response.json == {"code": 404, "description": "Not Found"}
 
 
+class TestFileManagerBatch:
+    def test_batch(self, client, tmp_path):
+        (tmp_path / "file.txt").write_text("content")
+        (tmp_path / "other.txt").touch()
+        (tmp_path / "taken").mkdir()
+        response = client.post(
+            "/file-manager/batch",
+            json={
+                "operations": [
+                    {"path": (tmp_path / "file.txt").as_posix()},
+                    {"op": "exists", "path": (tmp_path / "xyz").as_posix()},
+                    {"op": "stat", "path": (tmp_path / "xyz").as_posix()},
+                    {"op": "mkdir", "path": (tmp_path / "dir").as_posix()},
+                    {
+                        "op": "rename",
+                        "path": (tmp_path / "other.txt").as_posix(),
+                        "target": "taken",
+                    },
+                ]
+            },
+        )
+        assert response.status_code == 200
+        results = response.json["results"]
+        assert [r["code"] for r in results] == [200, 200, 404, 201, 409]
+        assert [r["op"] for r in results] == [
+            "stat",
+            "exists",
+            "stat",
+            "mkdir",
+            "rename",
+        ]
+        assert results[0]["stats"]["size"] == len("content")
+        assert results[1]["exists"] is False
+        assert results[3]["stats"]["name"] == "dir"
+        assert (tmp_path / "dir").is_dir() and (tmp_path / "other.txt").is_file()
+
+    def test_ordered_batch(self, client, tmp_path):
+        operations = [
+            {"op": "mkdir", "path": (tmp_path / "dir").as_posix()},
+            {"op": "mkdir", "path": (tmp_path / "dir" / "subdir").as_posix()},
+        ]
+        response = client.post("/file-manager/batch", json={"operations": operations})
+        assert response.status_code == 400
+        response = client.post(
+            "/file-manager/batch", json={"operations": operations, "ordered": True}
+        )
+        assert response.status_code == 200
+        assert [r["code"] for r in response.json["results"]] == [201, 201]
+
+    def test_invalid_batch_raises_400(self, app, client, tmp_path, monkeypatch):
+        response = client.post("/file-manager/batch", json={"operations": []})
+        assert response.status_code == 400
+        response = client.post(
+            "/file-manager/batch",
+            json={"operations": [{"op": "rename", "path": tmp_path.as_posix()}]},
+        )
+        assert response.status_code == 400
+        monkeypatch.setitem(app.config, "BATCH_MAX_SIZE", 1)
+        operation = {"op": "exists", "path": tmp_path.as_posix()}
+        response = client.post(
+            "/file-manager/batch", json={"operations": [operation, operation]}
+        )
+        assert response.status_code == 400
+
+
 class TestFileManagerUpload:
     def test_file_upload_action(self, client, tmp_path):
         file = tmp_path / "file.txt"
@@ -388,6 +570,147 @@ class TestFileManagerUpload:
         assert file.exists() is True
         assert file.read_text() == "dummy content"
 
+    def test_chunked_upload_action(self, client, tmp_path):
+        file = tmp_path / "file.txt"
+        content = [b"chunk0", b"chunk1", b"chunk2"]
+        for index in (0, 2, 1):
+            response = client.post(
+                "/file-manager/upload",
+                data={
+                    "action": "save",
+                    "path": tmp_path.as_posix(),
+                    "chunk-index": index,
+                    "chunk-size": 6,
+                    "total-chunk": 3,
+                    "uploadFiles": (io.BytesIO(content[index]), file.name),
+                },
+                content_type="multipart/form-data",
+            )
+            assert response.status_code == 200
+            if index != 1:
+                assert file.exists() is False
+        assert response.json["chunks"] == [0, 1, 2]
+        assert file.read_bytes() == b"".join(content)
+        assert [f.name for f in tmp_path.iterdir()] == [file.name]
+
+    def test_chunked_upload_ignores_other_uploads(self, client, tmp_path):
+        file = tmp_path / "file.txt"
+
+        def upload(index, content, total, upload_id):
+            return client.post(
+                "/file-manager/upload",
+                data={
+                    "action": "save",
+                    "path": tmp_path.as_posix(),
+                    "chunk-index": index,
+                    "chunk-size": 6,
+                    "total-chunk": total,
+                    "upload-id": upload_id,
+                    "uploadFiles": (io.BytesIO(content), file.name),
+                },
+                content_type="multipart/form-data",
+            )
+
+        upload(1, b"stale1", 3, "abandoned")
+        upload(0, b"stale0", 2, "other")
+        for index, content in enumerate((b"chunk0", b"chunk1", b"end")):
+            response = upload(index, content, 3, "current")
+            assert response.status_code == 200
+        assert response.json["chunks"] == [0, 1, 2]
+        assert file.read_bytes() == b"chunk0chunk1end"
+        response = client.post(
+            "/file-manager/upload",
+            data={
+                "action": "remove",
+                "path": tmp_path.as_posix(),
+                "cancel-uploading": file.name,
+            },
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 200
+        assert list(tmp_path.iterdir()) == []
+
+    def test_chunked_upload_with_gaps_raises_400(self, client, tmp_path):
+        file = tmp_path / "file.txt"
+        for index, content in enumerate((b"short", b"chunk1")):
+            response = client.post(
+                "/file-manager/upload",
+                data={
+                    "action": "save",
+                    "path": tmp_path.as_posix(),
+                    "chunk-index": index,
+                    "chunk-size": 6,
+                    "total-chunk": 2,
+                    "uploadFiles": (io.BytesIO(content), file.name),
+                },
+                content_type="multipart/form-data",
+            )
+        assert response.status_code == 400
+        assert list(tmp_path.iterdir()) == []
+
+    def test_chunked_upload_status_action(self, client, tmp_path):
+        file = tmp_path / "file.txt"
+        client.post(
+            "/file-manager/upload",
+            data={
+                "action": "save",
+                "path": tmp_path.as_posix(),
+                "chunk-index": 1,
+                "chunk-size": 6,
+                "total-chunk": 3,
+                "uploadFiles": (io.BytesIO(b"chunk1"), file.name),
+            },
+            content_type="multipart/form-data",
+        )
+        response = client.post(
+            "/file-manager/upload",
+            data={"action": "status", "path": tmp_path.as_posix(), "name": file.name},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 200
+        assert response.json == {"code": 200, "description": "OK", "chunks": [1]}
+        response = client.post(
+            "/file-manager/upload",
+            data={
+                "action": "remove",
+                "path": tmp_path.as_posix(),
+                "cancel-uploading": file.name,
+            },
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 200
+        assert list(tmp_path.iterdir()) == []
+
+    def test_upload_status_expires_abandoned_uploads(self, client, tmp_path):
+        for name in ("old.txt", "new.txt"):
+            client.post(
+                "/file-manager/upload",
+                data={
+                    "action": "save",
+                    "path": tmp_path.as_posix(),
+                    "chunk-index": 1,
+                    "chunk-size": 6,
+                    "total-chunk": 3,
+                    "uploadFiles": (io.BytesIO(b"chunk1"), name),
+                },
+                content_type="multipart/form-data",
+            )
+            if name == "old.txt":
+                for f in tmp_path.iterdir():
+                    os.utime(f, (0, 0))
+        response = client.post(
+            "/file-manager/upload",
+            data={"action": "status", "path": tmp_path.as_posix(), "name": "old.txt"},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 200
+        assert response.json["chunks"] == []
+        assert sorted(f.name for f in tmp_path.iterdir()) == [
+            ".new.txt.-3.chunks",
+            ".new.txt.-3.lock",
+            ".new.txt.-3.upload",
+        ]
+
     def test_missing_path_raises_404(self, client, tmp_path):
         response = client.post(
             "/file-manager/upload",
@@ -416,6 +739,43 @@ class TestFileManagerImages:
         assert headers["Content-Disposition"] == f"inline; filename={img.name}"
         assert headers["Content-Type"] == "image/jpeg"
 
+    def test_get_thumbnail(self, client, tmp_path):
+        Image = pytest.importorskip("PIL.Image")
+        img = tmp_path / "img.png"
+        Image.new("RGB", (1000, 500), "red").save(img)
+        query_string = {"path": img.as_posix(), "width": 96, "height": 96}
+        response = client.get("/file-manager/images", query_string=query_string)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "image/jpeg"
+        assert Image.open(io.BytesIO(response.data)).size == (128, 64)
+
+        etag = response.headers["ETag"]
+        response = client.get(
+            "/file-manager/images",
+            query_string=query_string,
+            headers={"If-None-Match": etag},
+        )
+        assert response.status_code == 304
+
+        query_string["original"] = "true"
+        response = client.get("/file-manager/images", query_string=query_string)
+        assert response.headers["Content-Type"] == "image/png"
+        assert response.data == img.read_bytes()
+
+    def test_cached_image_returns_304(self, client, tmp_path):
+        img = tmp_path / "img.jpeg"
+        img.write_bytes(b"image")
+        query_string = {"path": img.as_posix()}
+        response = client.get("/file-manager/images", query_string=query_string)
+        etag = response.headers["ETag"]
+        response = client.get(
+            "/file-manager/images",
+            query_string=query_string,
+            headers={"If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        assert response.data == b""
+
     def test_missing_path_raises_404(self, client, tmp_path):
         response = client.get(
             "/file-manager/images",
@@ -1,8 +1,11 @@
 import io
+import tarfile
 from base64 import b64encode
 
 import pytest
 
+from src import utils
+from src.api import filesystem
 from src.services.filemgr import FileManagerSvc
 
 
@@ -30,6 +33,32 @@ class TestFilesystemGET:
         assert response.status_code == 200
         assert response.json == ["file.txt"]
 
+    def test_paginated_listing_returns_200(self, client, auth, tmp_path):
+        for name, size in (("a", 3), ("b", 1), ("c", 2)):
+            (tmp_path / name).write_bytes(b"." * size)
+        path = tmp_path.as_posix()
+        query = {"limit": 2, "sortBy": "size", "sortOrder": "Descending"}
+        response = client.get(path, headers=auth, query_string=query)
+        assert response.status_code == 200
+        assert response.json == ["a", "c"]
+        link = response.headers["Link"]
+        assert link.endswith('>; rel="next"')
+        response = client.get(link[1 : link.index(">")], headers=auth)
+        assert response.json == ["b"]
+        assert "Link" not in response.headers
+
+    def test_invalid_cursor_returns_400(self, client, auth, tmp_path):
+        path = tmp_path.as_posix()
+        response = client.get(path, headers=auth, query_string={"cursor": "xyz"})
+        assert response.status_code == 400
+
+    def test_cursor_of_another_sort_order_returns_400(self, client, auth, tmp_path):
+        (tmp_path / "a").touch()
+        path = tmp_path.as_posix()
+        cursor = utils.encode_cursor([1, "a"])  # as if sorted by size
+        response = client.get(path, headers=auth, query_string={"cursor": cursor})
+        assert response.status_code == 400
+
     def test_permission_denied_returns_403(self, client, auth, filedir):
         path = filedir.as_posix()
         filedir.chmod(0o000)
@@ -59,6 +88,30 @@ class TestFilesystemGET:
         assert headers["Content-Disposition"] == "attachment; filename=file.txt"
         assert headers["Content-Type"] == "text/plain; charset=utf-8"
 
+    def test_file_range_returns_206(self, client, auth, file):
+        path = file.as_posix()
+        headers = {**auth, "accept": "application/octet-stream"}
+        response = client.get(path, headers=headers)
+        etag = response.headers["ETag"]
+        headers = {**headers, "Range": "bytes=5-8", "If-Range": etag}
+        response = client.get(path, headers=headers)
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == "bytes 5-8/21"
+        assert response.data == b"is a"
+
+    def test_file_not_modified_returns_304(self, client, auth, file):
+        path = file.as_posix()
+        headers = {**auth, "accept": "application/octet-stream"}
+        response = client.get(path, headers=headers)
+        etag = response.headers["ETag"]
+        headers = {**headers, "If-None-Match": etag}
+        response = client.get(path, headers=headers)
+        assert response.status_code == 304
+        file.write_text("this is another file")
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
     def test_directory_attachment_returns_200(self, client, auth, filedir):
         path = filedir.as_posix()
         headers = {**auth, "accept": "application/octet-stream"}
@@ -67,6 +120,9 @@ class TestFilesystemGET:
         assert response.status_code == 200
         assert headers["Content-Disposition"] == "attachment; filename=dir.tar.gz"
         assert headers["Content-Type"] == "application/gzip"
+        assert response.is_streamed is True
+        tar = tarfile.open(fileobj=io.BytesIO(response.data))
+        assert tar.getnames() == ["dir"]
 
     def test_unsupported_accept_header_path_returns_400(self, client, auth, tmp_path):
         path = tmp_path.as_posix()
@@ -91,6 +147,20 @@ class TestFilesystemPOST:
         assert response.status_code == 201
         assert file.exists() is True
 
+    def test_create_file_is_written_to_destination(
+        self, client, auth, file, filedir, mocker
+    ):
+        writer = mocker.spy(filesystem, "upload_writer")
+        response = client.post(
+            filedir.as_posix(),
+            headers=auth,
+            data={"files": (io.BytesIO(b"new content"), file.name)},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 201
+        writer.assert_called_once_with(f"{filedir}/{file.name}")
+        assert [f.read_text() for f in filedir.iterdir()] == ["new content"]
+
     def test_missing_path_returns_400(self, client, auth, file, tmp_path):
         path = (tmp_path / "xyz").as_posix()
         response = client.post(
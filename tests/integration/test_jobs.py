@@ -0,0 +1,126 @@
+import io
+import json
+import tarfile
+import time
+
+import pytest
+
+from src.app import create_app
+
+
+@pytest.fixture(scope="class")
+def client(tmp_path_factory):
+    app = create_app(
+        environ="testing",
+        configs={"JOBS_PATH": str(tmp_path_factory.mktemp("jobs"))},
+    )
+    with app.app_context():
+        yield app.test_client()
+    app.extensions["jobs"].shutdown()
+
+
+def wait(client, job):
+    for _ in range(100):
+        response = client.get(f"/file-manager/jobs/{job['id']}")
+        job = response.json
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(job)
+
+
+class TestFileManagerJobs:
+    def test_async_copy_action(self, client, tmp_path):
+        src, dst = tmp_path / "src", tmp_path / "dst"
+        (src / "dir").mkdir(parents=True)
+        (src / "dir" / "file1.txt").write_text("content")
+        dst.mkdir()
+        response = client.post(
+            "/file-manager/actions",
+            json={
+                "action": "copy",
+                "path": src.as_posix(),
+                "names": ["dir", "missing"],
+                "renameFiles": [],
+                "targetPath": dst.as_posix(),
+                "targetData": None,
+                "data": [],
+                "async": True,
+            },
+        )
+        assert response.status_code == 200
+        assert response.json["status"] in ("queued", "running")
+
+        job = wait(client, response.json)
+        assert job["status"] == "done"
+        assert job["progress"] == {
+            "items": 2,
+            "totalItems": 2,
+            "files": 1,
+            "bytes": len("content"),
+        }
+        done, failed = job["results"]
+        assert done["status"] == "done"
+        assert done["path"] == (dst / "dir").as_posix()
+        assert sum(done["strategies"].values()) == 1
+        assert failed["status"] == "failed"
+        assert "No such file or directory" in failed["error"]
+        assert (dst / "dir" / "file1.txt").read_text() == "content"
+
+    def test_async_download_action(self, client, tmp_path):
+        (tmp_path / "file1.txt").touch()
+        (tmp_path / "file2.txt").touch()
+        response = client.post(
+            "/file-manager/download",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data={
+                "downloadInput": json.dumps(
+                    {
+                        "action": "download",
+                        "path": tmp_path.as_posix(),
+                        "names": ["file1.txt", "file2.txt"],
+                        "data": [],
+                    }
+                ),
+                "async": "true",
+            },
+        )
+        job = wait(client, response.json)
+        assert job["status"] == "done"
+
+        response = client.get(f"/file-manager/jobs/{job['id']}/download")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/gzip"
+        names = tarfile.open(fileobj=io.BytesIO(response.data)).getnames()
+        assert sorted(names) == ["file1.txt", "file2.txt"]
+
+    @pytest.mark.parametrize(
+        "options",
+        [{"format": "tar", "level": 5}, {"format": "zip", "level": 15}],
+    )
+    def test_async_download_with_unsupported_level_raises_400(
+        self, client, tmp_path, options
+    ):
+        (tmp_path / "file1.txt").touch()
+        (tmp_path / "file2.txt").touch()
+        response = client.post(
+            "/file-manager/download",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data={
+                "downloadInput": json.dumps(
+                    {
+                        "action": "download",
+                        "path": tmp_path.as_posix(),
+                        "names": ["file1.txt", "file2.txt"],
+                        "data": [],
+                    }
+                ),
+                "async": "true",
+                **options,
+            },
+        )
+        assert response.status_code == 400
+
+    def test_unknown_job_raises_404(self, client):
+        assert client.get("/file-manager/jobs/xyz").status_code == 404
+        assert client.delete("/file-manager/jobs/xyz").status_code == 404
@@ -0,0 +1,121 @@
+import json
+import os
+from base64 import b64encode
+from urllib.parse import unquote_to_bytes
+
+import pytest
+from werkzeug.datastructures import Headers
+
+from src.app import create_app
+
+
+class StubProxy:
+    """WSGI middleware sending the files the app redirects to, as nginx does."""
+
+    def __init__(self, app, location):
+        self.app = app
+        self.location = location
+        self.redirects = []
+
+    def __call__(self, environ, start_response):
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            response.update(status=status, headers=Headers(headers))
+            return lambda data: None
+
+        body = self.app(environ, capture)
+        target = response["headers"].pop("X-Accel-Redirect", None)
+        if target is None:
+            start_response(response["status"], response["headers"].to_wsgi_list())
+            return body
+        if hasattr(body, "close"):
+            body.close()
+        self.redirects.append(target)
+        assert target.startswith(self.location)  # internal location
+        with open(unquote_to_bytes(target[len(self.location) :]), "rb") as f:
+            data = f.read()
+        headers = response["headers"]
+        headers["Content-Length"] = str(len(data))
+        start_response(response["status"], headers.to_wsgi_list())
+        return [data]
+
+
+@pytest.fixture(scope="class")
+def app():
+    app = create_app(
+        environ="testing",
+        configs={
+            "APPLICATION_ROOT": "/",
+            "SENDFILE_HEADER": "X-Accel-Redirect",
+            "SENDFILE_LOCATION": "/internal",
+        },
+    )
+    app.wsgi_app = StubProxy(app.wsgi_app, location="/internal")
+    return app
+
+
+@pytest.fixture()
+def proxy(app):
+    app.wsgi_app.redirects.clear()
+    return app.wsgi_app
+
+
+@pytest.fixture()
+def auth(app, mocker):
+    mocker.patch("src.api.auth.load_user", return_value=None)
+    mocker.patch("src.services.auth.AuthSvc.authenticate", return_value=True)
+    return {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
+
+
+class TestSendfile:
+    def test_file_attachment_is_sent_by_proxy(self, client, proxy, auth, tmp_path):
+        file = tmp_path / "fïle 1.txt"
+        file.write_text("content")
+        headers = {**auth, "accept": "application/octet-stream"}
+        response = client.get(file.as_posix(), headers=headers)
+        assert response.status_code == 200
+        assert response.data == b"content"
+        assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
+        assert "attachment" in response.headers["Content-Disposition"]
+        [target] = proxy.redirects
+        assert target == "/internal" + os.fsdecode(tmp_path) + "/f%C3%AFle%201.txt"
+
+    def test_download_action_is_sent_by_proxy(self, client, proxy, tmp_path):
+        (tmp_path / "file1.txt").write_text("content")
+        response = client.post(
+            "/file-manager/download",
+            data={
+                "downloadInput": json.dumps(
+                    {
+                        "action": "download",
+                        "path": tmp_path.as_posix(),
+                        "names": ["file1.txt"],
+                        "data": [],
+                    }
+                )
+            },
+        )
+        assert response.status_code == 200
+        assert response.data == b"content"
+        assert len(proxy.redirects) == 1
+
+    def test_original_image_is_sent_by_proxy(self, client, proxy, tmp_path):
+        img = tmp_path / "img.jpeg"
+        img.write_bytes(b"image")
+        response = client.get(
+            "/file-manager/images",
+            query_string={"path": img.as_posix(), "original": "true"},
+        )
+        assert response.status_code == 200
+        assert response.headers["Content-Disposition"] == "inline; filename=img.jpeg"
+        assert response.data == b"image"
+        assert len(proxy.redirects) == 1
+
+    def test_permissions_are_checked_ahead(self, client, proxy, tmp_path):
+        response = client.get(
+            "/file-manager/images",
+            query_string={"path": (tmp_path / "xyz.jpeg").as_posix()},
+        )
+        assert response.status_code == 404
+        assert proxy.redirects == []
@@ -0,0 +1,131 @@
+import gzip
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+from src.services import archive
+from src.services.archive import (
+    ParallelGzipWriter,
+    compressible,
+    tree_fingerprint,
+    write_archive,
+)
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    root = tmp_path / "dir"
+    (root / "subdir").mkdir(parents=True)
+    (root / "text.txt").write_text("compressible " * 1000)
+    (root / "subdir" / "random.bin").write_bytes(os.urandom(10_000))
+    (root / "photo.jpg").write_text("compressible " * 1000)
+    return root
+
+
+def archived(format, paths, **kwargs):
+    fileobj = io.BytesIO()
+    write_archive(fileobj, paths, format=format, **kwargs)
+    fileobj.seek(0)
+    return fileobj
+
+
+class TestArchive:
+    def test_compressible(self, tree):
+        assert compressible(tree / "text.txt", 13_000) is True
+        assert compressible(tree / "subdir" / "random.bin", 10_000) is False
+        assert compressible(tree / "photo.jpg", 13_000) is False  # by extension
+        assert compressible(tree / "text.txt", 100) is False  # too small
+
+    @pytest.mark.parametrize("format", ["tar", "tar.gz"])
+    def test_tar(self, tree, format):
+        fileobj = archived(format, [tree], level=1 if format == "tar.gz" else None)
+        names = tarfile.open(fileobj=fileobj).getnames()
+        assert sorted(names) == [
+            "dir",
+            "dir/photo.jpg",
+            "dir/subdir",
+            "dir/subdir/random.bin",
+            "dir/text.txt",
+        ]
+
+    def test_gzip_level(self, tree):
+        fast = archived("tar.gz", [tree], level=1).getvalue()
+        best = archived("tar.gz", [tree], level=9).getvalue()
+        assert gzip.decompress(fast) == gzip.decompress(best)
+
+    def test_parallel_gzip(self, tree):
+        single = archived("tar.gz", [tree], level=1).getvalue()
+        parallel = archived("tar.gz", [tree], level=1, workers=4).getvalue()
+        assert gzip.decompress(parallel) == gzip.decompress(single)
+        names = tarfile.open(fileobj=io.BytesIO(parallel), mode="r:gz").getnames()
+        assert "dir/subdir/random.bin" in names
+
+    @pytest.mark.parametrize("size", [0, 1000, 4096, 10_000])
+    def test_parallel_gzip_writer(self, size):
+        data = os.urandom(size // 2) + b"x" * (size - size // 2)
+        fileobj = io.BytesIO()
+        with ParallelGzipWriter(fileobj, workers=2, block_size=1024) as gz:
+            for i in range(0, size, 700):
+                gz.write(data[i : i + 700])
+        assert gzip.decompress(fileobj.getvalue()) == data
+
+    def test_zip_stores_incompressible_files(self, tree):
+        zf = zipfile.ZipFile(archived("zip", [tree]))
+        methods = {i.filename: i.compress_type for i in zf.infolist()}
+        assert methods == {
+            "dir/": zipfile.ZIP_STORED,
+            "dir/photo.jpg": zipfile.ZIP_STORED,
+            "dir/subdir/": zipfile.ZIP_STORED,
+            "dir/subdir/random.bin": zipfile.ZIP_STORED,
+            "dir/text.txt": zipfile.ZIP_DEFLATED,
+        }
+        assert zf.read("dir/text.txt") == (tree / "text.txt").read_bytes()
+
+    def test_zip_skips_special_files(self, tree):
+        os.mkfifo(tree / "fifo")
+        zf = zipfile.ZipFile(archived("zip", [tree]))
+        assert "dir/fifo" not in zf.namelist()
+        assert "dir/text.txt" in zf.namelist()
+
+    def test_zstd(self, tree):
+        if archive.zstandard is None:
+            with pytest.raises(ValueError):
+                archived("tar.zst", [tree])
+        else:
+            fileobj = archived("tar.zst", [tree], level=19)
+            content = archive.zstandard.ZstdDecompressor().stream_reader(fileobj)
+            assert "dir/text.txt" in tarfile.open(fileobj=content, mode="r|").getnames()
+
+    def test_unsupported_options_raise_exception(self, tree):
+        with pytest.raises(ValueError):
+            archived("rar", [tree])
+        with pytest.raises(ValueError):
+            archived("tar.gz", [tree], level=12)
+
+    def test_aborted_archive(self, tree):
+        aborted = []
+        with pytest.raises(FileNotFoundError):
+            archived("zip", [tree, tree / "xyz"], abort=lambda: aborted.append(1))
+        assert aborted == [1]
+
+    def test_tree_fingerprint(self, tree, mocker):
+        assert tree_fingerprint([tree]) is None  # just written
+        mocker.patch("time.time_ns", return_value=time.time_ns() + 10**10)
+        fingerprint = tree_fingerprint([tree])
+        assert fingerprint == tree_fingerprint([tree])
+        assert fingerprint != tree_fingerprint([tree / "subdir"])
+
+        os.utime(tree / "subdir", ns=(0, 0))
+        assert tree_fingerprint([tree]) != fingerprint
+        fingerprint = tree_fingerprint([tree])
+        stats = (tree / "text.txt").stat()
+        time.sleep(0.05)  # past the granularity of file times
+        (tree / "text.txt").write_text("rewritten!!! " * 1000)  # as by cp -p
+        os.utime(tree / "text.txt", ns=(stats.st_atime_ns, stats.st_mtime_ns))
+        assert tree_fingerprint([tree]) != fingerprint
+        with pytest.raises(FileNotFoundError):
+            tree_fingerprint([tree / "xyz"])
@@ -0,0 +1,117 @@
+import os
+import time
+
+import pytest
+
+from src.services.cache import ArchiveCache, ListingCache
+
+
+@pytest.fixture()
+def cache():
+    cache = ListingCache(maxsize=10, watch=False)
+    yield cache
+    cache.close()
+
+
+def listing(path):
+    def fn():
+        listing.calls += 1
+        return sorted(os.listdir(path))
+
+    listing.calls = 0
+    return fn
+
+
+class TestListingCache:
+    def test_fetch(self, cache, filedir):
+        fn = listing(filedir)
+        assert cache.fetch(filedir, "user", fn) == []
+        assert cache.fetch(filedir, "user", fn) == []
+        assert listing.calls == 1
+        assert cache.fetch(filedir, "other", fn) == []
+        assert listing.calls == 2
+
+    def test_fetch_after_change(self, cache, filedir):
+        fn = listing(filedir)
+        cache.fetch(filedir, "user", fn)
+        (filedir / "file.txt").touch()
+        os.utime(filedir, ns=(0, 0))  # not to depend on timestamp granularity
+        assert cache.fetch(filedir, "user", fn) == ["file.txt"]
+        assert listing.calls == 2
+
+    def test_fetch_expired(self, filedir):
+        cache = ListingCache(maxsize=10, max_age=0, watch=False)
+        fn = listing(filedir)
+        cache.fetch(filedir, "user", fn)
+        cache.fetch(filedir, "user", fn)
+        assert listing.calls == 2
+
+    def test_fetch_too_large(self, cache, tmp_path):
+        for i in range(10):
+            (tmp_path / str(i)).touch()
+        fn = listing(tmp_path)
+        cache.fetch(tmp_path, "user", fn)
+        cache.fetch(tmp_path, "user", fn)
+        assert listing.calls == 2
+
+    def test_fetch_missing_dir_raises_exception(self, cache, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            cache.fetch(tmp_path / "xyz", "user", listing(tmp_path / "xyz"))
+
+    def test_invalidate(self, cache, filedir):
+        fn = listing(filedir)
+        cache.fetch(filedir, "user", fn)
+        cache.invalidate(str(filedir))
+        cache.fetch(filedir, "user", fn)
+        cache.invalidate()
+        cache.fetch(filedir, "user", fn)
+        assert listing.calls == 3
+
+    def test_inotify(self, file):
+        cache = ListingCache(maxsize=10)
+        if cache._inotify is None:
+            pytest.skip("inotify unavailable")
+        fn = listing(file.parent)
+        try:
+            cache.fetch(file.parent, "user", fn)
+            file.write_text("modified")  # leaves the directory mtime as is
+            for _ in range(100):
+                if str(file.parent) not in cache._cache:
+                    break
+                time.sleep(0.01)
+            cache.fetch(file.parent, "user", fn)
+            assert listing.calls == 2
+        finally:
+            cache.close()
+
+
+class TestArchiveCache:
+    def test_store_and_lookup(self, tmp_path):
+        cache = ArchiveCache(tmp_path / "cache", maxsize=100)
+        key = cache.key("fingerprint", "tar.gz")
+        assert key == cache.key("fingerprint", "tar.gz", level=6)
+        assert key != cache.key("fingerprint", "tar.gz", level=1)
+        assert cache.lookup(key) is None
+
+        assert list(cache.store(key, iter([b"ab", b"cd"]))) == [b"ab", b"cd"]
+        with open(cache.lookup(key), "rb") as f:
+            assert f.read() == b"abcd"
+
+    def test_interrupted_store(self, tmp_path):
+        cache = ArchiveCache(tmp_path / "cache", maxsize=100)
+        chunks = cache.store("key", iter([b"ab", b"cd"]))
+        assert next(chunks) == b"ab"
+        chunks.close()  # e.g. client disconnected
+        assert cache.lookup("key") is None
+        assert os.listdir(cache.path) == []
+
+    def test_evict_least_recently_used(self, tmp_path):
+        cache = ArchiveCache(tmp_path / "cache", maxsize=10)
+        for i, key in enumerate(("a", "b", "c")):
+            list(cache.store(key, iter([b"1234"])))
+            os.utime(os.path.join(cache.path, key), (i, i))
+        assert sorted(os.listdir(cache.path)) == ["b", "c"]
+
+        cache.lookup("b")  # used last
+        list(cache.store("d", iter([b"1234"])))
+        assert sorted(os.listdir(cache.path)) == ["b", "d"]
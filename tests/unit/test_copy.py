@@ -0,0 +1,99 @@
+import errno
+import os
+import shutil
+from concurrent.futures import CancelledError
+from pathlib import Path
+
+import pytest
+
+from src.services.copy import copy_tree
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    root = tmp_path / "src"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "empty").mkdir()
+    (root / "file.txt").write_text("top")
+    (root / "a" / "file.txt").write_text("nested")
+    (root / "a" / "b" / "large.bin").write_bytes(os.urandom(100_000))
+    os.chmod(root / "a" / "file.txt", 0o640)
+    os.utime(root / "a" / "file.txt", ns=(10**18, 10**18))
+    os.utime(root / "a", ns=(10**18, 10**18))
+    return root
+
+
+def contents(root):
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            found[os.path.relpath(path, root)] = (
+                None if os.path.isdir(path) else Path(path).read_bytes()
+            )
+    return found
+
+
+class TestCopyTree:
+    def test_copy_tree(self, tree, tmp_path):
+        dst = tmp_path / "dst"
+        stats = copy_tree(tree, dst, workers=4, chunk_size=16 * 1024)
+        assert contents(dst) == contents(tree)
+        assert stats.files == 3 and stats.dirs == 4
+        assert stats.bytes == 100_000 + len("top") + len("nested")
+        assert sum(stats.strategies.values()) == 3
+
+        copied = os.stat(dst / "a" / "file.txt")
+        assert copied.st_mode & 0o777 == 0o640
+        assert copied.st_mtime_ns == 10**18
+        assert os.stat(dst / "a").st_mtime_ns == 10**18
+
+    def test_copy_file(self, tree, tmp_path):
+        dst = tmp_path / "large.bin"
+        copy_tree(tree / "a" / "b" / "large.bin", dst, chunk_size=30_000)
+        assert dst.read_bytes() == (tree / "a" / "b" / "large.bin").read_bytes()
+
+    def test_copy_falls_back_on_unsupported_strategies(self, tree, tmp_path, mocker):
+        unsupported = OSError(errno.EXDEV, "Invalid cross-device link")
+        mocker.patch("src.services.copy.fcntl.ioctl", side_effect=unsupported)
+        mocker.patch("os.copy_file_range", side_effect=unsupported, create=True)
+        mocker.patch("os.sendfile", side_effect=unsupported)
+        dst = tmp_path / "dst"
+        stats = copy_tree(tree, dst, chunk_size=16 * 1024)
+        assert contents(dst) == contents(tree)
+        assert stats.strategies == {"read_write": 3}
+
+    def test_copy_tree_progress_and_cancel(self, tree, tmp_path):
+        reported = []
+        copy_tree(tree, tmp_path / "dst", progress=lambda *c: reported.append(c))
+        assert sorted(reported) == [(1, 3), (1, 6), (1, 100_000)]
+
+        with pytest.raises(CancelledError):
+            copy_tree(tree, tmp_path / "cancelled", cancelled=lambda: True)
+
+    def test_copy_missing_file_raises_exception(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            copy_tree(tmp_path / "xyz", tmp_path / "dst")
+
+    def test_copy_tree_reports_errors(self, tree, tmp_path):
+        (tree / "a" / "link").symlink_to(tree / "xyz")
+        dst = tmp_path / "dst"
+        with pytest.raises(shutil.Error) as ex:
+            copy_tree(tree, dst)
+        [(src, _, reason)] = ex.value.args[0]
+        assert src == str(tree / "a" / "link")
+        assert "No such file or directory" in reason
+        # other files are copied regardless
+        assert (dst / "a" / "b" / "large.bin").exists()
+        assert (dst / "a" / "file.txt").read_text() == "nested"
+
+    def test_copy_tree_reports_special_files(self, tree, tmp_path):
+        os.mkfifo(tree / "a" / "fifo")
+        dst = tmp_path / "dst"
+        with pytest.raises(shutil.Error) as ex:
+            copy_tree(tree, dst)
+        [(src, _, reason)] = ex.value.args[0]
+        assert src == str(tree / "a" / "fifo")
+        assert "not a regular file" in reason
+        assert (dst / "a" / "file.txt").read_text() == "nested"
+        assert not (dst / "a" / "fifo").exists()
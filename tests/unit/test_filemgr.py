@@ -1,5 +1,10 @@
+import os
+from pathlib import Path
+
 import pytest
 
+from src.services import filesystem
+from src.services.cache import ListingCache
 from src.services.filemgr import FileManagerSvc
 
 
@@ -36,3 +41,138 @@ class TestFilesystemSvc:
         assert stats["type"] == ".txt"
         assert stats["isFile"] is True
         assert stats["hasChild"] is False
+
+    def test_scan(self, svc, tmp_path):
+        (tmp_path / "file.txt").touch()
+        (tmp_path / ".file.txt").touch()
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "subdir").mkdir()
+        (tmp_path / "subdir" / "file.txt").touch()
+        files = {f["name"]: f for f in svc.scan(path=tmp_path)}
+        assert sorted(files) == ["dir", "file.txt", "subdir"]
+        assert files["file.txt"]["isFile"] is True
+        assert files["file.txt"]["path"] == (tmp_path / "file.txt").as_posix()
+        assert files["dir"]["isFile"] is False
+        assert files["dir"]["hasChild"] is False
+        assert files["subdir"]["hasChild"] is True
+        assert files["subdir"] == svc.stats(path=tmp_path / "subdir")
+        assert len(svc.scan(path=tmp_path, show_hidden=True)) == 4
+
+    @pytest.mark.parametrize(
+        "path", ["/tmp//file.tar.gz", "/a/../.b", "/x.", "//a/b", "rel/x", "/a/."]
+    )
+    def test_stats_mapper_paths(self, svc, file, path):
+        stats = svc.stats_mapper(path, stats=file.stat())
+        p = Path(path)
+        assert stats["name"] == p.name
+        assert stats["path"] == p.as_posix()
+        assert stats["filterPath"] == os.path.join(p.parent, "")
+        assert stats["type"] == p.suffix
+
+    def test_scan_page_cached(self, svc, tmp_path):
+        (tmp_path / "dir").mkdir()
+        cache = ListingCache(maxsize=10, watch=False)
+        files, _ = svc.scan_page(path=tmp_path, cache=cache)
+        (tmp_path / "dir" / "file.txt").touch()  # parent directory is unchanged
+        assert svc.scan_page(path=tmp_path, cache=cache)[0] == files
+        assert files[0]["hasChild"] is False
+        (tmp_path / "file.txt").touch()
+        os.utime(tmp_path, ns=(0, 0))
+        files, _ = svc.scan_page(path=tmp_path, cache=cache)
+        assert sorted(f["name"] for f in files) == ["dir", "file.txt"]
+
+    def test_search(self, svc, tmp_path):
+        (tmp_path / "a" / "b").mkdir(parents=True)
+        (tmp_path / "File.txt").touch()
+        (tmp_path / "a" / "file.txt").touch()
+        (tmp_path / "a" / "b" / "file.md").touch()
+        (tmp_path / "a" / ".file").touch()
+        files = svc.search(path=tmp_path, pattern="file")
+        assert [f["name"] for f in files] == ["File.txt", "file.md", "file.txt"]
+        files = svc.search(path=tmp_path, pattern="*.txt", case_sensitive=True)
+        assert len(files) == 2
+        files = svc.search(path=tmp_path, pattern="f*", case_sensitive=True)
+        assert [f["name"] for f in files] == ["file.md", "file.txt"]
+        assert len(svc.search(path=tmp_path, pattern="file", max_depth=1)) == 2
+        assert len(svc.search(path=tmp_path, pattern="file", show_hidden=True)) == 4
+        assert len(svc.search(path=tmp_path, pattern="file", limit=1)) == 1
+        assert len(svc.search(path=tmp_path, pattern="[")) == 0
+
+    def test_search_limit_keeps_shallowest_matches(self, svc, tmp_path):
+        for name in "dcba":
+            (tmp_path / name / "sub").mkdir(parents=True)
+            (tmp_path / name / f"file-{name}").touch()
+            (tmp_path / name / "sub" / f"file-{name}-deep").touch()
+        for _ in range(5):
+            files = svc.search(path=tmp_path, pattern="file", limit=3, workers=4)
+            assert [f["name"] for f in files] == ["file-a", "file-b", "file-c"]
+
+    def test_search_on_missing_dir_raises_exception(self, svc, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            svc.search(path=tmp_path / "xyz", pattern="file")
+
+    def test_batch(self, svc, tmp_path):
+        (tmp_path / "file.txt").write_text("content")
+        outcomes = svc.batch(
+            [
+                {"op": "stat", "path": str(tmp_path / "file.txt")},
+                {"op": "exists", "path": str(tmp_path / "xyz")},
+                {"op": "mkdir", "path": str(tmp_path / "dir")},
+                {"op": "rename", "path": str(tmp_path / "dir"), "target": "xyz"},
+                {"op": "delete", "path": str(tmp_path / "xyz")},
+            ],
+            ordered=True,
+        )
+        (stats, _), (exists, _), (created, _), (renamed, _), deleted = outcomes
+        assert stats["name"] == "file.txt" and stats["size"] == len("content")
+        assert exists is False
+        assert created["name"] == "dir" and created["isFile"] is False
+        assert renamed["name"] == "xyz"
+        assert deleted == (None, None) and not (tmp_path / "xyz").exists()
+
+    def test_unordered_batch_over_same_paths_raises_exception(self, svc, tmp_path):
+        operations = [
+            {"op": "mkdir", "path": str(tmp_path / "dir")},
+            {"op": "mkdir", "path": str(tmp_path / "dir" / "subdir")},
+        ]
+        with pytest.raises(ValueError):
+            svc.batch(operations)
+        with pytest.raises(ValueError):
+            svc.batch([operations[0], {"op": "exists", "path": str(tmp_path / "dir")}])
+        svc.batch([{"op": "stat", "path": str(tmp_path)}] * 2)  # read only
+
+    def test_batch_reports_errors(self, svc, tmp_path):
+        for name in ("dir", "other"):
+            (tmp_path / name).mkdir()
+        for name in ("taken", "a.txt", "b.txt"):
+            (tmp_path / name).write_text(name)
+        outcomes = svc.batch(
+            [
+                {"op": "mkdir", "path": str(tmp_path / "dir")},
+                {"op": "stat", "path": str(tmp_path / "xyz")},
+                {"op": "rename", "path": str(tmp_path / "other"), "target": "taken"},
+                {"op": "rename", "path": str(tmp_path / "a.txt"), "target": "b.txt"},
+            ]
+        )
+        errors = [type(error) for _, error in outcomes]
+        assert errors == [FileExistsError, FileNotFoundError] + [FileExistsError] * 2
+        assert (tmp_path / "other").is_dir()
+        assert (tmp_path / "a.txt").read_text() == "a.txt"
+
+    def test_rename_without_replacing(self, svc, tmp_path, monkeypatch):
+        for renameat2 in (filesystem._renameat2, None):
+            monkeypatch.setattr(filesystem, "_renameat2", renameat2)
+            (tmp_path / "dir").mkdir()
+            (tmp_path / "taken").mkdir()
+            (tmp_path / "file.txt").write_text("file")
+            (tmp_path / "taken.txt").write_text("taken")
+            for src, dst in (("dir", "taken"), ("file.txt", "taken.txt")):
+                with pytest.raises(FileExistsError):
+                    svc.rename(tmp_path / src, tmp_path / dst, replace=False)
+            svc.rename(tmp_path / "dir", tmp_path / "dir2", replace=False)
+            svc.rename(tmp_path / "file.txt", tmp_path / "file2.txt", replace=False)
+            assert (tmp_path / "file2.txt").read_text() == "file"
+            assert not (tmp_path / "file.txt").exists()
+            assert (tmp_path / "taken.txt").read_text() == "taken"
+            for path in tmp_path.iterdir():
+                (path.rmdir if path.is_dir() else path.unlink)()
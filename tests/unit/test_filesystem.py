@@ -1,10 +1,18 @@
+import io
 import os
 import stat
 import tarfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
-from src.services.filesystem import FilesystemSvc
+from src.services.filesystem import (
+    FilesystemSvc,
+    stream_attachment,
+    stream_chunk,
+    stream_upload,
+    upload_writer,
+)
 
 
 @pytest.fixture(scope="class")
@@ -31,6 +39,38 @@ class TestFilesystemSvc:
         filedir.chmod(0o755)
         assert "Permission denied" in str(ex.value)
 
+    def test_scan(self, svc, file, tmp_path):
+        (tmp_path / "link").symlink_to(tmp_path / "xyz")
+        entries = {os.path.basename(p): (s, c) for p, s, c in svc.scan(tmp_path)}
+        assert stat.S_ISREG(entries[file.name][0].st_mode) is True
+        assert stat.S_ISLNK(entries["link"][0].st_mode) is True
+        assert entries[file.name][1] is False
+
+    def test_scan_has_child(self, svc, tmp_path, mocker):
+        mocker.patch("src.services.filesystem.time.time", return_value=2**40)
+        (tmp_path / "empty").mkdir()
+        (tmp_path / "parent" / "child").mkdir(parents=True)
+        (tmp_path / "files").mkdir()
+        (tmp_path / "files" / "file.txt").touch()
+        entries = {os.path.basename(p): c for p, _, c in svc.scan(tmp_path)}
+        assert entries == {"empty": False, "parent": True, "files": True}
+
+        # answered from the cache until the directory changes
+        scandir = mocker.spy(os, "scandir")
+        assert svc.has_children([tmp_path / "empty"]) == [False]
+        assert scandir.call_count == 0
+        (tmp_path / "empty" / "file.txt").touch()
+        assert svc.has_children([tmp_path / "empty"]) == [True]
+        assert scandir.call_count == 1
+
+    def test_scan_has_child_lazy(self, svc, tmp_path):
+        (tmp_path / "empty").mkdir()
+        (tmp_path / "parent" / "child").mkdir(parents=True)
+        entries = {os.path.basename(p): c for p, _, c in svc.scan(tmp_path, lazy=True)}
+        assert entries == {"empty": True, "parent": True}
+        assert svc.has_children([tmp_path / "empty"], lazy=True) == [True]
+        assert svc.has_child(tmp_path / "empty") is False
+
     def test_stats(self, svc, file):
         stats = svc.stats(path=file)
         assert stat.S_ISREG(stats.st_mode) is True
@@ -46,6 +86,61 @@ class TestFilesystemSvc:
         assert file.exists() is True
         assert file.read_text() == "dummy content"
 
+    def test_stream_upload(self, svc, file, filedir):
+        content = os.urandom(1024**2)
+        stream_upload(filedir / "file.bin", stream=io.BytesIO(content))
+        stream_upload(file, stream=io.BytesIO(b"new content"))
+        assert (filedir / "file.bin").read_bytes() == content
+        assert file.read_text() == "new content"
+        assert [f.name for f in filedir.iterdir()] == ["file.bin"]
+
+    def test_stream_upload_aborted_leaves_no_file(self, svc, filedir, mocker):
+        stream = mocker.Mock()
+        stream.read.side_effect = (b"partial content", ConnectionResetError)
+        with pytest.raises(ConnectionResetError):
+            stream_upload(filedir / "file.txt", stream=stream)
+        assert list(filedir.iterdir()) == []
+
+    def test_upload_writer(self, svc, file, filedir):
+        writer = upload_writer(file)
+        writer.write(b"new content")
+        tmp = writer.result()
+        writer.close()
+        assert file.read_text() == "this is a sample file"
+        with pytest.raises(FileExistsError):
+            svc.commit(tmp, file, replace=False)
+        assert sorted(f.name for f in file.parent.iterdir()) == ["dir", "file.txt"]
+
+        writer = upload_writer(filedir / "file.txt")
+        writer.write(b"new content")
+        svc.commit(writer.result(), filedir / "file.txt", replace=False)
+        writer.close()
+        assert [f.read_text() for f in filedir.iterdir()] == ["new content"]
+
+    def test_upload_writer_closed_early_leaves_no_file(self, svc, filedir):
+        writer = upload_writer(filedir / "file.txt")
+        writer.write(b"partial content")
+        writer.close()
+        assert list(filedir.iterdir()) == []
+
+    def test_stream_chunks_concurrently(self, svc, tmp_path):
+        path = tmp_path / "file.bin"
+        content = [os.urandom(4096) for _ in range(16)]
+
+        def upload(index):
+            stream = io.BytesIO(content[index])
+            return stream_chunk(path, stream, index, index * 4096, len(content))
+
+        with ThreadPoolExecutor(8) as pool:
+            outcomes = list(pool.map(upload, range(len(content))))
+        assert sum(chunks == list(range(16)) for chunks in outcomes) == 1
+        assert path.read_bytes() == b"".join(content)
+        assert [f.name for f in tmp_path.iterdir()] == ["file.bin"]
+
+    def test_stream_upload_on_missing_dir_raises_exception(self, svc, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            stream_upload(tmp_path / "xyz" / "file.txt", stream=io.BytesIO(b"."))
+
     def test_mkdir(self, svc, filedir):
         dirpath = filedir / "dir"
         svc.mkdir(path=dirpath)
@@ -118,12 +213,16 @@ class TestFilesystemSvc:
         assert f == (filedir / "file (2).txt").as_posix()
         assert d == (filedir / "dir (2)").as_posix()
 
-    def test_create_attachment(self, svc, file, filedir):
-        fileobj = svc.create_attachment(paths=(file, filedir))
+    def test_stream_attachment(self, svc, file, filedir):
+        fileobj = io.BytesIO(b"".join(stream_attachment(paths=(file, filedir))))
         names = tarfile.open(fileobj=fileobj).getnames()
         assert file.name in names
         assert filedir.name in names
 
+    def test_stream_attachment_on_missing_file_raises_exception(self, svc, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            stream_attachment(paths=(tmp_path / "xyz",))
+
     def test_is_file(self, svc, file, filedir):
         assert svc.is_file(file) is True
         assert svc.is_file(filedir) is False
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from src.utils import streams, system_username
+from src.utils.impersonation import Session, SessionPool, impersonate, session
+
+
+@impersonate(username=None)
+class Probe:
+    @staticmethod
+    def ids():
+        return os.getuid(), os.getgid(), os.getpid()
+
+    @classmethod
+    def name(cls):
+        return cls.__name__
+
+    @staticmethod
+    def fail():
+        raise FileNotFoundError("missing")
+
+    @staticmethod
+    def echo(data, channel=None):
+        writer = streams.ConnectionWriter(channel)
+        writer.write(data)
+
+
+class TestSession:
+    def test_call(self):
+        with Session(system_username()) as current:
+            ids = current.call(Probe, "ids")
+            assert ids[:2] == (os.getuid(), os.getgid())
+            assert ids[2] != os.getpid()
+            assert current.call(Probe, "ids") == ids  # same process
+            assert current.call(Probe, "name", Probe) == "Probe"
+
+    def test_call_raises_exception(self):
+        with Session(system_username()) as current, pytest.raises(FileNotFoundError):
+            current.call(Probe, "fail")
+
+    def test_call_with_channel(self):
+        with Session(system_username()) as current:
+            chunks = streams.iter_call(current.call, Probe, "echo", b"data")
+            assert b"".join(chunks) == b"data"
+
+    def test_closed(self):
+        current = Session(system_username())
+        current.close()
+        with pytest.raises(RuntimeError):
+            current.call(Probe, "ids")
+
+    @pytest.mark.skipif(os.getuid() != 0, reason="requires root")
+    def test_switch_user(self):
+        with Session("nobody") as current:
+            uid, gid, _ = current.call(Probe, "ids")
+        assert (uid, gid) != (0, 0)
+
+    def test_unknown_user_raises_exception(self):
+        with pytest.raises(KeyError):
+            Session("unknown-user-xyz")
+
+
+def test_impersonate_without_user():
+    assert Probe.ids()[2] == os.getpid()
+    assert Probe.name() == "Probe"
+
+
+def test_session_as_process_user():
+    with session(system_username()) as current:
+        assert current is None
+        assert Probe.ids()[2] == os.getpid()
+
+
+class TestSessionPool:
+    def test_acquire(self):
+        pool = SessionPool()
+        try:
+            current, release = pool.acquire(system_username())
+            release()
+            assert pool.acquire(system_username())[0] is current
+            current.close()  # e.g. crashed
+            assert pool.acquire(system_username())[0] is not current
+        finally:
+            pool.close()
+
+    def test_evict(self):
+        pool = SessionPool(idle_timeout=0)
+        current, release = pool.acquire(system_username())
+        pool.evict()
+        assert not current.closed  # still in use
+        release()
+        pool.evict()
+        assert current.closed
@@ -0,0 +1,77 @@
+import logging
+import os
+
+import pytest
+
+from src.services.filemgr import FileManagerSvc
+from src.services.index import SearchIndex
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    root = tmp_path / "root"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / ".hidden").mkdir()
+    (root / "File.txt").touch()
+    (root / "a" / "file.txt").touch()
+    (root / "a" / "b" / "file.md").touch()
+    (root / ".hidden" / "file.txt").touch()
+    return root
+
+
+@pytest.fixture()
+def index(tmp_path, tree):
+    index = SearchIndex(db_path=tmp_path / "index.db", roots=[tree])
+    index.refresh()
+    return index
+
+
+class TestSearchIndex:
+    def test_covers(self, index, tree):
+        assert index.covers(tree) is True
+        assert index.covers(tree / "a") is True
+        assert index.covers(tree.parent) is False
+        assert index.covers(f"{tree}x") is False
+
+    def test_lookup(self, index, tree):
+        paths = sorted(index.lookup(tree, "file"))
+        assert paths == [
+            (tree / "File.txt").as_posix(),
+            (tree / "a" / "b" / "file.md").as_posix(),
+            (tree / "a" / "file.txt").as_posix(),
+        ]
+        assert len(list(index.lookup(tree, "file", case_sensitive=True))) == 2
+        assert len(list(index.lookup(tree, "*.txt", show_hidden=True))) == 3
+        assert len(list(index.lookup(tree, "file", max_depth=0))) == 1
+        assert len(list(index.lookup(tree / "a", "f?le.[mt][dx]*"))) == 2
+
+    def test_incremental_refresh(self, index, tree):
+        (tree / "a" / "b" / "file.md").unlink()
+        (tree / "a" / "b").rmdir()
+        (tree / "c").mkdir()
+        (tree / "c" / "file.log").touch()
+        index.refresh()
+        paths = sorted(index.lookup(tree, "file"))
+        assert paths == [
+            (tree / "File.txt").as_posix(),
+            (tree / "a" / "file.txt").as_posix(),
+            (tree / "c" / "file.log").as_posix(),
+        ]
+
+    def test_refresh_skips_names_not_in_utf8(self, index, tree, caplog):
+        with open(os.path.join(os.fsencode(tree), b"file\xff.txt"), "w"):
+            pass
+        with caplog.at_level(logging.WARNING, logger="src.services.index"):
+            index.refresh()
+        assert "not UTF-8" in caplog.text
+        assert len(list(index.lookup(tree, "file"))) == 3
+
+    def test_search_with_index(self, index, tree):
+        (tree / "a" / "file.txt").unlink()  # stale entry is skipped
+        files = FileManagerSvc.search(tree, "file", index=index, limit=5)
+        assert [f["name"] for f in files] == ["File.txt", "file.md"]
+        assert len(FileManagerSvc.search(tree, "file", index=index, limit=1)) == 1
+
+    def test_search_with_index_on_missing_dir_raises_exception(self, index, tree):
+        with pytest.raises(FileNotFoundError):
+            FileManagerSvc.search(tree / "xyz", "file", index=index)
@@ -0,0 +1,140 @@
+import errno
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from src.services.filemgr import FileManagerSvc
+from src.services.jobs import JobManager
+
+
+@pytest.fixture()
+def jobs(tmp_path):
+    jobs = JobManager(Flask(__name__), path=tmp_path / "jobs", workers=1)
+    yield jobs
+    jobs.shutdown()
+
+
+def wait(jobs, job_id):
+    for _ in range(100):
+        job = jobs.get(job_id)
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(job)
+
+
+@pytest.fixture()
+def dirs(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    for name in ("a", "b", "c"):
+        (src / name).write_text(name)
+    return src, dst
+
+
+class TestJobManager:
+    def test_move(self, jobs, dirs):
+        src, dst = dirs
+        (dst / "a").touch()
+        job = jobs.submit("move", path=str(src), names=["a", "b"], targetPath=str(dst))
+        job = wait(jobs, job["id"])
+        assert job["status"] == "done"
+        assert [r["path"] for r in job["results"]] == [
+            str(dst / "a (1)"),
+            str(dst / "b"),
+        ]
+        assert sorted(p.name for p in src.iterdir()) == ["c"]
+
+    def test_resume(self, jobs, dirs):
+        src, dst = dirs
+        job_id = "0" * 32
+        (dst / "b").write_text("not created by the job")
+        (dst / f".b.{job_id}.part").write_text("partial")
+        job = {
+            "id": job_id,
+            "action": "copy",
+            "status": "running",  # as left behind by a worker which died
+            "username": None,
+            "createdAt": time.time(),
+            "updatedAt": time.time(),
+            "params": {"path": str(src), "names": ["a", "b"], "targetPath": str(dst)},
+            "progress": {"items": 1, "totalItems": 2, "files": 1, "bytes": 1},
+            "results": [
+                {"name": "a", "status": "done", "path": str(dst / "a")},
+                {"name": "b", "status": "running", "path": str(dst / "b")},
+            ],
+        }
+        jobs.store.save(job)
+        jobs.recover()
+        job = wait(jobs, job["id"])
+        assert job["status"] == "done"
+        strategies = job["results"][1].pop("strategies")
+        assert job["results"][1] == {
+            "name": "b",
+            "status": "done",
+            "path": str(dst / "b (1)"),
+        }
+        assert sum(strategies.values()) == 1  # files copied by each strategy
+        # a was not copied again, and only the partial copy of b was removed
+        assert sorted(p.name for p in dst.iterdir()) == ["b", "b (1)"]
+        assert (dst / "b").read_text() == "not created by the job"
+        assert (dst / "b (1)").read_text() == "b"
+
+    def test_move_across_devices(self, jobs, dirs, mocker):
+        src, dst = dirs
+        original = FileManagerSvc.rename
+
+        def rename(path, target, replace=True):
+            if os.path.dirname(path) == str(src):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            return original(path, target, replace=replace)
+
+        mocker.patch.object(FileManagerSvc, "rename", side_effect=rename)
+        job = jobs.submit("move", path=str(src), names=["a"], targetPath=str(dst))
+        job = wait(jobs, job["id"])
+        assert job["status"] == "done"
+        assert job["results"][0]["copied"] is True
+        assert sorted(p.name for p in src.iterdir()) == ["b", "c"]
+        assert [p.name for p in dst.iterdir()] == ["a"]
+        assert (dst / "a").read_text() == "a"
+
+    def test_resume_move_across_devices(self, jobs, dirs):
+        src, dst = dirs
+        job_id = "2" * 32
+        (dst / f".a.{job_id}.part").write_text("a")  # copied, source not deleted
+        job = {
+            "id": job_id,
+            "action": "move",
+            "status": "running",
+            "username": None,
+            "createdAt": time.time(),
+            "updatedAt": time.time(),
+            "params": {"path": str(src), "names": ["a"], "targetPath": str(dst)},
+            "progress": {"items": 0, "totalItems": 1, "files": 0, "bytes": 0},
+            "results": [{"name": "a", "status": "running", "copied": True}],
+        }
+        jobs.store.save(job)
+        jobs.recover()
+        job = wait(jobs, job["id"])
+        assert job["status"] == "done"
+        assert sorted(p.name for p in src.iterdir()) == ["b", "c"]
+        assert [p.name for p in dst.iterdir()] == ["a"]
+
+    def test_cancel(self, jobs, dirs, mocker):
+        src, dst = dirs
+        job_id = "1" * 32
+        mocker.patch("uuid.uuid4", return_value=mocker.Mock(hex=job_id))
+        jobs.store.cancel(job_id)  # ahead of its run
+        jobs.submit("delete", path=str(src), names=["a", "b"])
+        job = wait(jobs, job_id)
+        assert job["status"] == "cancelled"
+        assert {r["status"] for r in job["results"]} == {"cancelled"}
+        assert sorted(p.name for p in src.iterdir()) == ["a", "b", "c"]
+
+    def test_unknown_job(self, jobs):
+        for job_id in ("xyz", "../jobs", ".."):
+            with pytest.raises(KeyError):
+                jobs.get(job_id)
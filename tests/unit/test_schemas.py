@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+from marshmallow import fields, Schema
+
+from src.schemas.serializers import filemgr as sl
+from src.schemas.serializers.fast import compile_dump, fast_dump
+
+STATS = {
+    "name": "file.txt",
+    "path": "/tmp/file.txt",
+    "filterPath": "/tmp/",
+    "size": 1024,
+    "isFile": True,
+    "dateModified": datetime(2023, 1, 2, 3, 4, 5, 678),
+    "dateCreated": datetime(2023, 1, 2, 3, 4, 5),
+    "type": ".txt",
+    "hasChild": 0,
+    "mode": 33188,
+    "unknown": "ignored",
+}
+
+
+@pytest.mark.parametrize(
+    "schema, data",
+    [
+        (sl.StatsSchema(), STATS),
+        (sl.StatsSchema(), {"name": 1, "size": None, "hasChild": "yes"}),
+        (sl.StatsResponseSchema(), {"cwd": STATS, "files": [STATS, {}], "cursor": "c"}),
+        (sl.StatsResponseSchema(), {"files": None}),
+        (
+            sl.ErrorResponseSchema(),
+            {"error": {"code": 400, "description": "e", "fileExists": ["a"]}},
+        ),
+        (
+            sl.DetailsResponseSchema(),
+            {"details": {"name": "a", "size": "1 KB", "created": STATS["dateCreated"]}},
+        ),
+    ],
+)
+def test_compile_dump(schema, data):
+    assert compile_dump(schema)(data) == schema.dump(data)
+    assert list(compile_dump(schema)(data)) == list(schema.dump(data))
+
+
+def test_fast_dump_unsupported_schema():
+    class CustomSchema(Schema):
+        url = fields.Url()
+
+    schema = CustomSchema()
+    with pytest.raises(TypeError):
+        compile_dump(schema)
+    assert fast_dump(schema) == schema.dump
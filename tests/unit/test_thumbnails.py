@@ -0,0 +1,120 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from src.services.cache import DiskCache
+from src.services.thumbnails import (
+    Thumbnailer,
+    make_thumbnail,
+    thumbnail_key,
+    thumbnail_size,
+)
+
+
+@pytest.fixture()
+def image(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "image.jpeg"
+    Image.new("RGB", (1000, 500), "red").save(path)
+    return path
+
+
+class TestThumbnails:
+    def test_thumbnail_size(self):
+        assert thumbnail_size() == 256
+        assert thumbnail_size(96) == 128
+        assert thumbnail_size(96, 200) == 256
+        assert thumbnail_size(height=5000) == 1024
+
+    def test_thumbnail_key(self, image):
+        key = thumbnail_key(image.stat(), 128)
+        assert key != thumbnail_key(image.stat(), 256)
+        image.write_bytes(image.read_bytes() + b"\0")
+        assert key != thumbnail_key(image.stat(), 128)
+        key, stats = thumbnail_key(image.stat(), 128), image.stat()
+        time.sleep(0.05)  # past the granularity of file times
+        image.write_bytes(image.read_bytes()[:-1] + b"\1")  # same size
+        os.utime(image, ns=(stats.st_atime_ns, stats.st_mtime_ns))
+        assert key != thumbnail_key(image.stat(), 128)
+
+    def test_make_thumbnail(self, image):
+        from PIL import Image
+
+        data, mimetype = make_thumbnail(image, 128)
+        assert mimetype == "image/jpeg"
+        assert Image.open(io.BytesIO(data)).size == (128, 64)
+
+        Image.new("RGBA", (100, 100)).save(image.with_suffix(".png"))
+        _, mimetype = make_thumbnail(image.with_suffix(".png"), 64)
+        assert mimetype == "image/png"
+
+    def test_make_thumbnail_of_non_image_raises_exception(self, tmp_path):
+        (tmp_path / "image.jpeg").write_bytes(b"image")
+        with pytest.raises(ValueError):
+            make_thumbnail(tmp_path / "image.jpeg", 128)
+        with pytest.raises(FileNotFoundError):
+            make_thumbnail(tmp_path / "xyz.jpeg", 128)
+
+
+class TestThumbnailer:
+    def test_cached_thumbnails(self, tmp_path):
+        thumbnailer = Thumbnailer(cache=DiskCache(tmp_path, maxsize=100))
+        calls = []
+
+        def generate():
+            calls.append(1)
+            return b"thumbnail", "image/png"
+
+        thumbnail = thumbnailer.get("key", generate)
+        assert thumbnail.data == b"thumbnail" and thumbnail.path is None
+        thumbnail = thumbnailer.get("key", generate)
+        with open(thumbnail.path, "rb") as f:
+            assert f.read() == b"thumbnail"
+        assert thumbnail.mimetype == "image/png"
+        assert len(calls) == 1
+        thumbnailer.shutdown()
+
+    def test_concurrent_requests_share_generation(self):
+        thumbnailer = Thumbnailer(workers=2)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def generate():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return b"thumbnail", "image/jpeg"
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(thumbnailer.get("k", generate))
+            )
+            for _ in range(3)
+        ]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)  # for them to wait for the generation in progress
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert [r.data for r in results] == [b"thumbnail"] * 3
+
+        thumbnailer.shutdown()
+
+    def test_failed_generation_raises_exception(self):
+        thumbnailer = Thumbnailer()
+
+        def generate():
+            raise ValueError("not an image")
+
+        for _ in range(2):  # failures are not kept
+            with pytest.raises(ValueError):
+                thumbnailer.get("key", generate)
+        thumbnailer.shutdown()
@@ -0,0 +1,72 @@
+import errno
+import os
+import pwd
+
+import pytest
+from flask import Flask
+
+from src.services.filesystem import FilesystemSvc
+from src.services.trash import TRASH_DIRNAME, TrashPurger, purge_tree
+
+
+@pytest.fixture()
+def volume(tmp_path):
+    (tmp_path / "dir" / "subdir").mkdir(parents=True)
+    (tmp_path / "dir" / "subdir" / "file.txt").touch()
+    (tmp_path / "dir" / "file.txt").touch()
+    return tmp_path
+
+
+class TestTrash:
+    def test_delete_moves_tree_to_trash(self, volume):
+        purger = TrashPurger(Flask(__name__), [volume], purge=FilesystemSvc.purge)
+        trash = volume / TRASH_DIRNAME
+        assert trash.stat().st_mode & 0o7777 == 0o1777
+
+        FilesystemSvc.delete(volume / "dir", volumes=[volume])
+        assert (volume / "dir").exists() is False
+        [user_trash] = trash.iterdir()
+        assert user_trash.name == str(os.getuid())
+        [deleted] = user_trash.iterdir()
+        assert deleted.name.endswith("-dir")
+        assert (deleted / "subdir" / "file.txt").exists()
+
+        purger.purge_all()
+        assert list(user_trash.iterdir()) == []
+
+    def test_delete_without_trash(self, volume):
+        with pytest.raises(OSError) as ex:
+            FilesystemSvc.delete(volume / "dir", volumes=[volume / "other"])
+        assert ex.value.errno == errno.ENOTEMPTY
+        assert (volume / "dir" / "file.txt").exists() is True
+
+        FilesystemSvc.delete(volume / "dir", volumes=[], recursive=True)
+        assert (volume / "dir").exists() is False
+        assert (volume / TRASH_DIRNAME).exists() is False
+
+    def test_purge_tree(self, volume):
+        os.chmod(volume / "dir" / "subdir", 0o500)  # read-only
+        purge_tree(volume / "dir", workers=2, rate=1000)
+        assert (volume / "dir").exists() is False
+
+    def test_purge_tree_does_not_follow_symlinks(self, volume, tmp_path_factory):
+        outside = tmp_path_factory.mktemp("outside")
+        (outside / "file.txt").touch()
+        os.symlink(outside, volume / "dir" / "link")
+        os.symlink(outside, volume / "link")
+        purge_tree(volume / "dir", workers=2)
+        purge_tree(volume / "link")
+        assert not (volume / "dir").exists() and not (volume / "link").exists()
+        assert (outside / "file.txt").exists()
+
+    @pytest.mark.skipif(os.geteuid() != 0, reason="needs to change owners")
+    def test_purge_replaces_trash_of_another_user(self, volume):
+        purger = TrashPurger(Flask(__name__), [volume], purge=FilesystemSvc.purge)
+        nobody = pwd.getpwnam("nobody")
+        squatted = volume / TRASH_DIRNAME / str(nobody.pw_uid)
+        squatted.mkdir()
+        (squatted / "file.txt").touch()
+        purger.purge_all()
+        stats = squatted.stat()
+        assert (stats.st_uid, stats.st_mode & 0o777) == (nobody.pw_uid, 0o700)
+        assert list(squatted.iterdir()) == []
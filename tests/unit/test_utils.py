@@ -1,3 +1,7 @@
+import os
+import time
+
+import flask
 import pytest
 import werkzeug.exceptions
 
@@ -6,7 +10,12 @@ from src.utils import (
     normpath,
     http_response,
     abort_with,
+    encode_cursor,
+    file_etag,
+    paginate,
+    sendfile_response,
 )
+from src.utils.cache import LRUCache, TTLCache
 
 
 def test_convert_bytes():
@@ -62,3 +71,120 @@ def test_abort_with():
         "code": 403,
         "description": "Forbidden: custom message",
     }
+
+
+def test_sendfile_response():
+    app = flask.Flask(__name__)
+    app.config.update(SENDFILE_HEADER=None, SENDFILE_LOCATION="/internal/")
+    with app.test_request_context():
+        assert sendfile_response("/tmp/a b.txt", "a b.txt") is None
+
+        app.config["SENDFILE_HEADER"] = "X-Sendfile"
+        response = sendfile_response("/tmp/a b.txt", "a b.txt")
+        assert response.headers["X-Sendfile"] == "/tmp/a%20b.txt"
+        assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
+
+        app.config["SENDFILE_HEADER"] = "X-Accel-Redirect"
+        response = sendfile_response("/tmp/x.bin", "x.bin", as_attachment=False)
+        assert response.headers["X-Accel-Redirect"] == "/internal/tmp/x.bin"
+        assert response.headers["Content-Disposition"] == "inline; filename=x.bin"
+
+
+def test_sendfile_response_sends_checked_file(tmp_path):
+    app = flask.Flask(__name__)
+    app.config.update(SENDFILE_HEADER="X-Sendfile")
+    (tmp_path / "file.txt").touch()
+    (tmp_path / "other.txt").touch()
+    (tmp_path / "link.txt").symlink_to(tmp_path / "file.txt")
+    stats = (tmp_path / "file.txt").stat()
+    with app.test_request_context():
+        response = sendfile_response(tmp_path / "link.txt", "file.txt", stats=stats)
+        real = os.path.realpath(tmp_path / "file.txt")
+        assert response.headers["X-Sendfile"] == real
+        assert sendfile_response(tmp_path / "other.txt", "x", stats=stats) is None
+        assert sendfile_response(tmp_path / "xyz.txt", "x", stats=stats) is None
+
+
+def test_paginate():
+    items = [3, 1, 4, 1, 5, 9, 2, 6]
+    key = lambda i: (i,)  # noqa: E731
+    assert paginate(items) == (items, None)
+    assert paginate(items, key=key) == (sorted(items), None)
+    page, cursor = paginate(items, key=key, limit=3)
+    assert page == [1, 1, 2]
+    page, cursor = paginate(items, key=key, limit=3, cursor=cursor)
+    assert page == [3, 4, 5]
+    page, cursor = paginate(items, key=key, limit=3, cursor=cursor)
+    assert page == [6, 9]
+    assert cursor is None
+    page, cursor = paginate(items, key=key, limit=5, reverse=True)
+    assert page == [9, 6, 5, 4, 3]
+    assert paginate(items, key=key, cursor=cursor, reverse=True)[0] == [2, 1, 1]
+    with pytest.raises(ValueError):
+        paginate(items, key=key, cursor="xyz")
+    for last in (["1"], [1, "a"], [None], [[1]]):  # keys of another shape
+        with pytest.raises(ValueError):
+            paginate(items, key=key, limit=3, cursor=encode_cursor(last))
+
+
+def test_lru_cache():
+    evicted = []
+    cache = LRUCache(5, getsizeof=len, on_evict=lambda k, v: evicted.append(k))
+    cache["a"] = "xx"
+    cache["b"] = "xx"
+    assert cache.get("a") == "xx"  # b is now the least recently used
+    cache["c"] = "xx"
+    assert evicted == ["b"] and "b" not in cache
+    assert cache.currsize == 4 and len(cache) == 2
+    cache["d"] = "xxxxxx"  # too large to be cached at all
+    assert evicted == ["b", "d"] and cache.currsize == 4
+    assert cache.pop("a") == "xx" and cache.pop("a") is None
+    cache.clear()
+    assert cache.currsize == 0 and cache.get("c") is None
+
+
+def test_ttl_cache(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("src.utils.cache.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("src.utils.cache.threading.Thread.start", lambda t: t.run())
+    cache = TTLCache(maxsize=10, ttl=10, negative_ttl=1, stale_ttl=100)
+    calls = []
+
+    def loader(value):
+        def load():
+            calls.append(value)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        return load
+
+    assert cache.fetch("a", loader(1)) == 1
+    assert cache.fetch("a", loader(2)) == 1  # fresh
+    now[0] = 20
+    assert cache.fetch("a", loader(2)) == 1  # stale, reloaded in the background
+    assert cache.fetch("a", loader(3)) == 2
+    now[0] = 200
+    assert cache.fetch("a", loader(OSError())) == 2  # reload failed
+    assert cache.fetch("a", loader(4)) == 2  # not retried right away
+    assert len(calls) == 3
+
+    with pytest.raises(KeyError):
+        cache.fetch("b", loader(KeyError("b")))
+    with pytest.raises(KeyError):
+        cache.fetch("b", loader(5))  # cached negative
+    now[0] = 202
+    assert cache.fetch("b", loader(5)) == 5
+    with pytest.raises(OSError):
+        cache.fetch("c", loader(OSError()))
+
+
+def test_file_etag(tmp_path):
+    file = tmp_path / "file.txt"
+    file.write_text("content")
+    stats = file.stat()
+    assert file_etag(stats) == file_etag(file.stat())
+    time.sleep(0.05)  # past the granularity of file times
+    file.write_text("CONTENT")  # same size, modification time restored
+    os.utime(file, ns=(stats.st_atime_ns, stats.st_mtime_ns))
+    assert file_etag(stats) != file_etag(file.stat())